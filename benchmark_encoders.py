@@ -0,0 +1,90 @@
+# benchmark_encoders.py
+import argparse
+import time
+from typing import Dict, List
+
+import torch
+from torch.optim import Adam
+
+from compile_graph import load_compiled_graph
+from data_loading import DEFAULT_ENCODER, TherapeuticDataset
+from eval import task_accuracies
+from model import EnhancedTherapeuticGNN
+from train import train_model
+
+
+def encode_throughput(dataset: TherapeuticDataset, texts: List[str]) -> float:
+    """Texts per second through the encoder, model loading excluded and the cache bypassed."""
+    dataset.tokenizer, dataset.bert_model  # Load before timing
+    start = time.perf_counter()
+    dataset._encode_uncached(texts)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def benchmark_encoder(
+    csv_path: str,
+    model_name: str,
+    epochs: int = 300,
+    patience: int = 10,
+    val_every: int = 5,
+    seed: int = 0
+) -> Dict[str, float]:
+    """
+    Encode throughput of `model_name` and the test CF/IC/skill accuracy of a
+    GNN trained on its features (same split for every encoder).
+    """
+    dataset = TherapeuticDataset(csv_path, cache_dir=None, model_name=model_name)
+    texts = list(dataset.examples.texts(0, len(dataset.examples)))
+    throughput = encode_throughput(dataset, texts)
+    
+    data = load_compiled_graph(csv_path, model_name=model_name)
+    torch.manual_seed(seed)
+    # in_channels follows the encoder, the head sizes the graph's taxonomy
+    num_common_factors, num_intervention_concepts, num_skills = data.taxonomy.label_sizes
+    model = EnhancedTherapeuticGNN(
+        in_channels=data.x.size(1),
+        hidden_channels=64,
+        num_common_factors=num_common_factors,
+        num_intervention_concepts=num_intervention_concepts,
+        num_skills=num_skills,
+        num_layers=2,
+        dropout=0.5
+    )
+    optimizer = Adam(model.parameters(), lr=0.01, weight_decay=5e-4)
+    train_model(model, data, optimizer, epochs=epochs, val_every=val_every, patience=patience)
+    
+    return {
+        'hidden_size': dataset.hidden_size,
+        'texts_per_s': throughput,
+        **task_accuracies(model, data, data.test_idx)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode throughput vs. CF/IC/skill accuracy per text encoder")
+    parser.add_argument(
+        'encoders', nargs='*', default=[DEFAULT_ENCODER],
+        help="Hugging Face model names or local directories, e.g. distilbert-base-uncased"
+    )
+    parser.add_argument('--csv', default='data/htc_examples_ids.csv')
+    parser.add_argument('--epochs', type=int, default=300)
+    parser.add_argument('--patience', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    results = {}
+    for model_name in args.encoders:
+        print(f"\n=== {model_name} ===")
+        results[model_name] = benchmark_encoder(
+            args.csv, model_name, epochs=args.epochs, patience=args.patience, seed=args.seed
+        )
+    
+    print(f"\n{'encoder':<40} {'dim':>5} {'texts/s':>9} {'CF acc':>7} {'IC acc':>7} {'skill acc':>9}")
+    for model_name, r in results.items():
+        print(
+            f"{model_name:<40} {r['hidden_size']:>5} {r['texts_per_s']:>9.1f} "
+            f"{r['factor']:>7.4f} {r['ic']:>7.4f} {r['skill']:>9.4f}"
+        )
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,22 @@
 #!/usr/bin/env python3
 import csv
 import sys
+from typing import Optional
 
-def convert_abbreviations_to_ids(input_csv: str, output_csv: str) -> None:
+from taxonomy import Taxonomy, load_taxonomy
+
+def convert_abbreviations_to_ids(input_csv: str, output_csv: str, taxonomy: Optional[Taxonomy] = None) -> None:
     """
     Reads a CSV with columns: text, CF, IC, skill
     Outputs a CSV with columns: text, CF_id, IC_id, skill_id
+    The abbreviations and ids come from `taxonomy` (default: the built-in one).
     """
 
-    # 1. Define your mappings
-    cf_map = {
-        "B": 1,   # Bond
-        "GA": 2,  # Goal alignment
-        "TA": 3   # Task agreement
-    }
-
-    ic_map = {
-        "EAR": 4,
-        "CP": 5
-    }
-
-    skill_map = {
-        "RL": 6,  # Reflective Listening
-        "G": 7,   # Genuineness
-        "V": 8,   # Validation
-        "A": 9,   # Affirmation
-        "RA": 10,  # Respect for Autonomy
-        "AP": 11,  # Asking for Permission
-        "OQ": 12  # Open-ended Question
-    }
+    # 1. Build the mappings, e.g. "B" -> 1 (Bond), "EAR" -> 4, "RL" -> 6 (Reflective Listening)
+    taxonomy = taxonomy or load_taxonomy()
+    cf_map = taxonomy.abbreviation_ids('factor')
+    ic_map = taxonomy.abbreviation_ids('ic')
+    skill_map = taxonomy.abbreviation_ids('skill')
 
     # 2. Open the input CSV for reading and the output CSV for writing
     with open(input_csv, mode='r', encoding='utf-8-sig') as infile, \
@@ -42,7 +30,7 @@ def convert_abbreviations_to_ids(input_csv: str, output_csv: str) -> None:
         writer.writeheader()
         
         for row in reader:
-            example_id = reader.line_num - 1 + 12 # start from 12 ie after the last skill id
+            example_id = reader.line_num - 2 + taxonomy.num_fixed_nodes # start after the last skill id
             text = row.get("text", "")
             cf_abbrev = row.get("CF", "")
             ic_abbrev = row.get("IC", "")
@@ -67,13 +55,14 @@ def convert_abbreviations_to_ids(input_csv: str, output_csv: str) -> None:
             })
 
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: python convert_abbrev_to_ids.py <input_csv> <output_csv>")
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python convert_abbrev_to_ids.py <input_csv> <output_csv> [<taxonomy>]")
         sys.exit(1)
     
     input_csv = sys.argv[1]
     output_csv = sys.argv[2]
-    convert_abbreviations_to_ids(input_csv, output_csv)
+    taxonomy = load_taxonomy(sys.argv[3]) if len(sys.argv) > 3 else None
+    convert_abbreviations_to_ids(input_csv, output_csv, taxonomy)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
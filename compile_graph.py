@@ -0,0 +1,400 @@
+# compile_graph.py
+import hashlib
+import json
+import os
+import sys
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+import numpy as np
+import torch
+
+from taxonomy import Taxonomy
+
+if TYPE_CHECKING:
+    from torch_geometric.data import Data
+    from example_index import IVFExampleIndex
+
+# Bump whenever the on-disk layout or the meaning of a stored array changes
+# (2: the split is stored as index arrays instead of masks,
+#  3: y holds per-task class indices instead of multi-hot rows, the taxonomy is in meta)
+ARTIFACT_VERSION = 3
+MAGIC = b'HTCGRAPH'
+ALIGNMENT = 64
+
+# Arrays stored in the artifact, in file order; the masks are rebuilt from the split indices on load
+ARRAY_FIELDS = ('x', 'edge_index', 'y', 'train_idx', 'val_idx', 'test_idx', 'node_ids')
+SPLIT_NAMES = ('train', 'val', 'test')
+
+
+def default_artifact_path(csv_path: str, model_name: Optional[str] = None) -> str:
+    """
+    data/htc_examples_ids.csv -> data/htc_examples_ids.graph, or
+    data/htc_examples_ids.<encoder>.graph for an encoder other than the default.
+    """
+    from data_loading import DEFAULT_ENCODER
+
+    base = os.path.splitext(csv_path)[0]
+    if model_name is not None and model_name != DEFAULT_ENCODER:
+        slug = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in model_name.strip('/'))
+        base += '.' + slug
+    return base + '.graph'
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20, limit: Optional[int] = None) -> str:
+    """SHA-256 of a file (or of its first `limit` bytes), read in chunks."""
+    digest = hashlib.sha256()
+    remaining = limit
+    with open(path, mode='rb') as infile:
+        while remaining is None or remaining > 0:
+            chunk = infile.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def _source_info(csv_path: str) -> Dict[str, Any]:
+    stat = os.stat(csv_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def save_artifact(data: 'Data', path: str, csv_path: str, meta: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Write `data` to a single binary artifact:
+      MAGIC | uint32 version | uint64 header length | JSON header | aligned raw arrays
+
+    The header records dtype/shape/offset of every array, the SHA-256 of the
+    source CSV and any extra `meta`. The file is written to a temp path and
+    renamed, so readers never see a half-written artifact.
+    """
+    arrays = {name: getattr(data, name).detach().cpu().contiguous().numpy() for name in ARRAY_FIELDS}
+
+    header = {
+        'version': ARTIFACT_VERSION,
+        'csv_sha256': hash_file(csv_path),
+        'source': _source_info(csv_path),
+        'meta': meta or {},
+        'arrays': {}
+    }
+
+    # Offsets are relative to the start of the data section, which is itself aligned
+    offset = 0
+    for name, array in arrays.items():
+        header['arrays'][name] = {
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+            'offset': offset
+        }
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    prefix_len = len(MAGIC) + 4 + 8 + len(header_bytes)
+    data_start = -(-prefix_len // ALIGNMENT) * ALIGNMENT
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode='wb') as outfile:
+        outfile.write(MAGIC)
+        outfile.write(np.uint32(ARTIFACT_VERSION).tobytes())
+        outfile.write(np.uint64(len(header_bytes)).tobytes())
+        outfile.write(header_bytes)
+        for name, array in arrays.items():
+            outfile.seek(data_start + header['arrays'][name]['offset'])
+            outfile.write(array.tobytes())
+        outfile.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+def read_header(path: str) -> Tuple[Dict[str, Any], int]:
+    """Return (header, data_start) of an artifact, raising ValueError if it is not one we can read."""
+    with open(path, mode='rb') as infile:
+        if infile.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a compiled graph artifact")
+        version = int(np.frombuffer(infile.read(4), dtype=np.uint32)[0])
+        if version != ARTIFACT_VERSION:
+            raise ValueError(f"{path} has artifact version {version}, expected {ARTIFACT_VERSION}")
+        header_len = int(np.frombuffer(infile.read(8), dtype=np.uint64)[0])
+        header = json.loads(infile.read(header_len).decode('utf-8'))
+    prefix_len = len(MAGIC) + 4 + 8 + header_len
+    return header, -(-prefix_len // ALIGNMENT) * ALIGNMENT
+
+
+def _map_array(path: str, spec: Dict[str, Any], data_start: int) -> torch.Tensor:
+    shape = tuple(spec['shape'])
+    if int(np.prod(shape)) == 0:
+        return torch.from_numpy(np.empty(shape, dtype=np.dtype(spec['dtype'])))
+    return torch.from_numpy(np.memmap(
+        path,
+        dtype=np.dtype(spec['dtype']),
+        mode='c',
+        offset=data_start + spec['offset'],
+        shape=shape
+    ))
+
+
+def load_artifact(path: str) -> Tuple['Data', Dict[str, Any]]:
+    """
+    Memory-map an artifact and wrap its arrays as tensors without copying.
+    Arrays are mapped copy-on-write, so in-place edits never touch the file.
+    The label taxonomy stored with it is attached as data.taxonomy.
+    """
+    # torch_geometric is imported here, not at module level: it is slow to
+    # import (and pulls in transformers), and attach_features does not need it
+    from torch_geometric.data import Data
+
+    from data_loading import index_to_mask
+    
+    header, data_start = read_header(path)
+    tensors = {
+        name: _map_array(path, spec, data_start)
+        for name, spec in header['arrays'].items()
+    }
+    num_nodes = tensors['x'].size(0)
+    for name in SPLIT_NAMES:
+        tensors[f'{name}_mask'] = index_to_mask(tensors[f'{name}_idx'], num_nodes)
+    return Data(**tensors, taxonomy=Taxonomy.from_dict(header['meta']['taxonomy'])), header
+
+
+def attach_features(path: str) -> torch.Tensor:
+    """
+    Attach to the precomputed (num_nodes, hidden_size) feature matrix of an artifact.
+
+    The matrix is memory-mapped, so every process attaching to the same file
+    (training workers, evaluation, the inference server) shares one copy in
+    the page cache. Needs neither `transformers` nor the source CSV.
+    """
+    header, data_start = read_header(path)
+    return _map_array(path, header['arrays']['x'], data_start)
+
+
+def get_split(data: 'Data') -> Dict[str, torch.Tensor]:
+    """Node indices of the train/val/test split, compact enough to store in a checkpoint."""
+    return {name: getattr(data, f'{name}_idx').clone() for name in SPLIT_NAMES}
+
+
+def same_split(split: Dict[str, torch.Tensor], other: Dict[str, torch.Tensor]) -> bool:
+    """Whether two get_split results hold the same node indices."""
+    return all(torch.equal(split[name], other[name]) for name in SPLIT_NAMES)
+
+
+def apply_split(data: 'Data', split: Dict[str, torch.Tensor]) -> None:
+    """Replace the split indices and masks of `data` by the split saved with get_split."""
+    from data_loading import index_to_mask
+    
+    for name, indices in split.items():
+        setattr(data, f'{name}_idx', indices)
+        setattr(data, f'{name}_mask', index_to_mask(indices, data.num_nodes))
+
+
+def is_fresh(header: Dict[str, Any], csv_path: str) -> bool:
+    """True if the artifact was compiled from the current contents of `csv_path`."""
+    if not os.path.exists(csv_path):
+        return False
+    # Cheap check first; only hash the CSV when size or mtime changed
+    if header.get('source') == _source_info(csv_path):
+        return True
+    return header.get('csv_sha256') == hash_file(csv_path)
+
+
+def is_append_only(header: Dict[str, Any], csv_path: str) -> bool:
+    """
+    True if `csv_path` is the CSV the artifact was compiled from with rows
+    appended: it is longer, its leading bytes hash to the recorded SHA-256
+    and those bytes ended on a complete line.
+    """
+    old_size = header.get('source', {}).get('size')
+    if old_size is None or not os.path.exists(csv_path) or os.path.getsize(csv_path) <= old_size:
+        return False
+    with open(csv_path, mode='rb') as infile:
+        infile.seek(old_size - 1)
+        if infile.read(1) != b'\n':
+            return False
+    return hash_file(csv_path, limit=old_size) == header.get('csv_sha256')
+
+
+def _save_compiled(data: 'Data', dataset, artifact_path: str, csv_path: str, split_seed: int) -> None:
+    from data_loading import DEFAULT_SPLIT_FRACTIONS
+
+    save_artifact(data, artifact_path, csv_path, meta={
+        'model_name': dataset.model_name,
+        'max_length': dataset.max_length,
+        'num_examples': len(dataset.examples),
+        'split_seed': split_seed,
+        'split_fractions': list(DEFAULT_SPLIT_FRACTIONS),
+        'taxonomy': dataset.taxonomy.to_dict()
+    })
+
+
+def default_index_path(artifact_path: str) -> str:
+    """data/htc_examples_ids.graph -> data/htc_examples_ids.graph.ivf.npz"""
+    return artifact_path + '.ivf.npz'
+
+
+def build_example_index(data: 'Data', artifact_path: str, num_examples: int) -> 'IVFExampleIndex':
+    """Build the IVF index over the example nodes of a freshly written artifact and save it next to it."""
+    from example_index import IVFExampleIndex
+
+    index = IVFExampleIndex.build(data.x, torch.arange(data.num_nodes - num_examples, data.num_nodes))
+    header, _ = read_header(artifact_path)
+    index.save(default_index_path(artifact_path), meta={'csv_sha256': header['csv_sha256']})
+    return index
+
+
+def load_example_index(
+    csv_path: str,
+    artifact_path: Optional[str] = None,
+    model_name: Optional[str] = None,
+    taxonomy: Optional[Taxonomy] = None
+) -> Tuple['IVFExampleIndex', 'Data']:
+    """
+    Return (index, graph): the ANN index over the example embeddings of the
+    compiled graph for `csv_path`, attached to the graph's memory-mapped features.
+    The graph is brought up to date first; the index is rebuilt if it is missing
+    or belongs to an older artifact.
+    """
+    from example_index import IVFExampleIndex
+
+    artifact_path = artifact_path or default_artifact_path(csv_path, model_name)
+    data = load_compiled_graph(csv_path, artifact_path, model_name=model_name, taxonomy=taxonomy)
+    header, _ = read_header(artifact_path)
+    index_path = default_index_path(artifact_path)
+    if os.path.exists(index_path):
+        index, meta = IVFExampleIndex.load(index_path, data.x)
+        if meta.get('csv_sha256') == header['csv_sha256']:
+            return index, data
+    return build_example_index(data, artifact_path, header['meta']['num_examples']), data
+
+
+def append_to_artifact(data: 'Data', header: Dict[str, Any], csv_path: str, artifact_path: str) -> Tuple['Data', torch.Tensor]:
+    """
+    Extend an artifact by the rows appended to its CSV (see is_append_only):
+    only those rows are encoded and merged in (TherapeuticDataset.append_examples).
+    Returns the updated graph and the node indices of the new examples.
+    """
+    from data_loading import TherapeuticDataset
+    from example_data import read_example_columns
+
+    meta = header['meta']
+    dataset = TherapeuticDataset(
+        None,
+        model_name=meta['model_name'],
+        max_length=meta['max_length'],
+        taxonomy=data.taxonomy
+    )
+    num_old = meta['num_examples']
+    examples = read_example_columns(csv_path)
+    dataset.examples = examples.slice(0, num_old)
+    new_examples = examples.slice(num_old)
+
+    num_old_nodes = data.num_nodes
+    data = dataset.append_examples(data, new_examples, split_seed=meta['split_seed'])
+    _save_compiled(data, dataset, artifact_path, csv_path, meta['split_seed'])
+    new_nodes = torch.arange(num_old_nodes, data.num_nodes)
+
+    # Add the new examples to the existing ANN index rather than re-clustering
+    from example_index import IVFExampleIndex
+    index_path = default_index_path(artifact_path)
+    index_meta = {}
+    if os.path.exists(index_path):
+        index, index_meta = IVFExampleIndex.load(index_path, data.x)
+    if index_meta.get('csv_sha256') == header['csv_sha256']:
+        index.add(data.x, new_nodes).save(index_path, meta={'csv_sha256': read_header(artifact_path)[0]['csv_sha256']})
+    else:
+        build_example_index(data, artifact_path, len(dataset.examples))
+    return data, new_nodes
+
+
+def compile_graph(
+    csv_path: str,
+    artifact_path: Optional[str] = None,
+    split_seed: Optional[int] = None,
+    model_name: Optional[str] = None,
+    taxonomy: Optional[Taxonomy] = None
+) -> 'Data':
+    """Build the full PyG Data object from `csv_path` (labels per `taxonomy`, default the built-in one) and write it as an artifact."""
+    from data_loading import DEFAULT_ENCODER, DEFAULT_SPLIT_SEED, TherapeuticDataset
+
+    artifact_path = artifact_path or default_artifact_path(csv_path, model_name)
+    split_seed = DEFAULT_SPLIT_SEED if split_seed is None else split_seed
+    dataset = TherapeuticDataset(csv_path, model_name=model_name or DEFAULT_ENCODER, taxonomy=taxonomy)
+    data = dataset.create_pyg_data(split_seed=split_seed)
+    _save_compiled(data, dataset, artifact_path, csv_path, split_seed)
+    build_example_index(data, artifact_path, len(dataset.examples))
+    return data
+
+
+def update_compiled_graph(
+    csv_path: str,
+    artifact_path: Optional[str] = None,
+    split_seed: Optional[int] = None,
+    model_name: Optional[str] = None,
+    taxonomy: Optional[Taxonomy] = None
+) -> Tuple['Data', Optional[torch.Tensor]]:
+    """
+    Return (graph, new_nodes) for `csv_path`, doing as little work as possible:
+    
+    - artifact up to date: load it, new_nodes is empty
+    - rows were only appended to the CSV: encode and merge just those rows
+      (append_to_artifact), new_nodes are their node indices
+    - otherwise (missing, unreadable, edited CSV, other split seed, encoder
+      or taxonomy): compile from scratch, new_nodes is None
+    """
+    artifact_path = artifact_path or default_artifact_path(csv_path, model_name)
+    if os.path.exists(artifact_path):
+        try:
+            data, header = load_artifact(artifact_path)
+            meta = header['meta']
+            if split_seed is not None and meta.get('split_seed') != split_seed:
+                print(f"{artifact_path} was split with seed {meta.get('split_seed')}, re-splitting with {split_seed}")
+            elif model_name is not None and meta.get('model_name') != model_name:
+                print(f"{artifact_path} was encoded with {meta.get('model_name')}, re-encoding with {model_name}")
+            elif taxonomy is not None and data.taxonomy != taxonomy:
+                print(f"{artifact_path} was labeled with {data.taxonomy}, relabeling with {taxonomy}")
+            elif is_fresh(header, csv_path):
+                return data, torch.empty(0, dtype=torch.long)
+            elif is_append_only(header, csv_path):
+                data, new_nodes = append_to_artifact(data, header, csv_path, artifact_path)
+                print(f"Appended {len(new_nodes)} new examples from {csv_path} to {artifact_path}")
+                return data, new_nodes
+            else:
+                print(f"{artifact_path} is stale, recompiling from {csv_path}")
+        except ValueError as e:
+            print(f"Warning: {e}, recompiling from {csv_path}")
+    return compile_graph(csv_path, artifact_path, split_seed, model_name, taxonomy), None
+
+
+def load_compiled_graph(
+    csv_path: str,
+    artifact_path: Optional[str] = None,
+    split_seed: Optional[int] = None,
+    model_name: Optional[str] = None,
+    taxonomy: Optional[Taxonomy] = None
+) -> 'Data':
+    """
+    Return the compiled graph for `csv_path`, (re)compiling it only when the
+    artifact is missing, unreadable, was built from a different CSV or (if
+    `split_seed`/`model_name`/`taxonomy` are given) holds a split made with a
+    different seed, features from a different encoder or other label spaces. Rows appended to the CSV are
+    merged in incrementally (see update_compiled_graph).
+    The split is part of the artifact, so every run on it sees the same one.
+    """
+    return update_compiled_graph(csv_path, artifact_path, split_seed, model_name, taxonomy)[0]
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python compile_graph.py <csv_path> [<artifact_path>] [<encoder>] [<taxonomy>]")
+        sys.exit(1)
+
+    csv_path = sys.argv[1]
+    model_name = sys.argv[3] if len(sys.argv) > 3 else None
+    artifact_path = sys.argv[2] if len(sys.argv) > 2 else default_artifact_path(csv_path, model_name)
+    taxonomy = Taxonomy.load(sys.argv[4]) if len(sys.argv) > 4 else None
+
+    data = compile_graph(csv_path, artifact_path, model_name=model_name, taxonomy=taxonomy)
+    print(f"Compiled {csv_path} -> {artifact_path}")
+    print(data)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+# crossval.py
+import argparse
+import contextlib
+import copy
+import csv
+import io
+import math
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+from torch.optim import Adam
+
+from data_loading import DEFAULT_ENCODER, stratified_split
+from sweep import DEFAULT_CONFIG
+from taxonomy import TASKS
+
+METRICS = [f'{task}_accuracy' for task in TASKS] + [f'{task}_macro_f1' for task in TASKS]
+
+
+def fold_masks(data, k: int = 5, repeats: int = 1, seed: int = 0) -> torch.Tensor:
+    """
+    Train/val/test masks of every fold of (repeated) stratified k-fold CV, as
+    one (repeats * k, 3, num_nodes) bool tensor (dim 1: train, val, test).
+
+    - The example nodes (those in the compiled split) are divided into k
+      folds, stratified by their (CF, IC, skill) classes with stratified_split;
+      repeat r uses seed + r.
+    - Fold i tests on part i, validates on part (i + 1) % k and trains on the
+      rest, so k=5 gives the usual 60/20/20 proportions.
+    """
+    if k < 3:
+        raise ValueError(f"Need k >= 3 (one part each for test and validation), got {k}")
+    examples = torch.cat([data.train_idx, data.val_idx, data.test_idx]).sort().values
+    # data.y already holds the CF / IC / skill class of every node, -1 where missing
+    strata = data.y[examples].numpy()
+
+    fold_of = torch.empty(repeats, len(examples), dtype=torch.long)
+    for r in range(repeats):
+        for part, rows in enumerate(stratified_split(strata, (1.0,) * k, seed + r)):
+            fold_of[r, torch.from_numpy(rows)] = part
+
+    folds = torch.arange(k).view(1, k, 1)
+    test = fold_of.unsqueeze(1) == folds
+    val = fold_of.unsqueeze(1) == (folds + 1) % k
+    train = ~(test | val)
+
+    masks = torch.zeros(repeats * k, 3, data.num_nodes, dtype=torch.bool)
+    masks[:, :, examples] = torch.stack([train, val, test], dim=2).view(repeats * k, 3, len(examples))
+    return masks
+
+
+# ----------------------------------------------------------------------
+# Workers
+# ----------------------------------------------------------------------
+_worker_data = None
+_worker_masks = None
+
+
+def _init_worker(artifact_path: str, masks: torch.Tensor, num_threads: int) -> None:
+    """Memory-map the compiled graph (shared page cache, no re-encoding) and keep the fold masks."""
+    global _worker_data, _worker_masks
+    from compile_graph import load_artifact
+
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+    _worker_data, _ = load_artifact(artifact_path)
+    _worker_masks = masks
+
+
+def run_fold(
+    fold: int,
+    config: Dict[str, Any],
+    epochs: int = 300,
+    seed: int = 0,
+    val_every: int = 5,
+    patience: Optional[int] = 10,
+    data=None,
+    masks: Optional[torch.Tensor] = None
+) -> Dict[str, Any]:
+    """Train on fold `fold` of `masks` (see fold_masks) and return its evaluate_model accuracies and macro F1."""
+    from compile_graph import apply_split
+    from eval import evaluate_model
+    from model import EnhancedTherapeuticGNN
+    from train import train_model
+
+    data = copy.copy(_worker_data if data is None else data)
+    masks = _worker_masks if masks is None else masks
+    apply_split(data, {
+        name: masks[fold, i].nonzero().flatten() for i, name in enumerate(('train', 'val', 'test'))
+    })
+    torch.manual_seed(seed + fold)
+    random.seed(seed + fold)
+    np.random.seed(seed + fold)
+
+    num_common_factors, num_intervention_concepts, num_skills = data.taxonomy.label_sizes
+    model = EnhancedTherapeuticGNN(
+        in_channels=data.x.size(1),
+        hidden_channels=config['hidden_channels'],
+        num_common_factors=num_common_factors,
+        num_intervention_concepts=num_intervention_concepts,
+        num_skills=num_skills,
+        num_layers=config['num_layers'],
+        dropout=config['dropout']
+    )
+    optimizer = Adam(model.parameters(), lr=config['lr'], weight_decay=config['weight_decay'])
+    with contextlib.redirect_stdout(io.StringIO()):
+        train_model(model, data, optimizer, epochs=epochs, val_every=val_every, patience=patience)
+        metrics = evaluate_model(model, data)
+
+    row = {
+        'fold': fold,
+        'num_train': len(data.train_idx),
+        'num_test': len(data.test_idx)
+    }
+    for task in TASKS:
+        row[f'{task}_accuracy'] = metrics[f'{task}_accuracy']
+        report = metrics[f'{task}_classification_report']
+        row[f'{task}_macro_f1'] = report.get('macro avg', {}).get('f1-score', float('nan'))
+    return row
+
+
+def _run_fold_in_worker(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    return run_fold(**kwargs)
+
+
+# ----------------------------------------------------------------------
+# Aggregation
+# ----------------------------------------------------------------------
+def confidence_interval(scores: np.ndarray, test_train_ratio: float, level: float = 0.95) -> Dict[str, float]:
+    """
+    Mean and `level` confidence interval of per-fold scores.
+
+    Folds share training data, so their scores are correlated and the naive
+    standard error is too small; the variance is corrected by
+    (1 / J + n_test / n_train) (Nadeau & Bengio), with a t quantile on J - 1
+    degrees of freedom.
+    """
+    from scipy.stats import t
+
+    scores = scores[~np.isnan(scores)]
+    mean = float(scores.mean()) if len(scores) else float('nan')
+    if len(scores) < 2:
+        return {'mean': mean, 'std': float('nan'), 'ci_low': float('nan'), 'ci_high': float('nan')}
+    std = float(scores.std(ddof=1))
+    half_width = t.ppf(0.5 + level / 2, len(scores) - 1) * math.sqrt(
+        (1.0 / len(scores) + test_train_ratio) * std ** 2
+    )
+    return {'mean': mean, 'std': std, 'ci_low': mean - half_width, 'ci_high': mean + half_width}
+
+
+def summarize(rows: List[Dict[str, Any]], level: float = 0.95) -> Dict[str, Dict[str, float]]:
+    """Per-metric mean, std and confidence interval over all folds."""
+    test_train_ratio = np.mean([row['num_test'] / row['num_train'] for row in rows])
+    return {
+        metric: confidence_interval(np.array([row[metric] for row in rows], dtype=np.float64), test_train_ratio, level)
+        for metric in METRICS
+    }
+
+
+def cross_validate(
+    artifact_path: str,
+    config: Dict[str, Any],
+    k: int = 5,
+    repeats: int = 1,
+    epochs: int = 300,
+    seed: int = 0,
+    val_every: int = 5,
+    patience: Optional[int] = 10,
+    num_workers: Optional[int] = None,
+    threads_per_worker: int = 1
+) -> List[Dict[str, Any]]:
+    """
+    Repeated stratified k-fold CV of `config` on the compiled graph at `artifact_path`.
+
+    The features come from the artifact, so nothing is re-encoded per fold;
+    all fold masks are built up front (fold_masks) and the folds train in a
+    spawn process pool with `threads_per_worker` threads each (num_workers=0
+    runs them in this process). Returns one metrics row per fold.
+    """
+    from compile_graph import load_artifact
+
+    data, _ = load_artifact(artifact_path)
+    masks = fold_masks(data, k, repeats, seed)
+    jobs = [
+        {'fold': fold, 'config': config, 'epochs': epochs, 'seed': seed, 'val_every': val_every, 'patience': patience}
+        for fold in range(len(masks))
+    ]
+    num_workers = (os.cpu_count() or 1) // threads_per_worker if num_workers is None else num_workers
+    if num_workers <= 0:
+        return [run_fold(**job, data=data, masks=masks) for job in jobs]
+
+    with ProcessPoolExecutor(
+        max_workers=min(num_workers, len(jobs)),
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(artifact_path, masks, threads_per_worker)
+    ) as pool:
+        return list(pool.map(_run_fold_in_worker, jobs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Repeated stratified k-fold cross-validation of EnhancedTherapeuticGNN")
+    parser.add_argument('--csv', default='data/htc_examples_ids.csv')
+    parser.add_argument('--encoder', default=DEFAULT_ENCODER, help="Text encoder: Hugging Face model name or local directory")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--repeats', type=int, default=1, help="Repeat the k-fold split with seeds seed, seed + 1, ...")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the fold assignment and model initialization")
+    parser.add_argument('--hidden-channels', type=int, default=DEFAULT_CONFIG['hidden_channels'])
+    parser.add_argument('--num-layers', type=int, default=DEFAULT_CONFIG['num_layers'])
+    parser.add_argument('--dropout', type=float, default=DEFAULT_CONFIG['dropout'])
+    parser.add_argument('--lr', type=float, default=DEFAULT_CONFIG['lr'])
+    parser.add_argument('--weight-decay', type=float, default=DEFAULT_CONFIG['weight_decay'])
+    parser.add_argument('--epochs', type=int, default=300)
+    parser.add_argument('--val-every', type=int, default=5)
+    parser.add_argument('--patience', type=int, default=10, help="Early stopping in validation rounds")
+    parser.add_argument('--num-workers', type=int, default=None, help="Worker processes (default: cores / threads per worker, 0: in-process)")
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--output', default=None, help="Write the per-fold metrics to this CSV")
+    args = parser.parse_args()
+
+    from compile_graph import default_artifact_path, update_compiled_graph
+
+    # Encode once; every fold reuses the compiled features
+    update_compiled_graph(args.csv, model_name=args.encoder)
+    config = {
+        'hidden_channels': args.hidden_channels,
+        'num_layers': args.num_layers,
+        'dropout': args.dropout,
+        'lr': args.lr,
+        'weight_decay': args.weight_decay
+    }
+    rows = cross_validate(
+        default_artifact_path(args.csv, args.encoder),
+        config,
+        k=args.folds,
+        repeats=args.repeats,
+        epochs=args.epochs,
+        seed=args.seed,
+        val_every=args.val_every,
+        patience=args.patience,
+        num_workers=args.num_workers,
+        threads_per_worker=args.threads_per_worker
+    )
+
+    if args.output is not None:
+        with open(args.output, mode='w', encoding='utf-8', newline='') as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=['fold', 'num_train', 'num_test'] + METRICS)
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Per-fold metrics written to {args.output}")
+
+    print(f"\n{args.repeats} x {args.folds}-fold CV ({len(rows)} folds), {args.confidence:.0%} confidence intervals")
+    print(f"{'metric':<18} {'mean':>7} {'std':>7} {'ci low':>7} {'ci high':>7}")
+    for metric, s in summarize(rows, args.confidence).items():
+        print(f"{metric:<18} {s['mean']:>7.4f} {s['std']:>7.4f} {s['ci_low']:>7.4f} {s['ci_high']:>7.4f}")
+
+if __name__ == '__main__':
+    main()
@@ -1,181 +1,427 @@
 # data_loading.py
 
+import json
+import os
 import sys
 
 import torch
-from torch_geometric.data import Data
-from transformers import AutoTokenizer, AutoModel
-from example_data import get_node_data, get_edge_indices
-from typing import Tuple
+from example_data import ExampleColumns, build_edge_index, merge_edge_index, read_example_columns
+from embedding_cache import DEFAULT_CACHE_DIR, EmbeddingCache, encoder_fingerprint
+from taxonomy import Taxonomy, default_taxonomy
+from typing import TYPE_CHECKING, List, Optional, Tuple
 import numpy as np
 
+if TYPE_CHECKING:
+    from torch_geometric.data import Data
+
+DEFAULT_ENCODER = 'bert-base-uncased'
+
+# Encoder precision modes: float32, bfloat16 autocast, dynamically quantized int8 linears
+PRECISIONS = ('fp32', 'bf16', 'int8')
+
+DEFAULT_SPLIT_SEED = 42
+DEFAULT_SPLIT_FRACTIONS = (0.6, 0.2, 0.2)
+
+# Fractional part of the golden ratio: successive multiples of it are spread
+# as evenly as possible over [0, 1) (a low-discrepancy sequence)
+_GOLDEN_FRACTION = 0.6180339887498949
+
+
+def stratified_split(
+    strata: np.ndarray,
+    fractions: Tuple[float, ...] = DEFAULT_SPLIT_FRACTIONS,
+    seed: int = DEFAULT_SPLIT_SEED
+) -> List[np.ndarray]:
+    """
+    Deterministically split rows into len(fractions) parts, stratified by `strata`.
+    
+    - strata: (n, k) int array, one column per label family (e.g. CF/IC/skill class, -1 if missing).
+    - Rows are ordered by their strata (lexicographically, ties broken by a seeded
+      shuffle), and position p of that order goes to the part whose cumulative
+      fraction interval contains frac(offset + p * golden ratio). Every run of rows
+      sharing a stratum, however short, is therefore divided close to `fractions`.
+    - Returns one sorted int64 index array per part; the same seed gives the same split.
+    """
+    n = len(strata)
+    rng = np.random.default_rng(seed)
+    tiebreak = rng.permutation(n)
+    # np.lexsort sorts by its last key first
+    order = np.lexsort((tiebreak,) + tuple(strata[:, j] for j in reversed(range(strata.shape[1]))))
+    
+    bounds = np.cumsum(fractions, dtype=np.float64)
+    bounds /= bounds[-1]
+    positions = (rng.random() + np.arange(n) * _GOLDEN_FRACTION) % 1.0
+    part_of = np.minimum(np.searchsorted(bounds, positions, side='right'), len(fractions) - 1)
+    
+    return [np.sort(order[part_of == k]) for k in range(len(fractions))]
+
+
+def encoder_hidden_size(model_name: str) -> int:
+    """
+    Embedding width of a Hugging Face encoder (hub name or local directory),
+    read from its config.json so that `transformers` need not be imported.
+    """
+    config_path = os.path.join(model_name, 'config.json')
+    if not os.path.isfile(config_path):
+        from huggingface_hub import try_to_load_from_cache
+        config_path = try_to_load_from_cache(model_name, 'config.json')
+    if isinstance(config_path, str):
+        with open(config_path, mode='r', encoding='utf-8') as infile:
+            config = json.load(infile)
+    else:
+        # Not downloaded yet, let transformers fetch it
+        from transformers import AutoConfig
+        config = AutoConfig.from_pretrained(model_name).to_dict()
+    # BERT-style configs call it hidden_size, DistilBERT dim, T5/BART-style d_model
+    for key in ('hidden_size', 'dim', 'd_model'):
+        if key in config:
+            return int(config[key])
+    raise ValueError(f"Cannot tell the hidden size of {model_name} from its config")
+
+
+def index_to_mask(indices: torch.Tensor, num_nodes: int) -> torch.Tensor:
+    mask = torch.zeros(num_nodes, dtype=torch.bool)
+    mask[indices] = True
+    return mask
+
+
 class TherapeuticDataset:
-    def __init__(self, filepath: str):
+    def __init__(
+        self,
+        filepath: Optional[str],
+        batch_size: int = 32,
+        cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+        precision: str = 'fp32',
+        model_name: str = DEFAULT_ENCODER,
+        max_length: int = 128,
+        taxonomy: Optional[Taxonomy] = None
+    ):
         """
-        Initialize the dataset with a given CSV filepath.
-        - Loads all node data (root, factors, ICs, skills, examples) at once.
-        - Instantiates tokenizer and BERT model for text encoding.
+        Initialize the dataset with a given CSV filepath
+        (None gives a dataset without examples, enough to encode new texts).
+        - Loads all node data (root, factors, ICs, skills, examples) at once,
+          with the examples read in a single pass into columnar arrays.
+        - Tokenizer and BERT model are loaded lazily, only once a text misses
+          the embedding cache, so `transformers` is not even imported otherwise.
+        - batch_size controls how many texts share one BERT forward pass.
+        - cache_dir holds the on-disk embedding cache (None disables caching).
+        - model_name is any Hugging Face encoder, by hub name or local directory
+          (e.g. a 6-layer distilled model or a small sentence-embedding model);
+          hidden_size is read from its config. Texts are mean-pooled as for BERT.
+        - precision selects how BERT runs: 'fp32', 'bf16' (bfloat16 autocast) or
+          'int8' (dynamic int8 quantization of its Linear layers). Embeddings are
+          always returned as float32 and cached separately per precision.
+        - taxonomy defines the fixed nodes and label spaces (default: the
+          built-in one, see taxonomy.default_taxonomy).
         """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}")
         self.filepath = filepath
+        self.batch_size = batch_size
         
         # Load node data once and store it
+        self.taxonomy = taxonomy or default_taxonomy()
         (self.root,
          self.factors,
          self.intervention_concepts,
-         self.skills,
-         self.examples) = get_node_data(self.filepath)
+         self.skills) = self.taxonomy.fixed_nodes()
+        self.examples = (
+            read_example_columns(self.filepath) if self.filepath is not None else ExampleColumns.empty()
+        )
 
-        self.tokenizer = AutoTokenizer.from_pretrained('bert-base-uncased')
-        self.bert_model = AutoModel.from_pretrained('bert-base-uncased')
-        self.hidden_size = 768  # BERT base hidden size
+        self.model_name = model_name
+        self._tokenizer = None
+        self._bert_model = None
+        self.hidden_size = encoder_hidden_size(model_name)
+        self.max_length = max_length
+        self.precision = precision
+        
+        self.embedding_cache = None
+        if cache_dir is not None:
+            # Only settings we pass to the tokenizer ourselves, so the fingerprint
+            # can be computed without loading it
+            tokenizer_config = {
+                'name': self.model_name,
+                'truncation': True,
+                'padding': 'longest'
+            }
+            self.embedding_cache = EmbeddingCache(
+                cache_dir,
+                encoder_fingerprint(self.model_name, tokenizer_config, self.max_length, self.precision),
+                dim=self.hidden_size
+            )
+    
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        return self._tokenizer
+    
+    @property
+    def bert_model(self):
+        if self._bert_model is None:
+            from transformers import AutoModel
+            self._bert_model = AutoModel.from_pretrained(self.model_name)
+            self._bert_model.eval()
+            if self.precision == 'int8':
+                self._bert_model = torch.ao.quantization.quantize_dynamic(
+                    self._bert_model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+        return self._bert_model
     
     def _encode_text(self, text: str) -> torch.Tensor:
         """Encode text using BERT (average-pooled last hidden state)."""
-        inputs = self.tokenizer(
-            text,
-            return_tensors="pt",
-            padding=True,
+        return self._encode_texts([text])[0]
+    
+    def _encode_texts(self, texts: List[str]) -> torch.Tensor:
+        """
+        Encode a list of texts, going through the embedding cache when enabled.
+        Only cache misses (deduplicated) reach BERT; new embeddings are written back.
+        """
+        if self.embedding_cache is None:
+            return self._encode_uncached(texts)
+        
+        vectors, missing = self.embedding_cache.get_many(texts)
+        if missing:
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            encoded = self._encode_uncached(unique_texts)
+            self.embedding_cache.put_many(unique_texts, encoded.numpy())
+            row_of = {text: row for row, text in enumerate(unique_texts)}
+            vectors[missing] = encoded[[row_of[texts[i]] for i in missing]].numpy()
+        return torch.from_numpy(vectors)
+    
+    def _tokenize(self, texts: List[str]):
+        """
+        Tokenize texts without padding (so true lengths are known).
+        Safe to call from worker threads while another batch is being encoded.
+        """
+        return self.tokenizer(
+            list(texts),
             truncation=True,
-            max_length=128
+            max_length=self.max_length
         )
-        with torch.no_grad():
-            outputs = self.bert_model(**inputs)
-        # Average-pool across the sequence length (dim=1)
-        return outputs.last_hidden_state.mean(dim=1).squeeze()
     
-    def _create_node_features(self) -> torch.Tensor:
+    def _encode_uncached(self, texts: List[str]) -> torch.Tensor:
+        """
+        Encode a list of texts in batches (average-pooled last hidden state).
+        - Texts are sorted by token length so each batch pads as little as possible.
+        - Pooling is masked, so padding tokens do not change the per-text average.
+        - Returns a (len(texts), hidden_size) tensor in the original input order.
+        """
+        if not texts:
+            return torch.empty((0, self.hidden_size))
+        return self._encode_tokenized(self._tokenize(texts))
+    
+    def _encode_tokenized(self, encodings) -> torch.Tensor:
+        """Run BERT over the output of _tokenize (see _encode_uncached)."""
+        input_ids = encodings['input_ids']
+        order = sorted(range(len(input_ids)), key=lambda i: len(input_ids[i]))
+        
+        embeddings = torch.empty((len(input_ids), self.hidden_size))
+        autocast = torch.autocast('cpu', dtype=torch.bfloat16, enabled=self.precision == 'bf16')
+        with torch.inference_mode(), autocast:
+            for start in range(0, len(order), self.batch_size):
+                batch_idx = order[start:start + self.batch_size]
+                batch = self.tokenizer.pad(
+                    {key: [encodings[key][i] for i in batch_idx] for key in encodings.keys()},
+                    padding=True,
+                    return_tensors="pt"
+                )
+                outputs = self.bert_model(**batch)
+                
+                # Masked mean over the sequence length (dim=1), pooled in float32
+                hidden = outputs.last_hidden_state.float()
+                mask = batch['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+                summed = (hidden * mask).sum(dim=1)
+                embeddings[batch_idx] = summed / mask.sum(dim=1).clamp(min=1)
+        
+        return embeddings
+    
+    def _create_node_features(self, chunk_size: int = 4096) -> torch.Tensor:
         """Create node features from text descriptions."""
-        node_features = []
+        # 1. Process root, factors, ICs, skills, in id order (their ids are their node indices)
+        fixed_texts = [f"{node['name']}: {node['description']}" for node in self.taxonomy.nodes()]
+        num_examples = len(self.examples)
         
-        # 1. Process root, factors, ICs, skills
-        for node in self.root + self.factors + self.intervention_concepts + self.skills:
-            # print(f"### {node['name']}: {node['description']}")
-            text = f"{node['name']}: {node['description']}"
-            node_features.append(self._encode_text(text))
+        x = torch.empty((len(fixed_texts) + num_examples, self.hidden_size))
+        x[:len(fixed_texts)] = self._encode_texts(fixed_texts)
         
-        # 2. Process examples (which primarily have a 'text' field)
-        for example in self.examples:
-            node_features.append(self._encode_text(example['text']))
+        # 2. Process examples chunk by chunk, so only chunk_size texts are decoded at once
+        for start in range(0, num_examples, chunk_size):
+            stop = min(start + chunk_size, num_examples)
+            x[len(fixed_texts) + start:len(fixed_texts) + stop] = self._encode_texts(
+                list(self.examples.texts(start, stop))
+            )
             
-        return torch.stack(node_features)
+        return x
+    
+    @property
+    def example_start_idx(self) -> int:
+        """Examples are appended after root, factors, ICs, skills in _create_node_features."""
+        return (
+            len(self.root)
+            + len(self.factors)
+            + len(self.intervention_concepts)
+            + len(self.skills)
+        )
+    
+    @property
+    def label_sizes(self) -> Tuple[int, int, int]:
+        """Number of (common factors, intervention concepts, skills) label classes."""
+        return self.taxonomy.label_sizes
+    
+    def _create_label_indices(self, examples: Optional[ExampleColumns] = None) -> torch.Tensor:
+        """
+        Map every example's (CF_id, IC_id, skill_id) to class indices within
+        each label family, e.g. CF id 2 -> factor class 1, skill id 6 -> skill class 0.
+        Returns a (num_examples, 3) long tensor, -1 where a row is not annotated;
+        ids that are not part of their family raise ValueError.
+        
+        The vocabularies come from the taxonomy, so any number of
+        factors/ICs/skills is supported. `examples` defaults to the dataset's own.
+        """
+        examples = self.examples if examples is None else examples
+        return self.taxonomy.class_indices((examples.cf_ids, examples.ic_ids, examples.skill_ids))
     
     def _create_labels(self) -> torch.Tensor:
         """
-        Create a combined labels tensor for:
-        - 3 Common Factors (IDs 1..3)
-        - 2 Intervention Concepts (IDs 4..5)
-        - 7 Skills (IDs 6..12)
-        Total columns = 3 + 2 + 7 = 12
-
-        If an example row has factor_id=1, that sets column 0 to 1.
-        If factor_id=2 => col 1 = 1, factor_id=3 => col 2 = 1
-        If ic_id=4 => col 3=1, ic_id=5 => col 4=1
-        If skill_id=6 => col 5=1, 7 => col 6=1, ... 12 => col 11=1
+        Create the (num_nodes, 3) labels tensor: per node its common factor,
+        intervention concept and skill class index (see _create_label_indices),
+        -1 where missing. Rows of non-example nodes are all -1.
+        
+        Stored as the taxonomy's smallest integer type (int8 for the default),
+        instead of (num_nodes, num_labels) float multi-hot rows; use
+        Taxonomy.multi_hot where a dense view is needed.
         """
-        num_examples = len(self.examples)
-
-        # We hardcode that there are 3 CF, 2 IC, 7 skills => total 12 columns
-        num_factors = 3
-        num_intervention_concepts = 2
-        num_skills = 7
-        total_cols = num_factors + num_intervention_concepts + num_skills  # 12
-
-        labels = torch.zeros((num_examples, total_cols), dtype=torch.float)
-        # print(f"Examples\n{self.examples}")
-        for i, example in enumerate(self.examples):
-            # Factor ID in [1..3]
-            factor_id = int(example.get('CF_id', 0))
-            if 1 <= factor_id <= 3:
-                factor_idx = factor_id - 1        # CF 1->col0, 2->col1, 3->col2
-                labels[i, factor_idx] = 1.0
-
-            # IC ID in [4..5]
-            ic_id = int(example.get('IC_id', 0))
-            if 4 <= ic_id <= 5:
-                # e.g. ID=4 => index=0 => column=3; ID=5 => index=1 => column=4
-                ic_idx = (ic_id - 4) + num_factors
-                labels[i, ic_idx] = 1.0
-
-            # Skill ID in [6..12]
-            skill_id = int(example.get('skill_id', 0))
-            if 6 <= skill_id <= 12:
-                # e.g. ID=6 => index=0 => column=5; ID=12 => index=6 => column=11
-                skill_offset = num_factors + num_intervention_concepts  # 3 + 2 = 5
-                skill_idx = (skill_id - 6) + skill_offset
-                labels[i, skill_idx] = 1.0
-                   
-            # print(f"Example {i}: factor={factor_id}, ic={ic_id}, skill={skill_id}")
-
-        # print("Final label tensor shape:", labels.shape)
-        # print(labels)
+        labels = torch.full((self.example_start_idx + len(self.examples), 3), -1, dtype=self.taxonomy.label_dtype)
+        labels[self.example_start_idx:] = self._create_label_indices()
         return labels
     
     def encode_new_text(self, text: str) -> torch.Tensor:
         """Public method to encode arbitrary new text for inference."""
         return self._encode_text(text)
     
-    def create_pyg_data(self) -> Data:
+    def encode_new_texts(self, texts: List[str]) -> torch.Tensor:
+        """Public method to encode a batch of new texts for inference, shape (len(texts), hidden_size)."""
+        return self._encode_texts(texts)
+    
+    def create_splits(
+        self,
+        seed: int = DEFAULT_SPLIT_SEED,
+        fractions: Tuple[float, float, float] = DEFAULT_SPLIT_FRACTIONS
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Seeded train/val/test split of the examples, stratified by their
+        (CF, IC, skill) classes. Returns node indices (already offset past the fixed nodes).
+        """
+        strata = self._create_label_indices().numpy()
+        return tuple(
+            torch.from_numpy(part + self.example_start_idx)
+            for part in stratified_split(strata, fractions, seed)
+        )
+    
+    def create_pyg_data(
+        self,
+        split_seed: int = DEFAULT_SPLIT_SEED,
+        split_fractions: Tuple[float, float, float] = DEFAULT_SPLIT_FRACTIONS
+    ) -> 'Data':
         """
         Create a PyG (PyTorch Geometric) Data object:
          - x: node features
          - edge_index: graph edges
-         - y: multi-hot labels (factors, ICs, skills)
-         - train_mask, val_mask, test_mask: boolean masks for splitting
+         - y: (num_nodes, 3) factor / IC / skill class indices, -1 where missing
+         - taxonomy: the Taxonomy defining those label spaces
+         - train_idx, val_idx, test_idx: node indices of the stratified, seeded split
+         - train_mask, val_mask, test_mask: the same split as boolean masks
+         - node_ids: original node id of every row in x
         """
+        # Imported lazily so text encoding alone does not pay for torch_geometric
+        from torch_geometric.data import Data
+        
         # 1. Node features
         x = self._create_node_features()
         
-        # 2. Edge indices
-        # Pass the same filepath to get_edge_indices
-        edge_index = torch.tensor(get_edge_indices(self.filepath), dtype=torch.long).t()
+        # 2. Edge indices, derived from the already loaded example columns
+        #    (sorted, deduplicated COO with examples placed after the fixed nodes)
+        edge_index = torch.from_numpy(build_edge_index(
+            self.examples,
+            example_offset=self.example_start_idx,
+            num_nodes=x.size(0)
+        ))
         
-        # 3. Labels
+        # 3. Labels, already laid out over all nodes (non-examples are -1)
         labels = self._create_labels()
         
-        # 4. Create train/val/test masks for example nodes only
-        num_examples = len(self.examples)
-        indices = torch.randperm(num_examples)
+        # 4. Stratified, seeded train/val/test split of the example nodes
+        train_idx, val_idx, test_idx = self.create_splits(split_seed, split_fractions)
         
-        train_mask = torch.zeros(x.size(0), dtype=torch.bool)
-        val_mask = torch.zeros(x.size(0), dtype=torch.bool)
-        test_mask = torch.zeros(x.size(0), dtype=torch.bool)
+        # Node index -> original node id (fixed nodes first, then the CSV 'id' column)
+        node_ids = torch.cat([
+            torch.tensor([node['id'] for node in self.taxonomy.nodes()], dtype=torch.long),
+            torch.from_numpy(self.examples.ids.copy())
+        ])
         
-        # The examples are appended after root, factors, ICs, skills in _create_node_features
-        # so we find the offset index where examples start:
-        example_start_idx = (
-            len(self.root)
-            + len(self.factors)
-            + len(self.intervention_concepts)
-            + len(self.skills)
+        return Data(
+            x=x,
+            edge_index=edge_index,
+            y=labels,  # Factor, IC and skill class index per node
+            train_idx=train_idx,
+            val_idx=val_idx,
+            test_idx=test_idx,
+            train_mask=index_to_mask(train_idx, x.size(0)),
+            val_mask=index_to_mask(val_idx, x.size(0)),
+            test_mask=index_to_mask(test_idx, x.size(0)),
+            node_ids=node_ids,
+            taxonomy=self.taxonomy
         )
+    
+    def append_examples(
+        self,
+        data: 'Data',
+        new_examples: ExampleColumns,
+        split_seed: int = DEFAULT_SPLIT_SEED,
+        split_fractions: Tuple[float, float, float] = DEFAULT_SPLIT_FRACTIONS
+    ) -> 'Data':
+        """
+        Return `data` extended by `new_examples`, appended as nodes after the existing ones.
         
-        # Split examples into 60% train, 20% val, 20% test
-        train_end = int(0.6 * num_examples)
-        val_end = int(0.8 * num_examples)
+        - Only the new texts are encoded; x, y, node_ids and the split grow by their rows.
+        - Their edges are merged into the existing sorted edge_index (merge_edge_index),
+          so the result equals a full rebuild up to the split.
+        - Existing examples keep their split; the new ones get their own stratified,
+          seeded split, so nothing already used for training moves to val/test.
+        - The examples are also appended to this dataset. `data` itself is not modified
+          (its tensors may be memory-mapped from an artifact).
+        """
+        from torch_geometric.data import Data
+        
+        num_old = data.num_nodes
+        num_nodes = num_old + len(new_examples)
         
-        train_idx = indices[:train_end]
-        val_idx = indices[train_end:val_end]
-        test_idx = indices[val_end:]
+        x_new = self._encode_texts(list(new_examples.texts()))
+        class_idx = self._create_label_indices(new_examples)
         
-        train_mask[example_start_idx + train_idx] = True
-        val_mask[example_start_idx + val_idx] = True
-        test_mask[example_start_idx + test_idx] = True
+        new_edges = build_edge_index(new_examples, example_offset=num_old, num_nodes=num_nodes)
+        edge_index = merge_edge_index(data.edge_index.numpy(), new_edges, num_nodes)
         
-        # Create a full label matrix for all nodes (non-examples remain zero)
-        full_labels = torch.zeros((x.size(0), labels.size(1)))
-        full_labels[example_start_idx:example_start_idx + num_examples] = labels
+        split = {}
+        for name, part in zip(('train', 'val', 'test'), stratified_split(class_idx.numpy(), split_fractions, split_seed)):
+            split[name] = torch.cat([getattr(data, f'{name}_idx'), torch.from_numpy(part + num_old)])
         
+        self.examples = self.examples.concat(new_examples)
         return Data(
-            x=x,
-            edge_index=edge_index,
-            y=full_labels,  # Combined factor+IC+skill labels
-            train_mask=train_mask,
-            val_mask=val_mask,
-            test_mask=test_mask
+            x=torch.cat([data.x, x_new]),
+            edge_index=torch.from_numpy(edge_index),
+            y=torch.cat([data.y, class_idx.to(data.y.dtype)]),
+            **{f'{name}_idx': indices for name, indices in split.items()},
+            **{f'{name}_mask': index_to_mask(indices, num_nodes) for name, indices in split.items()},
+            node_ids=torch.cat([data.node_ids, torch.from_numpy(new_examples.ids.copy())]),
+            taxonomy=self.taxonomy
         )
 
 
-def load_data(filepath: str) -> Tuple[Data, TherapeuticDataset]:
+def load_data(filepath: str) -> Tuple['Data', TherapeuticDataset]:
     """
     Helper function: 
       1) Instantiates the dataset with the given filepath
@@ -0,0 +1,434 @@
+# embedding_cache.py
+import atexit
+import contextlib
+import csv
+import hashlib
+import json
+import os
+import sys
+import weakref
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, single-process use only
+    fcntl = None
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = '.embedding_cache'
+
+
+def encoder_fingerprint(model_name: str, tokenizer_config: Dict, max_length: int, precision: str = 'fp32') -> str:
+    """Stable hash of everything (except the text) that influences an embedding."""
+    fields = {'model': model_name, 'tokenizer': tokenizer_config, 'max_length': max_length}
+    if precision != 'fp32':
+        # Only added for reduced precision, so existing fp32 caches stay valid
+        fields['precision'] = precision
+    payload = json.dumps(fields, sort_keys=True)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+# Key records: the raw 16-byte key plus a short checksum, so a record torn by a crash is detected
+KEY_BYTES = 16
+CHECK_BYTES = 4
+RECORD_BYTES = KEY_BYTES + CHECK_BYTES
+
+
+def _key_record(key: str) -> bytes:
+    raw = bytes.fromhex(key)
+    return raw + hashlib.blake2b(raw, digest_size=CHECK_BYTES).digest()
+
+
+def _write_at(path: str, offset: int, payload: bytes) -> None:
+    """Write `payload` at `offset`, drop anything after it and sync to disk."""
+    with open(path, mode='r+b' if os.path.exists(path) else 'w+b') as outfile:
+        outfile.seek(offset)
+        outfile.write(payload)
+        outfile.truncate()
+        outfile.flush()
+        os.fsync(outfile.fileno())
+
+
+def _flush_at_exit(cache_ref: 'weakref.ref') -> None:
+    cache = cache_ref()
+    if cache is not None:
+        cache.flush()
+
+
+class EmbeddingCache:
+    """
+    On-disk, content-addressed cache of text embeddings.
+
+    - Each entry is keyed by hash(encoder fingerprint, text), where the fingerprint
+      covers the model name, tokenizer config and max_length.
+    - Vectors live in an append-only, memory-mapped float32/float16 matrix
+      (`embeddings-<generation>.bin`); row i belongs to the i-th fixed-width
+      record of `keys-<generation>.bin`. `header.json` only names the current
+      generation, so inserting a batch writes just that batch, never the index.
+    - Crash-safe: new rows are appended and synced before their key records,
+      so an interrupted write only leaves unreferenced bytes (or a torn record,
+      caught by its checksum) behind; rows a record points to are never rewritten.
+    - Safe across processes sharing `cache_dir`: writes take an exclusive file
+      lock and first read the records other processes appended, and readers
+      pick those up when the keys file grows.
+    - Recency (last-use ticks) is kept in memory and written to
+      `ticks-<generation>.npy` on flush (at exit) and compaction only.
+    - The matrix never holds more than `max_entries` rows: once full, the most
+      recently used entries are compacted into the next generation's files
+      and the header switched over to it.
+    """
+
+    VERSION = 3
+
+    def __init__(
+        self,
+        cache_dir: str,
+        fingerprint: str,
+        dim: int,
+        dtype: str = 'float32',
+        max_entries: int = 1_000_000
+    ):
+        if dtype not in ('float32', 'float16'):
+            raise ValueError(f"Unsupported cache dtype: {dtype}")
+
+        self.fingerprint = fingerprint
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.max_entries = max_entries
+
+        # One sub-directory per encoder, so matrices of different width never mix
+        self.directory = os.path.join(cache_dir, fingerprint)
+        os.makedirs(self.directory, exist_ok=True)
+        self.header_path = os.path.join(self.directory, 'header.json')
+        self.lock_path = os.path.join(self.directory, 'lock')
+
+        # key -> [row, last_used_tick]
+        self.entries: Dict[str, List[int]] = {}
+        self.generation = 0
+        self.num_rows = 0
+        self.tick = 0
+        # Whether there are access ticks not yet written to disk
+        self._ticks_dirty = False
+        self._header_id = None
+        self.matrix = np.empty((0, self.dim), dtype=self.dtype)
+
+        with self._locked():
+            if self._read_header() is None:
+                self._start_over()
+            self._reload()
+        # Weakly referenced, so registering does not keep the cache (and its mapping) alive
+        atexit.register(_flush_at_exit, weakref.ref(self))
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def _matrix_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f'embeddings-{generation}.bin')
+
+    def _keys_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f'keys-{generation}.bin')
+
+    def _ticks_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f'ticks-{generation}.npy')
+
+    @contextlib.contextmanager
+    def _locked(self, shared: bool = False) -> Iterator[None]:
+        """Exclusive (or shared) lock on the cache directory (a no-op where fcntl is unavailable)."""
+        with open(self.lock_path, mode='a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _file_id(self, path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _read_header(self) -> Optional[Dict]:
+        """The header on disk, or None if it is missing or has another layout."""
+        try:
+            with open(self.header_path, mode='r', encoding='utf-8') as infile:
+                header = json.load(infile)
+        except FileNotFoundError:
+            return None
+        if (header.get('version') != self.VERSION
+                or header.get('dim') != self.dim or header.get('dtype') != self.dtype.name):
+            return None
+        return header
+
+    def _write_header(self, generation: int) -> None:
+        header = {'version': self.VERSION, 'dim': self.dim, 'dtype': self.dtype.name, 'generation': generation}
+        tmp_path = self.header_path + '.tmp'
+        with open(tmp_path, mode='w', encoding='utf-8') as outfile:
+            json.dump(header, outfile)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(tmp_path, self.header_path)
+
+    def _start_over(self) -> None:
+        """New, empty generation 0 (no header yet, or one of an incompatible layout)."""
+        # The index of the previous (v2) layout, superseded by the key records
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(self.directory, 'index.json'))
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._ticks_path(0))
+        _write_at(self._keys_path(0), 0, b'')
+        self._write_header(0)
+
+    def _reload(self) -> None:
+        """Re-read everything from disk, keeping newer access ticks of this process."""
+        self._header_id = self._file_id(self.header_path)
+        header = self._read_header()
+        old_entries = self.entries
+        self.entries = {}
+        self.generation = header['generation'] if header is not None else 0
+        self.num_rows = 0
+        self._read_new_records(tick=0)
+        ticks = self._read_ticks(self.generation)
+        for key, entry in self.entries.items():
+            if entry[0] < len(ticks):
+                entry[1] = int(ticks[entry[0]])
+            if key in old_entries:
+                entry[1] = max(entry[1], old_entries[key][1])
+            self.tick = max(self.tick, entry[1])
+        self._map_matrix()
+
+    def _read_new_records(self, tick: int) -> None:
+        """Index the key records appended since the last read, up to the first torn one."""
+        try:
+            with open(self._keys_path(self.generation), mode='rb') as infile:
+                infile.seek(self.num_rows * RECORD_BYTES)
+                records = infile.read()
+        except FileNotFoundError:
+            return
+        for offset in range(0, len(records) - RECORD_BYTES + 1, RECORD_BYTES):
+            raw = records[offset:offset + KEY_BYTES]
+            check = records[offset + KEY_BYTES:offset + RECORD_BYTES]
+            if check != hashlib.blake2b(raw, digest_size=CHECK_BYTES).digest():
+                break
+            self.entries[raw.hex()] = [self.num_rows, tick]
+            self.num_rows += 1
+
+    def _read_ticks(self, generation: int) -> np.ndarray:
+        try:
+            return np.load(self._ticks_path(generation))
+        except (FileNotFoundError, ValueError):
+            return np.zeros(0, dtype=np.int64)
+
+    def _write_ticks(self, generation: int) -> None:
+        """Last-use tick per row, merged with what other processes wrote (the later tick wins)."""
+        ticks = np.zeros(self.num_rows, dtype=np.int64)
+        for row, tick in self.entries.values():
+            ticks[row] = tick
+        on_disk = self._read_ticks(generation)[:self.num_rows]
+        ticks[:len(on_disk)] = np.maximum(ticks[:len(on_disk)], on_disk)
+        tmp_path = self._ticks_path(generation) + '.tmp'
+        with open(tmp_path, mode='wb') as outfile:
+            np.save(outfile, ticks)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(tmp_path, self._ticks_path(generation))
+
+    def _map_matrix(self) -> None:
+        """Map the rows the key records refer to (read-only; rows are only ever appended)."""
+        self.matrix = (
+            np.memmap(self._matrix_path(self.generation), dtype=self.dtype, mode='r', shape=(self.num_rows, self.dim))
+            if self.num_rows > 0 else np.empty((0, self.dim), dtype=self.dtype)
+        )
+
+    def _sync(self) -> None:
+        """Catch up with other processes: reload after a compaction, else read appended records."""
+        if self._file_id(self.header_path) != self._header_id:
+            self._reload()
+            return
+        num_rows = self.num_rows
+        self._read_new_records(tick=self.tick)
+        if self.num_rows != num_rows:
+            self._map_matrix()
+
+    def _refresh(self) -> None:
+        """Lock-free check whether another process appended or compacted since we last read."""
+        try:
+            keys_size = os.path.getsize(self._keys_path(self.generation))
+        except FileNotFoundError:
+            keys_size = 0
+        if (self._file_id(self.header_path) != self._header_id
+                or keys_size >= (self.num_rows + 1) * RECORD_BYTES):
+            with self._locked(shared=True):
+                self._sync()
+
+    def flush(self) -> None:
+        """Write the access ticks to disk (vectors are written by put_many). Runs at exit."""
+        if not self._ticks_dirty:
+            return
+        with self._locked():
+            self._sync()
+            self._write_ticks(self.generation)
+        self._ticks_dirty = False
+
+    # ------------------------------------------------------------------
+    # Lookup / insert
+    # ------------------------------------------------------------------
+    def key(self, text: str) -> str:
+        return hashlib.blake2b(
+            f"{self.fingerprint}\x00{text}".encode('utf-8'), digest_size=KEY_BYTES
+        ).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get_many(self, texts: List[str]) -> Tuple[np.ndarray, List[int]]:
+        """
+        Look up embeddings for `texts`.
+        Returns (vectors, missing) where vectors is a float32 (len(texts), dim) array
+        with the cached rows filled in, and missing lists the positions not in the cache.
+        """
+        self._refresh()
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        missing = []
+        hit_positions = []
+        hit_rows = []
+        self.tick += 1
+        for i, text in enumerate(texts):
+            entry = self.entries.get(self.key(text))
+            if entry is None:
+                missing.append(i)
+            else:
+                entry[1] = self.tick
+                hit_positions.append(i)
+                hit_rows.append(entry[0])
+        if hit_rows:
+            # Access ticks are persisted on flush, not on every read
+            self._ticks_dirty = True
+            vectors[hit_positions] = self.matrix[hit_rows]
+        return vectors, missing
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        """
+        Insert embeddings for `texts` and commit them to disk. Texts already
+        cached only have their access tick refreshed. When the matrix would
+        overflow, older entries are compacted away, never ones of this batch;
+        a batch of more than max_entries new texts keeps its last max_entries.
+        """
+        with self._locked():
+            self._sync()
+            self.tick += 1
+            self._ticks_dirty = True
+            new_rows: Dict[str, np.ndarray] = {}
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                if key in self.entries:
+                    self.entries[key][1] = self.tick
+                else:
+                    new_rows.pop(key, None)
+                    new_rows[key] = vector
+            new_keys = list(new_rows)[-self.max_entries:]
+
+            stale_generation = None
+            if self.num_rows + len(new_keys) > self.max_entries:
+                # Leave some headroom so the next few batches just append
+                keep = max(0, self.max_entries - max(1, self.max_entries // 10) - len(new_keys))
+                stale_generation = self._compact(keep)
+
+            if new_keys:
+                block = np.stack([new_rows[key] for key in new_keys]).astype(self.dtype, copy=False)
+                # Past the last recorded row: bytes left by an interrupted write are overwritten.
+                # The rows are synced before their key records, so records only point at written rows
+                _write_at(
+                    self._matrix_path(self.generation),
+                    self.num_rows * self.dim * self.dtype.itemsize,
+                    np.ascontiguousarray(block).tobytes()
+                )
+                _write_at(
+                    self._keys_path(self.generation),
+                    self.num_rows * RECORD_BYTES,
+                    b''.join(_key_record(key) for key in new_keys)
+                )
+                for offset, key in enumerate(new_keys):
+                    self.entries[key] = [self.num_rows + offset, self.tick]
+                self.num_rows += len(new_keys)
+                self._map_matrix()
+
+            if stale_generation is not None:
+                # Readers that still map the old files keep their view until they reload
+                for path in (self._matrix_path(stale_generation), self._keys_path(stale_generation),
+                             self._ticks_path(stale_generation)):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path)
+
+    def _compact(self, keep: int) -> int:
+        """
+        Copy the `keep` most recently used entries (rows, key records and ticks)
+        into the next generation's files and switch the header over to it, which
+        commits the compaction. Returns the old generation, whose files the
+        caller removes.
+        """
+        kept = sorted(self.entries.items(), key=lambda item: item[1][1], reverse=True)[:keep]
+        kept.sort(key=lambda item: item[1][0])
+        old_generation = self.generation
+        generation = old_generation + 1
+        rows = [row for _, (row, _) in kept]
+        _write_at(
+            self._matrix_path(generation), 0,
+            np.ascontiguousarray(self.matrix[rows]).tobytes() if rows else b''
+        )
+        _write_at(self._keys_path(generation), 0, b''.join(_key_record(key) for key, _ in kept))
+        self.entries = {key: [new_row, tick] for new_row, (key, (_, tick)) in enumerate(kept)}
+        self.num_rows = len(kept)
+        self.generation = generation
+        self._write_ticks(generation)
+        self._write_header(generation)
+        self._header_id = self._file_id(self.header_path)
+        return old_generation
+
+def warm_from_csv(
+    dataset,
+    csv_path: str,
+    text_column: str = 'text',
+    chunk_size: int = 4096
+) -> int:
+    """
+    Encode every text in `csv_path` through `dataset` so later runs hit the cache.
+    Reads the CSV in chunks, so arbitrarily large files can be used.
+    Returns the number of rows processed.
+    """
+    num_rows = 0
+    with open(csv_path, mode='r', encoding='utf-8') as infile:
+        reader = csv.DictReader(infile)
+        chunk: List[str] = []
+        for row in reader:
+            chunk.append(row.get(text_column, ''))
+            if len(chunk) >= chunk_size:
+                dataset._encode_texts(chunk)
+                num_rows += len(chunk)
+                chunk = []
+        if chunk:
+            dataset._encode_texts(chunk)
+            num_rows += len(chunk)
+    return num_rows
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python embedding_cache.py <csv_path> [<csv_path> ...]")
+        sys.exit(1)
+
+    from data_loading import TherapeuticDataset
+
+    # The first CSV also provides the fixed root/CF/IC/skill descriptions
+    dataset = TherapeuticDataset(sys.argv[1])
+    dataset._create_node_features()
+    for csv_path in sys.argv[2:]:
+        num_rows = warm_from_csv(dataset, csv_path)
+        print(f"Warmed {num_rows} rows from {csv_path}")
+    print(f"Cache now holds {len(dataset.embedding_cache)} embeddings in {dataset.embedding_cache.directory}")
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,67 @@
 # eval.py
+import argparse
+import sys
 import torch
 import torch.nn.functional as F
-from sklearn.metrics import classification_report, confusion_matrix, multilabel_confusion_matrix
 import numpy as np
-from data_loading import load_data
-from model import EnhancedTherapeuticGNN
-from typing import Dict, Any, List, Tuple
+from data_loading import DEFAULT_ENCODER, PRECISIONS, TherapeuticDataset
+from compile_graph import load_compiled_graph
+from model import EdgeFreeTherapeuticClassifier, EnhancedTherapeuticGNN, quantize_heads
+from taxonomy import TASKS, Taxonomy, default_taxonomy
+from typing import Dict, Any, List, Optional, Tuple
 
 def evaluate_model(model: EnhancedTherapeuticGNN, data) -> Dict[str, Any]:
-    """Evaluate the trained model on test set for both factors and skills"""
+    """
+    Evaluate the trained model on the test set for factors, ICs and skills.
+    Class names come from data.taxonomy; every task is scored on the test
+    examples annotated for it.
+    """
+    # Imported here so prediction-only runs never load scikit-learn
+    from sklearn.metrics import classification_report, confusion_matrix, multilabel_confusion_matrix
+    
     model.eval()
     
     with torch.no_grad():
         # Get predictions
         factors_logits, intervention_concepts_logits, skills_logits = model(data.x, data.edge_index)
         
-        # Get predictions for test examples only
-        test_indices = data.test_mask.nonzero().squeeze()
-        
-        # Handle case where there's only one test example
-        if test_indices.dim() == 0:
-            test_indices = test_indices.unsqueeze(0)
+        # Get predictions for test examples only (indices stored with the split)
+        test_indices = data.test_idx
             
-        # Get test predictions and labels
-        test_labels = data.y[test_indices]  # Adjust for example node indices
-        factor_labels = test_labels[:, :3]  # First 3 columns for factors
-        intervention_concepts_labels = test_labels[:, 3:5]  # Next 2 columns for ICs
-        skill_labels = test_labels[:, 5:]   # Remaining columns for skills
+        # Get test labels: one class index column per task, -1 where not annotated
+        taxonomy = data.taxonomy
+        factor_names, ic_names, skill_names = (taxonomy.names(task) for task in TASKS)
+        test_labels = data.y[test_indices].long()
+        factor_rows = test_labels[:, 0] >= 0
+        ic_rows = test_labels[:, 1] >= 0
+        skill_rows = test_labels[:, 2] >= 0
         
         # Process factor predictions
-        factor_predictions = factors_logits[test_indices]
+        factor_predictions = factors_logits[test_indices][factor_rows]
         factor_pred_classes = factor_predictions.max(dim=1)[1]
-        factor_true_classes = factor_labels.max(dim=1)[1]
+        factor_true_classes = test_labels[factor_rows, 0]
         
         # Process IC predictions
-        intervention_concepts_predictions = intervention_concepts_logits[test_indices]
+        intervention_concepts_predictions = intervention_concepts_logits[test_indices][ic_rows]
         ic_pred_classes = intervention_concepts_predictions.max(dim=1)[1]
-        ic_true_classes = intervention_concepts_labels.max(dim=1)[1]
+        ic_true_classes = test_labels[ic_rows, 1]
         
-        # Process skill predictions
-        skill_predictions = torch.sigmoid(skills_logits[test_indices])
+        # Process skill predictions (multi-label, against one-hot skill rows)
+        skill_predictions = torch.sigmoid(skills_logits[test_indices][skill_rows])
         skill_pred_classes = (skill_predictions > 0.5).float()
+        skill_labels = F.one_hot(test_labels[skill_rows, 2], num_classes=len(skill_names)).float()
+        
+        def mean_or_nan(values: torch.Tensor) -> float:
+            return values.float().mean().item() if values.numel() else float('nan')
         
         # Calculate metrics for factors
-        factor_accuracy = factor_pred_classes.eq(factor_true_classes).float().mean().item()
+        factor_accuracy = mean_or_nan(factor_pred_classes.eq(factor_true_classes))
         
         # Calculate metrics for ICs
-        ic_accuracy = ic_pred_classes.eq(ic_true_classes).float().mean().item()
+        ic_accuracy = mean_or_nan(ic_pred_classes.eq(ic_true_classes))
         
         # Calculate metrics for skills
-        skill_accuracy = (skill_pred_classes == skill_labels).float().mean().item()
+        skill_accuracy = mean_or_nan(skill_pred_classes == skill_labels)
         
         # Convert to numpy arrays for sklearn metrics
         y_true_factors = factor_true_classes.cpu().numpy()
@@ -60,19 +72,12 @@ def evaluate_model(model: EnhancedTherapeuticGNN, data) -> Dict[str, Any]:
         y_pred_skills = skill_pred_classes.cpu().numpy()
         
         # Create classification reports
-        factor_names = ['Bond', 'Goal Alignment', 'Task Agreement']
-        intervention_concepts_names = ['EAR', 'CP']
-        skill_names = [
-            'Reflective Listening', 'Genuineness', 'Validation', 
-            'Affirmation', 'Respect for Autonomy', 'Asking for Permission', 
-            'Open-ended Question'
-        ]
-        
         try:
             # Factor classification report
             factor_report = classification_report(
                 y_true_factors,
                 y_pred_factors,
+                labels=list(range(len(factor_names))),
                 target_names=factor_names,
                 output_dict=True,
                 zero_division=0
@@ -82,7 +87,8 @@ def evaluate_model(model: EnhancedTherapeuticGNN, data) -> Dict[str, Any]:
             ic_report = classification_report(
                 y_true_ic,
                 y_pred_ic,
-                target_names=intervention_concepts_names,
+                labels=list(range(len(ic_names))),
+                target_names=ic_names,
                 output_dict=True,
                 zero_division=0
             )
@@ -98,12 +104,13 @@ def evaluate_model(model: EnhancedTherapeuticGNN, data) -> Dict[str, Any]:
         except ValueError as e:
             print(f"Warning: Could not generate classification report: {e}")
             factor_report = {}
+            ic_report = {}
             skill_report = {}
         
         # Generate confusion matrices
         try:
-            factor_conf_matrix = confusion_matrix(y_true_factors, y_pred_factors)
-            ic_conf_matrix = confusion_matrix(y_true_ic, y_pred_ic)
+            factor_conf_matrix = confusion_matrix(y_true_factors, y_pred_factors, labels=list(range(len(factor_names))))
+            ic_conf_matrix = confusion_matrix(y_true_ic, y_pred_ic, labels=list(range(len(ic_names))))
             skill_conf_matrices = multilabel_confusion_matrix(y_true_skills, y_pred_skills)
         except ValueError as e:
             print(f"Warning: Could not generate confusion matrix: {e}")
@@ -124,21 +131,117 @@ def evaluate_model(model: EnhancedTherapeuticGNN, data) -> Dict[str, Any]:
             'num_test_examples': len(test_indices)
         }
 
+def _accuracies(outputs: Tuple[torch.Tensor, ...], labels: torch.Tensor) -> Dict[str, float]:
+    """CF / IC / skill accuracy of per-task scores against class-index `labels`, each over the annotated rows."""
+    accuracies = {}
+    for column, (task, scores) in enumerate(zip(TASKS, outputs)):
+        task_labels = labels[:, column].long()
+        annotated = task_labels >= 0
+        correct = scores.argmax(dim=1) == task_labels
+        accuracies[task] = correct[annotated].float().mean().item() if annotated.any() else float('nan')
+    return accuracies
+
+def task_accuracies(model, data, indices: torch.Tensor) -> Dict[str, float]:
+    """
+    CF / IC / skill accuracy of the full-graph model on the nodes `indices`,
+    each over the examples annotated for that task.
+    """
+    model.eval()
+    with torch.no_grad():
+        outputs = model(data.x, data.edge_index)
+    return _accuracies([output[indices] for output in outputs], data.y[indices])
+
+def compare_knn_baseline(model: EnhancedTherapeuticGNN, data, index, k: int = 10) -> Dict[str, Dict[str, float]]:
+    """
+    Test accuracy of the kNN-vote retrieval baseline (neighbors drawn from the
+    training examples only) next to the model's edge-free and full-graph paths.
+    """
+    from example_index import KNNVoteClassifier
+    
+    knn = KNNVoteClassifier(index, data, k=k, allowed=data.train_mask)
+    test_features = data.x[data.test_idx]
+    test_labels = data.y[data.test_idx]
+    with torch.no_grad():
+        return {
+            f'knn_vote (k={k})': _accuracies(knn(test_features), test_labels),
+            'edge_free': _accuracies(model(test_features, edge_index=None), test_labels),
+            'graph': task_accuracies(model, data, data.test_idx)
+        }
+
 # eval.py
-def predict_new_text(
+def _check_in_channels(state_dict: Dict[str, torch.Tensor], in_channels: int, weights_path: str) -> None:
+    """Fail clearly (rather than with a shape mismatch) when weights and encoder disagree."""
+    expected = state_dict['conv_layers.0.lin.weight'].size(1)
+    if expected != in_channels:
+        raise ValueError(
+            f"{weights_path} was trained on {expected}-dim features but the encoder produces "
+            f"{in_channels}; pass the encoder used for training (--encoder)"
+        )
+
+def load_trained_model(
+    in_channels: int,
+    weights_path: str = 'enhanced_therapeutic_gnn.pth',
+    precision: str = 'fp32',
+    taxonomy: Optional[Taxonomy] = None
+) -> EnhancedTherapeuticGNN:
+    """
+    Build the model with the training hyperparameters and load trained weights.
+    The head sizes come from `taxonomy` (default: the built-in one).
+    With precision='int8' the three classifier heads are dynamically quantized.
+    """
+    num_common_factors, num_intervention_concepts, num_skills = (taxonomy or default_taxonomy()).label_sizes
+    model = EnhancedTherapeuticGNN(
+        in_channels=in_channels,
+        hidden_channels=64,
+        num_common_factors=num_common_factors,
+        num_intervention_concepts=num_intervention_concepts,
+        num_skills=num_skills,
+        num_layers=2,
+        dropout=0.5
+    )
+    state_dict = torch.load(weights_path)
+    _check_in_channels(state_dict, in_channels, weights_path)
+    model.load_state_dict(state_dict)
+    model.eval()
+    return quantize_heads(model) if precision == 'int8' else model
+
+def load_classifier(
+    weights_path: str = 'enhanced_therapeutic_gnn.pth',
+    precision: str = 'fp32',
+    in_channels: Optional[int] = None,
+    taxonomy: Optional[Taxonomy] = None
+) -> EdgeFreeTherapeuticClassifier:
+    """
+    Load only the weights used by the edge-free inference path.
+    Needs neither the graph nor torch_geometric, so it is the fast start for predict_texts.
+    If `in_channels` is given, it must match the feature size the weights were trained on;
+    the head sizes come from `taxonomy` (default: the built-in one).
+    """
+    state_dict = torch.load(weights_path, map_location='cpu', mmap=True, weights_only=True)
+    if in_channels is not None:
+        _check_in_channels(state_dict, in_channels, weights_path)
+    model = EdgeFreeTherapeuticClassifier.from_gnn_state_dict(
+        state_dict, head_sizes=(taxonomy or default_taxonomy()).label_sizes
+    )
+    return quantize_heads(model) if precision == 'int8' else model
+
+def predict_texts(
     model: EnhancedTherapeuticGNN,
     dataset,
-    text: str
-) -> Tuple[Dict[str, float], Dict[str, float]]:
+    texts: List[str]
+) -> List[Tuple[Dict[str, float], Dict[str, float], Dict[str, float]]]:
     """
-    Predict common factors and skills for new therapeutic text example
+    Predict common factors, ICs and skills for a batch of new texts.
+    Texts are encoded in one batched call and scored with one model forward;
+    returns one (factor, ic, skill) probability dict triple per text, keyed by
+    the class names of dataset.taxonomy.
     """
+    if not texts:
+        return []
+    
     model.eval()
     with torch.no_grad():
-        # Encode new text and ensure it's 2D (batch dimension)
-        text_features = dataset.encode_new_text(text)
-        if text_features.dim() == 1:
-            text_features = text_features.unsqueeze(0)
+        text_features = dataset.encode_new_texts(texts)
         
         # Get predictions using the unified forward pass
         factor_probs, ic_probs, skill_probs = model(
@@ -146,52 +249,211 @@ def predict_new_text(
             edge_index=None,  # Process independently
             return_logits=False  # Get probabilities directly
         )
+    
+    # One device->host conversion per head instead of one .item() per probability
+    factor_probs = factor_probs.tolist()
+    ic_probs = ic_probs.tolist()
+    skill_probs = skill_probs.tolist()
+    
+    factor_names, ic_names, skill_names = (dataset.taxonomy.names(task) for task in TASKS)
+    return [
+        (
+            dict(zip(factor_names, factor_probs[i])),
+            dict(zip(ic_names, ic_probs[i])),
+            dict(zip(skill_names, skill_probs[i]))
+        )
+        for i in range(len(texts))
+    ]
+
+def predict_new_text(
+    model: EnhancedTherapeuticGNN,
+    dataset,
+    text: str
+) -> Tuple[Dict[str, float], Dict[str, float]]:
+    """
+    Predict common factors and skills for new therapeutic text example
+    """
+    return predict_texts(model, dataset, [text])[0]
+
+def print_predictions(text: str, predictions: Tuple[Dict[str, float], Dict[str, float], Dict[str, float]]) -> None:
+    factor_preds, ic_preds, skill_preds = predictions
+    print(f"\nText: {text}")
+    print("\nPredicted Common Factors:")
+    for factor, prob in factor_preds.items():
+        print(f"{factor}: {prob:.4f}")
         
-        # Create probability dictionaries
-        factor_names = ['Bond', 'Goal Alignment', 'Task Agreement']
-        intervention_concepts = ['EAR', 'CP']
-        skill_names = [
-            'Reflective Listening', 'Genuineness', 'Validation', 
-            'Affirmation', 'Respect for Autonomy', 'Asking for Permission', 
-            'Open-ended Question'
-        ]
-        
-        # Ensure we're working with the first (and only) prediction
-        factor_probs = factor_probs.squeeze(0)
-        ic_probs = ic_probs.squeeze(0)
-        skill_probs = skill_probs.squeeze(0)
-        
-        factor_predictions = {
-            name: prob.item() for name, prob in zip(factor_names, factor_probs)
-        }
-        
-        ic_predictions = {
-            name: prob.item() for name, prob in zip(intervention_concepts, ic_probs)
-        }
-        
-        skill_predictions = {
-            name: prob.item() for name, prob in zip(skill_names, skill_probs)
-        }
+    print("\nPredicted Intervention Concepts:")
+    for ic, prob in ic_preds.items():
+        print(f"{ic}: {prob:.4f}")
+              
+    print("\nPredicted Skills:")
+    for skill, prob in skill_preds.items():
+        print(f"{skill}: {prob:.4f}")
+
+def predict_main(
+    texts: List[str],
+    weights_path: str,
+    precision: str = 'fp32',
+    model_name: str = DEFAULT_ENCODER,
+    graph_aware_k: Optional[int] = None,
+    filepath: str = 'data/htc_examples_ids.csv',
+    taxonomy: Optional[Taxonomy] = None
+) -> None:
+    """
+    Fast path: score `texts` without building the graph, importing
+    torch_geometric/scikit-learn or, when the embeddings are cached, BERT.
+    
+    With graph_aware_k, each text is instead attached to its k nearest training
+    examples of the compiled graph (found with its persisted IVF index) and
+    scored through the GAT layers (graph_inference.GraphAwarePredictor); this
+    needs the graph and torch_geometric.
+    The class names and head sizes come from `taxonomy` (default: the built-in
+    one, or the compiled graph's in graph-aware mode).
+    """
+    if graph_aware_k is not None:
+        from compile_graph import default_artifact_path, load_example_index
+        from graph_inference import build_graph_aware_predictor, cached_layer_states
+        index, data = load_example_index(filepath, model_name=model_name, taxonomy=taxonomy)
+        dataset = TherapeuticDataset(filepath=None, precision=precision, model_name=model_name, taxonomy=data.taxonomy)
+        model = load_trained_model(data.x.size(1), weights_path, precision, data.taxonomy)
+        states = cached_layer_states(model, data, default_artifact_path(filepath, model_name))
+        model = build_graph_aware_predictor(model, data, k=graph_aware_k, index=index, states=states)
+    else:
+        dataset = TherapeuticDataset(filepath=None, precision=precision, model_name=model_name, taxonomy=taxonomy)
+        model = load_classifier(weights_path, precision, in_channels=dataset.hidden_size, taxonomy=dataset.taxonomy)
+    for text, predictions in zip(texts, predict_texts(model, dataset, texts)):
+        print_predictions(text, predictions)
+
+def check_precision(
+    data,
+    filepath: str,
+    weights_path: str,
+    precision: str,
+    model_name: str = DEFAULT_ENCODER
+) -> Dict[str, Any]:
+    """
+    Accuracy-regression check of a reduced `precision` against fp32 on the test split.
+    
+    - Test texts are re-encoded (embedding cache off) by an fp32 and a reduced
+      precision encoder and scored with the edge-free classifier at the matching
+      precision, i.e. exactly the inference path that serve.py/score.py run.
+    - Returns per-task accuracy for both, how often their predictions agree,
+      the largest absolute probability difference and the encoding times.
+    """
+    import time
+    
+    results = {}
+    outputs = {}
+    for mode in ('fp32', precision):
+        dataset = TherapeuticDataset(
+            filepath, cache_dir=None, precision=mode, model_name=model_name, taxonomy=data.taxonomy
+        )
+        model = load_classifier(weights_path, mode, in_channels=dataset.hidden_size, taxonomy=data.taxonomy)
+        example_rows = (data.test_idx - dataset.example_start_idx).tolist()
+        texts = [dataset.examples.text(i) for i in example_rows]
         
-        return factor_predictions, ic_predictions, skill_predictions
+        dataset.bert_model  # Load (and quantize) before timing
+        start = time.perf_counter()
+        features = dataset.encode_new_texts(texts)
+        results[f'{mode}_encode_s'] = time.perf_counter() - start
+        with torch.no_grad():
+            outputs[mode] = model(features, edge_index=None, return_logits=False)
+    
+    # Class index per task, -1 where the example is not annotated
+    class_idx = dataset._create_label_indices()[example_rows]
+    for column, task in enumerate(TASKS):
+        labels = class_idx[:, column]
+        annotated = labels >= 0
+        reference = outputs['fp32'][column].argmax(dim=1)
+        reduced = outputs[precision][column].argmax(dim=1)
+        results[f'{task}_accuracy_fp32'] = (reference[annotated] == labels[annotated]).float().mean().item()
+        results[f'{task}_accuracy_{precision}'] = (reduced[annotated] == labels[annotated]).float().mean().item()
+        results[f'{task}_agreement'] = (reference == reduced).float().mean().item()
+        results[f'{task}_max_prob_diff'] = (outputs['fp32'][column] - outputs[precision][column]).abs().max().item()
+    return results
 
 def main():
-    # Load data and model
-    data, dataset = load_data('data/htc_examples_ids.csv')
-    
-    model = EnhancedTherapeuticGNN(
-        in_channels=data.x.size(1),
-        hidden_channels=64,
-        num_common_factors=3,
-        num_intervention_concepts=2,
-        num_skills=7,
-        num_layers=2,
-        dropout=0.5
+    parser = argparse.ArgumentParser(description="Evaluate EnhancedTherapeuticGNN or score new texts")
+    parser.add_argument('--predict', nargs='+', metavar='TEXT', help="Only score these texts (fast start)")
+    parser.add_argument('--weights', default='enhanced_therapeutic_gnn.pth')
+    parser.add_argument('--encoder', default=DEFAULT_ENCODER, help="Text encoder the weights were trained with")
+    parser.add_argument(
+        '--taxonomy', default=None,
+        help="Label taxonomy (.json or .cypher) the weights were trained with, default: the compiled graph's (built-in for --predict)"
+    )
+    parser.add_argument('--precision', choices=PRECISIONS, default='fp32', help="Encoder/classifier precision for --predict")
+    parser.add_argument(
+        '--graph-aware', type=int, default=None, metavar='K',
+        help="With --predict: attach each text to its K nearest training examples and run the GAT layers"
+    )
+    parser.add_argument(
+        '--knn-baseline', type=int, default=None, metavar='K',
+        help="Compare a K-nearest-example vote (ANN index over the training examples) with the model and exit"
     )
+    parser.add_argument(
+        '--check-precision', choices=[p for p in PRECISIONS if p != 'fp32'], default=None,
+        help="Compare this precision against fp32 on the test split and exit"
+    )
+    parser.add_argument(
+        '--max-accuracy-drop', type=float, default=0.02,
+        help="--check-precision fails (exit code 1) if any task loses more accuracy than this"
+    )
+    args = parser.parse_args()
+    taxonomy = Taxonomy.load(args.taxonomy) if args.taxonomy else None
+    
+    if args.predict:
+        try:
+            predict_main(args.predict, args.weights, args.precision, args.encoder, args.graph_aware, taxonomy=taxonomy)
+        except FileNotFoundError:
+            print(f"Error: Could not find trained model file ({args.weights})")
+            print("Please train the model first using train.py")
+        except ValueError as e:
+            print(f"Error: {e}")
+        return
+    
+    # Load the compiled graph and the text encoder
+    filepath = 'data/htc_examples_ids.csv'
+    data = load_compiled_graph(filepath, model_name=args.encoder, taxonomy=taxonomy)
+    dataset = TherapeuticDataset(filepath, model_name=args.encoder, taxonomy=data.taxonomy)
+    
+    # The split stored in the compiled graph is the one training used, so the
+    # test examples are exactly the ones training held out
+    
+    if args.knn_baseline is not None:
+        from compile_graph import load_example_index
+        index, _ = load_example_index(filepath, model_name=args.encoder)
+        model = load_trained_model(data.x.size(1), args.weights, taxonomy=data.taxonomy)
+        results = compare_knn_baseline(model, data, index, k=args.knn_baseline)
+        print(f"\nTest accuracy on {len(data.test_idx)} examples:")
+        print(f"{'method':<16} {'CF':>7} {'IC':>7} {'skill':>7}")
+        for method, accuracies in results.items():
+            print(f"{method:<16} {accuracies['factor']:>7.4f} {accuracies['ic']:>7.4f} {accuracies['skill']:>7.4f}")
+        return
+    
+    if args.check_precision:
+        results = check_precision(data, filepath, args.weights, args.check_precision, args.encoder)
+        precision = args.check_precision
+        print(f"\nPrecision check: {precision} vs fp32 on {len(data.test_idx)} test examples")
+        print(f"Encoding time: fp32 {results['fp32_encode_s']:.3f}s, {precision} {results[f'{precision}_encode_s']:.3f}s")
+        failed = False
+        for task in TASKS:
+            drop = results[f'{task}_accuracy_fp32'] - results[f'{task}_accuracy_{precision}']
+            print(
+                f"{task:>6}: accuracy fp32 {results[f'{task}_accuracy_fp32']:.4f}, "
+                f"{precision} {results[f'{task}_accuracy_{precision}']:.4f}, "
+                f"agreement {results[f'{task}_agreement']:.4f}, "
+                f"max prob diff {results[f'{task}_max_prob_diff']:.4f}"
+            )
+            failed = failed or drop > args.max_accuracy_drop
+        if failed:
+            print(f"FAILED: accuracy dropped by more than {args.max_accuracy_drop}")
+            sys.exit(1)
+        print("OK")
+        return
     
     try:
         # Load trained model weights
-        model.load_state_dict(torch.load('enhanced_therapeutic_gnn.pth'))
+        model = load_trained_model(data.x.size(1), args.weights, taxonomy=data.taxonomy)
         
         # Print dataset statistics
         n_test = data.test_mask.sum().item()
@@ -226,12 +488,7 @@ def main():
             print(metrics['factor_confusion_matrix'])
             
             print("\nSkills Confusion Matrices (one per skill):")
-            for skill_name, conf_matrix in zip(
-                ['Reflective Listening', 'Genuineness', 'Validation', 
-                 'Affirmation', 'Respect for Autonomy', 'Asking for Permission', 
-                 'Open-ended Question'],
-                metrics['skill_confusion_matrices']
-            ):
+            for skill_name, conf_matrix in zip(data.taxonomy.names('skill'), metrics['skill_confusion_matrices']):
                 print(f"\n{skill_name}:")
                 print(conf_matrix)
         else:
@@ -247,23 +504,11 @@ def main():
             "It used to… And the people that you're working with what you're doing, uh… you don't feel good about that. Sometimes is that the way…" # RL + EAR
         ]
         
-        for text in example_texts:
-            factor_preds, ic_preds, skill_preds = predict_new_text(model, dataset, text)
-            print(f"\nText: {text}")
-            print("\nPredicted Common Factors:")
-            for factor, prob in factor_preds.items():
-                print(f"{factor}: {prob:.4f}")
-                
-            print("\nPredicted Intervention Concepts:")
-            for ic, prob in ic_preds.items():
-                print(f"{ic}: {prob:.4f}")
-                      
-            print("\nPredicted Skills:")
-            for skill, prob in skill_preds.items():
-                print(f"{skill}: {prob:.4f}")
+        for text, predictions in zip(example_texts, predict_texts(model, dataset, example_texts)):
+            print_predictions(text, predictions)
                 
     except FileNotFoundError:
-        print("Error: Could not find trained model file (enhanced_therapeutic_gnn.pth)")
+        print(f"Error: Could not find trained model file ({args.weights})")
         print("Please train the model first using train.py")
 
 if __name__ == '__main__':
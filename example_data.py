@@ -1,27 +1,167 @@
+import array
 import csv
-from typing import List, Dict, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
-def get_node_data(csv_path: str) -> Tuple[
-    List[Dict[str, str]],
-    List[Dict[str, str]],
-    List[Dict[str, str]],
-    List[Dict[str, str]],
-    List[Dict[str, str]]
-]:
+import numpy as np
+
+# Example rows without an 'id' column are numbered from here (0..12 are the fixed nodes)
+FIRST_EXAMPLE_ID = 13
+
+
+class ExampleColumns:
     """
-    Returns (root_nodes, common_factors, intervention_concepts, therapeutic_skills, examples).
+    Columnar storage of the example rows of an annotation CSV.
+
+    - ids, cf_ids, ic_ids, skill_ids: int64 arrays, one entry per row (0 = not annotated)
+    - text_data: all texts UTF-8 encoded back to back in one buffer
+    - text_offsets: int64 array of length n + 1, text i is text_data[offsets[i]:offsets[i + 1]]
+
+    Keeping the texts in a single buffer means memory stays close to the size
+    of the raw text instead of one Python dict and str per row.
+    """
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        cf_ids: np.ndarray,
+        ic_ids: np.ndarray,
+        skill_ids: np.ndarray,
+        text_data: bytes,
+        text_offsets: np.ndarray
+    ):
+        self.ids = ids
+        self.cf_ids = cf_ids
+        self.ic_ids = ic_ids
+        self.skill_ids = skill_ids
+        self.text_data = text_data
+        self.text_offsets = text_offsets
+
+    @classmethod
+    def empty(cls) -> 'ExampleColumns':
+        no_ids = np.zeros(0, dtype=np.int64)
+        return cls(no_ids, no_ids, no_ids, no_ids, b'', np.zeros(1, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def slice(self, start: int, stop: Optional[int] = None) -> 'ExampleColumns':
+        """Rows start..stop as their own ExampleColumns."""
+        stop = len(self) if stop is None else stop
+        offsets = self.text_offsets[start:stop + 1]
+        return ExampleColumns(
+            ids=self.ids[start:stop],
+            cf_ids=self.cf_ids[start:stop],
+            ic_ids=self.ic_ids[start:stop],
+            skill_ids=self.skill_ids[start:stop],
+            text_data=self.text_data[offsets[0]:offsets[-1]],
+            text_offsets=offsets - offsets[0]
+        )
+
+    def concat(self, other: 'ExampleColumns') -> 'ExampleColumns':
+        """These rows followed by the rows of `other`."""
+        return ExampleColumns(
+            ids=np.concatenate([self.ids, other.ids]),
+            cf_ids=np.concatenate([self.cf_ids, other.cf_ids]),
+            ic_ids=np.concatenate([self.ic_ids, other.ic_ids]),
+            skill_ids=np.concatenate([self.skill_ids, other.skill_ids]),
+            text_data=self.text_data + other.text_data,
+            text_offsets=np.concatenate([self.text_offsets, other.text_offsets[1:] + len(self.text_data)])
+        )
+
+    def text(self, i: int) -> str:
+        return self.text_data[self.text_offsets[i]:self.text_offsets[i + 1]].decode('utf-8')
 
-    1) The root node, CFs, and ICs, and skills are hardcoded/fixed.
-    2) The examples are loaded from the CSV at 'csv_path'.
+    def texts(self, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        """Decode texts start..stop lazily, one at a time."""
+        stop = len(self) if stop is None else stop
+        for i in range(start, stop):
+            yield self.text(i)
+
+    def to_dicts(self) -> List[Dict]:
+        """Row-wise view matching the example dicts returned by get_node_data."""
+        return [
+            {
+                "id": int(self.ids[i]),
+                "type": "example",
+                "text": self.text(i),
+                "CF_id": int(self.cf_ids[i]),
+                "IC_id": int(self.ic_ids[i]),
+                "skill_id": int(self.skill_ids[i])
+            }
+            for i in range(len(self))
+        ]
+
+
+def _cell(row: List[str], col) -> str:
+    return row[col] if col is not None and col < len(row) else ''
+
+
+def _parse_id(value: str) -> int:
+    value = value.strip()
+    return int(value) if value else 0
+
+
+def read_example_columns(csv_path: str) -> ExampleColumns:
+    """
+    Stream `csv_path` once and fill the example columns.
 
     The CSV must have at least:
       - 'text'
-      - 'factor_id'
-      - 'ic_id'
+      - 'CF_id'
+      - 'IC_id'
       - 'skill_id'
-    plus any other columns you want to include or parse.
+    and optionally an 'id' column (otherwise rows are numbered from FIRST_EXAMPLE_ID).
+    Missing or empty ids are stored as 0.
+    """
+    ids = array.array('q')
+    cf_ids = array.array('q')
+    ic_ids = array.array('q')
+    skill_ids = array.array('q')
+    text_offsets = array.array('q', [0])
+    text_data = bytearray()
+
+    with open(csv_path, mode='r', encoding='utf-8', newline='') as infile:
+        reader = csv.reader(infile)
+        header = next(reader, [])
+        column = {name: i for i, name in enumerate(header)}
+        id_col = column.get('id')
+        text_col = column.get('text')
+        cf_col = column.get('CF_id')
+        ic_col = column.get('IC_id')
+        skill_col = column.get('skill_id')
+
+        for row_idx, row in enumerate(reader):
+            if not row:
+                continue
+            id_str = _cell(row, id_col).strip()
+            ids.append(int(id_str) if id_str else FIRST_EXAMPLE_ID + row_idx)
+            cf_ids.append(_parse_id(_cell(row, cf_col)))
+            ic_ids.append(_parse_id(_cell(row, ic_col)))
+            skill_ids.append(_parse_id(_cell(row, skill_col)))
+            text_data += _cell(row, text_col).encode('utf-8')
+            text_offsets.append(len(text_data))
+
+    return ExampleColumns(
+        ids=np.frombuffer(ids, dtype=np.int64),
+        cf_ids=np.frombuffer(cf_ids, dtype=np.int64),
+        ic_ids=np.frombuffer(ic_ids, dtype=np.int64),
+        skill_ids=np.frombuffer(skill_ids, dtype=np.int64),
+        text_data=bytes(text_data),
+        text_offsets=np.frombuffer(text_offsets, dtype=np.int64)
+    )
 
-    Adjust as needed if your CSV or naming conventions differ.
+
+def get_fixed_nodes() -> Tuple[
+    List[Dict[str, str]],
+    List[Dict[str, str]],
+    List[Dict[str, str]],
+    List[Dict[str, str]]
+]:
+    """
+    Returns (root_nodes, common_factors, intervention_concepts, therapeutic_skills).
+    These nodes are hardcoded/fixed and take the ids 0..12. They make up the
+    default taxonomy (taxonomy.default_taxonomy); classes carry the annotation
+    abbreviation and, where it differs from the name, the name shown in predictions.
     """
     
     # Root node (not used for prediction but kept for graph structure)
@@ -38,18 +178,24 @@ def get_node_data(csv_path: str) -> Tuple[
             'id': 1,
             'type': 'common_factor',
             'name': 'Bond',
+            'abbreviation': 'B',
+            'display_name': 'Bond',
             'description': "Therapists orient to the client in order to work on a therapeutic bond by taking a stance of empathy, compassion, and acceptance, with the aims of understanding and of helping the client feel understood and supported in a true partnership."
         },
         {
             'id': 2,
             'type': 'common_factor',
             'name': 'Goal alignment',
+            'abbreviation': 'GA',
+            'display_name': 'Goal Alignment',
             'description': "Therapists work to understand their client's desires for change, conceptualize their client's demoralization, and facilitate conversation about the goals they will work on together to address to bring about remoralization. They do this with an attitude of collaboration to negotiate these goals."
         },
         {
             'id': 3,
             'type': 'common_factor',
             'name': 'Task agreement',
+            'abbreviation': 'TA',
+            'display_name': 'Task Agreement',
             'description': "Therapists facilitate client engagement by clarifying how therapist and client work together and focusing their in-session attention on agreed-upon content and concomitant therapeutic actions that will lead to change. This involves clarifying roles, processes, settings, and session agendas, and ensuring that both therapist and client are aligned on these aspects. The therapist seeks feedback on alignment of session agenda with treatment goals and on therapist in-session procedures."
         }
     ]
@@ -60,12 +206,16 @@ def get_node_data(csv_path: str) -> Tuple[
             'id': 4,
             'type': 'intervention_concept',
             'name': "Empathy, Acceptance and Positive Regard",
+            'abbreviation': 'EAR',
+            'display_name': 'EAR',
             'description': "The therapist shows the capacity to understand, share, and genuinely connect with the patient's thoughts, feelings, and experiences by listening attentively to the patient's concerns without judgment; understanding and validating the patient's emotions and experiences; demonstrating compassion, warmth, and genuine care for the patient's well-being; communicating understanding and support, helping the patient feel heard and valued. Acceptance includes that the therapist sees the client's inherent absolute worth and potential, honors their autonomy, and affirms their personal strengths and efforts. (Bailey & Ogles, p. 48). Positive regard involves prizing and acknowledging what is positive in your clients (Miller & Moyers, p. 46)."
         },
         {
             'id': 5,
             'type': 'intervention_concept',
             'name': "Collaboration and Partnership",
+            'abbreviation': 'CP',
+            'display_name': 'CP',
             'description': "The therapist is open to conversations and opportunities to explore client values, goals, and needs and to accept their differences and respect their autonomy. The therapist expresses to the client that he sees the client as an equal who brings strengths, talents, and personal expertise to the relationship. The therapist expresses directly or indirectly that they view the client as a partner in resolving the client's challenges. Therapist attempts to create we-ness, e.g. by using we and together instead  of you, asking questions about the fit of interpretations, conclusions, goals, etc."
         }
     ]
@@ -76,79 +226,74 @@ def get_node_data(csv_path: str) -> Tuple[
             'id': 6,
             'type': 'skill',
             'name': 'Reflective Listening',
+            'abbreviation': 'RL',
             'description': 'Actively listening and reflecting to demonstrate understanding.'
         },
         {
             'id': 7,
             'type': 'skill',
             'name': 'Genuineness',
+            'abbreviation': 'G',
             'description': 'Being authentic, sincere, and transparent in interactions.'
         },
         {
             'id': 8,
             'type': 'skill',
             'name': 'Validation',
+            'abbreviation': 'V',
             'description': 'Recognizing and affirming the client\'s experiences and feelings.'
         },
         {
             'id': 9,
             'type': 'skill',
             'name': 'Affirmation',
+            'abbreviation': 'A',
             'description': 'Highlighting the client\'s strengths and efforts.'
         },
         {
             'id': 10,
             'type': 'skill',
             'name': 'Respect for Autonomy',
+            'abbreviation': 'RA',
             'description': 'Honoring the client\'s independence and choices.'
         },
         {
             'id': 11,
             'type': 'skill',
             'name': 'Asking for Permission',
+            'abbreviation': 'AP',
             'description': 'Seeking the client\'s consent before offering suggestions.'
         },
         {
             'id': 12,
             'type': 'skill',
             'name': 'Open-ended Question',
+            'abbreviation': 'OQ',
             'description': 'Inviting deeper, more expansive client responses.'
         }
     ]
-    
-    examples: List[Dict[str, str]] = []
-    
-    with open(csv_path, mode='r', encoding='utf-8') as infile:
-        reader = csv.DictReader(infile)
-        for idx, row in enumerate(reader):
-            # Example node ID can start after all above nodes (0..12 used)
-            # If you'd like to simply enumerate from 13 onward:
-            # example_id = 13 + idx  # or use row.get('id') if your CSV has an explicit 'id'
-            example_id = row.get('id')
-            
-            # Safely parse the factor_id
-            factor_id_str = row.get("CF_id", "").strip()
-            factor_id = int(factor_id_str) if factor_id_str else 0
-
-            # Safely parse the ic_id
-            ic_id_str = row.get("IC_id", "").strip()
-            ic_id = int(ic_id_str) if ic_id_str else 0
-
-            # Safely parse the skill_id
-            skill_id_str = row.get("skill_id", "").strip()
-            skill_id = int(skill_id_str) if skill_id_str else 0
-            
-            # Build a dictionary for this example node
-            example_node = {
-                "id": example_id,
-                "type": "example",
-                "text": row.get("text", ""),
-                "CF_id": factor_id,
-                "IC_id": ic_id,
-                "skill_id": skill_id
-            }
-            
-            examples.append(example_node)
+
+    return root_node, common_factors, intervention_concepts, therapeutic_skills
+
+
+def get_node_data(csv_path: str) -> Tuple[
+    List[Dict[str, str]],
+    List[Dict[str, str]],
+    List[Dict[str, str]],
+    List[Dict[str, str]],
+    List[Dict[str, str]]
+]:
+    """
+    Returns (root_nodes, common_factors, intervention_concepts, therapeutic_skills, examples).
+
+    1) The root node, CFs, and ICs, and skills are hardcoded/fixed (see get_fixed_nodes).
+    2) The examples are loaded from the CSV at 'csv_path' as a list of dicts.
+
+    Prefer read_example_columns for large files; this row-wise view is kept
+    for callers that want plain dicts.
+    """
+    root_node, common_factors, intervention_concepts, therapeutic_skills = get_fixed_nodes()
+    examples = read_example_columns(csv_path).to_dicts()
     
     return (
         root_node,
@@ -158,102 +303,90 @@ def get_node_data(csv_path: str) -> Tuple[
         examples
     )
 
-def get_edge_indices(csv_path: str) -> List[Tuple[int, int]]:
+
+def build_edge_index(
+    examples: ExampleColumns,
+    example_offset: int = FIRST_EXAMPLE_ID,
+    num_nodes: Optional[int] = None
+) -> np.ndarray:
     """
-    Read cf_id, ic_id, skill_id, and each example's own 'id' directly from CSV
-    and build graph edges. Also demonstrates root->CF edges and
-    skill->CF edges, similar to the original design.
+    Build the graph edges from the example id columns, fully vectorized:
+      (a) Root (ID=0) -> each unique CF
+      (b) Example -> skill
+      (c) Example -> IC, IC -> CF and skill -> IC when an IC is annotated
+      (d) Example -> CF and skill -> CF when no IC is annotated
+    Ids of 0 mean "not annotated" and produce no edge. Example i is node
+    `example_offset + i`; the fixed nodes use their ids as node indices.
+
+    Edges are made bidirectional and deduplicated via np.unique on packed
+    int64 (src * num_nodes + dst) keys. The result is a (2, num_edges) int64
+    COO array sorted by (src, dst), ready for PyG or edge_index_to_csr.
     """
-    # Track unique IDs for CF, IC, and skill, and store each example row
-    cf_ids = set()
-    ic_ids = set()
-    skill_ids = set()
-    examples = []
-
-    # 1. Read the CSV file to gather all IDs
-    with open(csv_path, mode='r', encoding='utf-8') as infile:
-        reader = csv.DictReader(infile)
-        for row in reader:
-            # Convert to int as needed, assuming columns are named exactly:
-            #   id, CF_id, IC_id, skill_id
-            example_id = int(row['id'])
-            
-             # Safely parse the factor_id
-            factor_id_str = row.get("CF_id", "").strip()
-            cf_id = int(factor_id_str) if factor_id_str else -1
-
-            # Safely parse the ic_id
-            ic_id_str = row.get("IC_id", "").strip()
-            ic_id = int(ic_id_str) if ic_id_str else -1
-
-            # Safely parse the skill_id
-            skill_id_str = row.get("skill_id", "").strip()
-            skill_id = int(skill_id_str) if skill_id_str else -1
-
-            # Add to sets
-            cf_ids.add(cf_id)
-            ic_ids.add(ic_id)
-            skill_ids.add(skill_id)
-
-            # Keep the row info for building edges later
-            examples.append({
-                'example_id': example_id,
-                'cf_id': cf_id,
-                'ic_id': ic_id,
-                'skill_id': skill_id
-            })
-            
-    print(f"examples before edge building: {examples}")
-
-    # 2. Build edges
-    edges: List[Tuple[int, int]] = []
-
-    # (a) Root node (ID=0) -> each unique CF
-    for cf_id in cf_ids:
-        edges.append((0, cf_id))
-
-    # (b) Skills -> CFs
-    # for skill_id in skill_ids:
-    #     for cf_id in cf_ids:
-    #         edges.append((skill_id, cf_id))
-
-    # (c) Example -> skill, CF, IC
-    for ex in examples:
-        ex_id = ex['example_id']
-        cf_id = ex['cf_id']
-        ic_id = ex['ic_id']
-        skill_id = ex['skill_id']
-        
-        # 1) If there's a skill, connect Example -> Skill
-        if skill_id != -1:
-            edges.append((ex_id, skill_id))
-
-        # 2) If there's an IC:
-        if ic_id != -1:
-            edges.append((ex_id, ic_id))  # Example -> IC
-            edges.append((ic_id, cf_id))  # IC -> CF
-
-            # If there's also a skill, connect Skill -> IC
-            if skill_id != -1:
-                edges.append((skill_id, ic_id))
-        else:
-            # 3) If no IC, connect Example -> CF
-            edges.append((ex_id, cf_id))
-
-            # If there's a skill, connect Skill -> CF
-            if skill_id != -1:
-                edges.append((skill_id, cf_id))
-
-    # 3. Make edges bidirectional (TODO)
-    # print(f"Original edges: {edges}")
-    bidirectional_edges = edges + [(dest, src) for (src, dest) in edges]
-    
-    # 4. Remove duplicates (set() of tuples) and convert back to list
-    unique_edges = list(set(bidirectional_edges))
+    num_examples = len(examples)
+    if num_nodes is None:
+        num_nodes = example_offset + num_examples
+    ex = np.arange(example_offset, example_offset + num_examples, dtype=np.int64)
+    cf, ic, skill = examples.cf_ids, examples.ic_ids, examples.skill_ids
+    has_cf, has_ic, has_skill = cf > 0, ic > 0, skill > 0
+    no_ic = ~has_ic & has_cf
 
-    # Optional: sort them if you need a deterministic order
-    unique_edges.sort()
+    unique_cf = np.unique(cf[has_cf])
+    src = np.concatenate([
+        np.zeros(len(unique_cf), dtype=np.int64),  # (a) root -> CF
+        ex[has_skill],                               # (b) example -> skill
+        ex[has_ic],                                  # (c) example -> IC
+        ic[has_ic & has_cf],                         #     IC -> CF
+        skill[has_ic & has_skill],                   #     skill -> IC
+        ex[no_ic],                                   # (d) example -> CF
+        skill[no_ic & has_skill]                     #     skill -> CF
+    ])
+    dst = np.concatenate([
+        unique_cf,
+        skill[has_skill],
+        ic[has_ic],
+        cf[has_ic & has_cf],
+        ic[has_ic & has_skill],
+        cf[no_ic],
+        cf[no_ic & has_skill]
+    ])
 
-    print(f"Final unique edges: {unique_edges}")
-    
-    return bidirectional_edges
\ No newline at end of file
+    # Symmetrize, then dedup + sort in one pass over packed keys
+    keys = np.concatenate([src * num_nodes + dst, dst * num_nodes + src])
+    keys = np.unique(keys)
+    return np.stack([keys // num_nodes, keys % num_nodes])
+
+
+def merge_edge_index(edge_index: np.ndarray, new_edges: np.ndarray, num_nodes: int) -> np.ndarray:
+    """
+    Merge `new_edges` into a (src, dst)-sorted, deduplicated `edge_index`
+    (both as returned by build_edge_index) without re-sorting the existing edges:
+    the new packed keys are located by binary search, duplicates dropped and
+    the rest inserted in one pass. `num_nodes` must cover the nodes of both.
+    """
+    keys = edge_index[0] * num_nodes + edge_index[1]
+    new_keys = np.unique(new_edges[0] * num_nodes + new_edges[1])
+    positions = np.searchsorted(keys, new_keys)
+    present = positions < len(keys)
+    present[present] = keys[positions[present]] == new_keys[present]
+    keys = np.insert(keys, positions[~present], new_keys[~present])
+    return np.stack([keys // num_nodes, keys % num_nodes])
+
+
+def edge_index_to_csr(edge_index: np.ndarray, num_nodes: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert a (src, dst)-sorted COO edge_index (as returned by build_edge_index)
+    to CSR: returns (rowptr, col) with rowptr of length num_nodes + 1.
+    """
+    counts = np.bincount(edge_index[0], minlength=num_nodes)
+    rowptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(counts, out=rowptr[1:])
+    return rowptr, edge_index[1].copy()
+
+
+def get_edge_indices(csv_path: str) -> List[Tuple[int, int]]:
+    """
+    Read CF_id, IC_id, skill_id directly from CSV and build the
+    bidirectional, deduplicated and sorted graph edges (see build_edge_index).
+    """
+    edge_index = build_edge_index(read_example_columns(csv_path))
+    return list(zip(edge_index[0].tolist(), edge_index[1].tolist()))
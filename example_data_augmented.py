@@ -1,7 +1,30 @@
-# example_data.py
+# example_data_augmented.py
+import csv
+import sys
+from functools import lru_cache
 from typing import Dict, List, Tuple
 
+import numpy as np
+
+from example_data import FIRST_EXAMPLE_ID, ExampleColumns
+
+# Node index of the first example (root 0, CFs 1..3, skills 4..10)
+EXAMPLE_OFFSET = 11
+
+# The augmented skills 4..10 are the CSV skills 6..12 in the same order
+CSV_SKILL_ID_SHIFT = 2
+
+
 def get_node_data() -> Tuple[List[Dict], List[Dict], List[Dict], List[Dict]]:
+    """
+    Returns (root_nodes, common_factors, therapeutic_skills, examples).
+    The lists are built once and shared between calls, so do not mutate them.
+    """
+    return _build_node_data()
+
+
+@lru_cache(maxsize=None)
+def _build_node_data() -> Tuple[List[Dict], List[Dict], List[Dict], List[Dict]]:
     # Root node (not used for prediction but kept for graph structure)
     root_node = [{
         'id': 0,
@@ -281,30 +304,89 @@ def get_node_data() -> Tuple[List[Dict], List[Dict], List[Dict], List[Dict]]:
     return root_node, common_factors, therapeutic_skills, examples
 
 def get_edge_indices() -> List[Tuple[int, int]]:
-    edges = []
-    
-    # Root to Common Factors (kept for graph structure)
-    for cf_id in range(1, 4):
-        edges.append((0, cf_id))
+    """
+    Build the bidirectional edges of the augmented graph in one pass:
+    root->CF, every skill->every CF, and example->skill / example->CF.
+    Example i is node EXAMPLE_OFFSET + i.
+    """
+    _, common_factors, therapeutic_skills, examples = get_node_data()
+    cf_ids = np.array([cf['id'] for cf in common_factors], dtype=np.int64)
+    skill_ids = np.array([skill['id'] for skill in therapeutic_skills], dtype=np.int64)
+    example_nodes = np.arange(EXAMPLE_OFFSET, EXAMPLE_OFFSET + len(examples), dtype=np.int64)
+    example_skills = np.array([example['skill_id'] for example in examples], dtype=np.int64)
+    example_factors = np.array([example['factor_id'] for example in examples], dtype=np.int64)
     
-    # Skills to Common Factors
-    for skill_id in range(4, 11):
-        for cf_id in range(1, 4):
-            edges.append((skill_id, cf_id))
-    
-    # Examples to Skills and Factors
-    for example in range(11, 148):
-        # Example to Skill
-        edges.append((example, get_node_data()[3][example-11]['skill_id']))
-        # Example to Factor
-        edges.append((example, get_node_data()[3][example-11]['factor_id']))
+    src = np.concatenate([
+        np.zeros(len(cf_ids), dtype=np.int64),      # Root to Common Factors
+        np.repeat(skill_ids, len(cf_ids)),          # Skills to Common Factors
+        np.repeat(example_nodes, 2)                 # Example to Skill, Example to Factor
+    ])
+    dst = np.concatenate([
+        cf_ids,
+        np.tile(cf_ids, len(skill_ids)),
+        np.stack([example_skills, example_factors], axis=1).ravel()
+    ])
     
     # Make edges bidirectional
-    bidirectional_edges = edges + [(j, i) for i, j in edges]
-    
-    return bidirectional_edges
+    edges = list(zip(src.tolist(), dst.tolist()))
+    return edges + [(j, i) for i, j in edges]
 
 def get_example_labels() -> List[int]:
     """Get factor labels for examples"""
     _, _, _, examples = get_node_data()
-    return [example['factor_id'] - 1 for example in examples]  # -1 for 0-based indexing
\ No newline at end of file
+    return [example['factor_id'] - 1 for example in examples]  # -1 for 0-based indexing
+
+def get_example_columns(repeat: int = 1) -> ExampleColumns:
+    """
+    The augmented examples as ExampleColumns in the CSV id convention
+    (CF ids 1..3, no IC, skill ids 6..12, example ids from FIRST_EXAMPLE_ID),
+    so they can go through the same pipeline as data/htc_examples_ids.csv.
+    
+    `repeat` tiles the examples to build larger graphs for scaling benchmarks.
+    """
+    _, _, _, examples = get_node_data()
+    num_examples = len(examples) * repeat
+    
+    encoded = [example['text'].encode('utf-8') for example in examples]
+    lengths = np.tile(np.array([len(text) for text in encoded], dtype=np.int64), repeat)
+    text_offsets = np.zeros(num_examples + 1, dtype=np.int64)
+    np.cumsum(lengths, out=text_offsets[1:])
+    
+    return ExampleColumns(
+        ids=np.arange(FIRST_EXAMPLE_ID, FIRST_EXAMPLE_ID + num_examples, dtype=np.int64),
+        cf_ids=np.tile(np.array([example['factor_id'] for example in examples], dtype=np.int64), repeat),
+        ic_ids=np.zeros(num_examples, dtype=np.int64),
+        skill_ids=np.tile(
+            np.array([example['skill_id'] + CSV_SKILL_ID_SHIFT for example in examples], dtype=np.int64),
+            repeat
+        ),
+        text_data=b''.join(encoded) * repeat,
+        text_offsets=text_offsets
+    )
+
+def write_csv(csv_path: str, repeat: int = 1) -> None:
+    """Write the augmented examples in the htc_examples_ids.csv format (see get_example_columns)."""
+    columns = get_example_columns(repeat)
+    with open(csv_path, mode='w', newline='', encoding='utf-8') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(["id", "text", "CF_id", "IC_id", "skill_id"])
+        for i in range(len(columns)):
+            writer.writerow([
+                int(columns.ids[i]),
+                columns.text(i),
+                int(columns.cf_ids[i]),
+                "",
+                int(columns.skill_ids[i])
+            ])
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python example_data_augmented.py <output_csv> [<repeat>]")
+        sys.exit(1)
+    
+    repeat = int(sys.argv[2]) if len(sys.argv) == 3 else 1
+    write_csv(sys.argv[1], repeat)
+    print(f"Wrote {len(get_node_data()[3]) * repeat} examples to {sys.argv[1]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+# example_index.py
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+
+class ExactExampleIndex:
+    """
+    Brute-force cosine-similarity index over example embeddings.
+
+    - features: (num_nodes, dim) node features (e.g. data.x)
+    - node_indices: (n,) nodes to index (e.g. data.train_idx), returned by search
+    Vectors are L2-normalized once, so a query is one (b, dim) x (dim, n) matmul plus top-k.
+    """
+
+    def __init__(self, features: torch.Tensor, node_indices: torch.Tensor):
+        self.vectors = F.normalize(features[node_indices].float(), dim=1)
+        self.node_indices = node_indices
+
+    def __len__(self) -> int:
+        return len(self.node_indices)
+
+    def search(
+        self,
+        queries: torch.Tensor,
+        k: int,
+        nprobe: Optional[int] = None,
+        allowed: Optional[torch.Tensor] = None
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Return (similarities, node indices), both (num_queries, min(k, len(self))), most similar first.
+        Same signature as IVFExampleIndex.search: `nprobe` is ignored (the search
+        is exact) and `allowed` masks out nodes, whose slots come back as -inf / -1.
+        """
+        k = min(k, len(self))
+        similarity = F.normalize(queries.float(), dim=1) @ self.vectors.T
+        if allowed is not None:
+            similarity = similarity.masked_fill(~allowed[self.node_indices].unsqueeze(0), float('-inf'))
+        scores, rows = torch.topk(similarity, k, dim=1)
+        return scores, torch.where(torch.isinf(scores), -1, self.node_indices[rows])
+
+
+class IVFExampleIndex:
+    """
+    Inverted-file (IVF) approximate cosine-similarity index over example embeddings.
+
+    - The indexed vectors are clustered with spherical k-means into `num_lists`
+      lists; a query only scores the members of its `nprobe` closest lists.
+    - The vectors themselves are not copied: the index keeps the node features
+      it was built on (e.g. the memory-mapped data.x of a compiled graph) and
+      only stores centroids, list membership and per-vector inverse norms.
+    - With nprobe >= num_lists the search is exact.
+    """
+
+    def __init__(
+        self,
+        features: torch.Tensor,
+        centroids: torch.Tensor,
+        list_offsets: torch.Tensor,
+        list_nodes: torch.Tensor,
+        inv_norms: torch.Tensor
+    ):
+        self.features = features
+        self.centroids = centroids        # (num_lists, dim), unit norm
+        self.list_offsets = list_offsets  # (num_lists + 1,), list i is list_nodes[offsets[i]:offsets[i + 1]]
+        self.list_nodes = list_nodes      # node indices, grouped by list
+        self.inv_norms = inv_norms        # 1 / ||features[node]||, aligned with list_nodes
+        # Per-list (nodes, inv_norms) views, so a query only concatenates its probed lists
+        bounds = list_offsets.tolist()
+        self._lists = [
+            (list_nodes[start:stop], inv_norms[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+
+    def __len__(self) -> int:
+        return len(self.list_nodes)
+
+    @property
+    def num_lists(self) -> int:
+        return len(self.centroids)
+
+    @staticmethod
+    def _assign(vectors: torch.Tensor, centroids: torch.Tensor, chunk_size: int = 65536) -> torch.Tensor:
+        """Closest centroid of every (unit-norm) vector, in chunks to bound memory."""
+        return torch.cat([
+            (vectors[start:start + chunk_size] @ centroids.T).argmax(dim=1)
+            for start in range(0, len(vectors), chunk_size)
+        ]) if len(vectors) else torch.empty(0, dtype=torch.long)
+
+    @classmethod
+    def _from_assignment(
+        cls,
+        features: torch.Tensor,
+        centroids: torch.Tensor,
+        node_indices: torch.Tensor,
+        assignment: torch.Tensor
+    ) -> 'IVFExampleIndex':
+        order = torch.argsort(assignment, stable=True)
+        list_nodes = node_indices[order]
+        counts = torch.bincount(assignment, minlength=len(centroids))
+        list_offsets = torch.zeros(len(centroids) + 1, dtype=torch.long)
+        torch.cumsum(counts, dim=0, out=list_offsets[1:])
+        inv_norms = 1.0 / features[list_nodes].float().norm(dim=1).clamp(min=1e-12)
+        return cls(features, centroids, list_offsets, list_nodes, inv_norms)
+
+    @classmethod
+    def build(
+        cls,
+        features: torch.Tensor,
+        node_indices: torch.Tensor,
+        num_lists: Optional[int] = None,
+        num_iters: int = 10,
+        seed: int = 0
+    ) -> 'IVFExampleIndex':
+        """
+        Cluster features[node_indices] with spherical k-means (num_lists defaults
+        to about sqrt(n)) and group the nodes by their closest centroid.
+        """
+        vectors = F.normalize(features[node_indices].float(), dim=1)
+        n = len(vectors)
+        num_lists = max(1, min(n, num_lists or int(round(np.sqrt(n)))))
+
+        generator = torch.Generator().manual_seed(seed)
+        centroids = vectors[torch.randperm(n, generator=generator)[:num_lists]].clone()
+        for _ in range(num_iters):
+            assignment = cls._assign(vectors, centroids)
+            sums = torch.zeros_like(centroids).index_add_(0, assignment, vectors)
+            # Empty lists keep their previous centroid
+            nonempty = torch.bincount(assignment, minlength=num_lists) > 0
+            centroids[nonempty] = F.normalize(sums[nonempty], dim=1)
+
+        return cls._from_assignment(features, centroids, node_indices, cls._assign(vectors, centroids))
+
+    def add(self, features: torch.Tensor, node_indices: torch.Tensor) -> 'IVFExampleIndex':
+        """
+        Index with `node_indices` added to their closest existing lists (no re-clustering).
+        `features` must hold all nodes, old and new (e.g. the grown data.x).
+        """
+        old_assignment = torch.repeat_interleave(
+            torch.arange(self.num_lists), self.list_offsets[1:] - self.list_offsets[:-1]
+        )
+        new_assignment = self._assign(F.normalize(features[node_indices].float(), dim=1), self.centroids)
+        return self._from_assignment(
+            features,
+            self.centroids,
+            torch.cat([self.list_nodes, node_indices]),
+            torch.cat([old_assignment, new_assignment])
+        )
+
+    def search(
+        self,
+        queries: torch.Tensor,
+        k: int,
+        nprobe: int = 8,
+        allowed: Optional[torch.Tensor] = None
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Approximate top-k cosine neighbors of every query.
+        `allowed` is an optional boolean mask over nodes (e.g. data.train_mask)
+        restricting the results. Returns (similarities, node indices), both
+        (num_queries, k), most similar first; missing slots are -inf / -1.
+        """
+        queries = F.normalize(queries.float(), dim=1)
+        num_queries = len(queries)
+        nprobe = min(nprobe, self.num_lists)
+        probed = torch.topk(queries @ self.centroids.T, nprobe, dim=1).indices
+
+        # Group the (query, probe slot) pairs by list: every probed list is gathered
+        # and scored once, with one matmul for all the queries probing it
+        pairs_by_list = torch.argsort(probed.flatten(), stable=True)
+        list_ids, counts = torch.unique_consecutive(probed.flatten()[pairs_by_list], return_counts=True)
+        # Top-k of every (query, probe slot), merged into one top-k per query below
+        scores = torch.full((num_queries, nprobe, k), float('-inf'))
+        nodes = torch.full((num_queries, nprobe, k), -1, dtype=torch.long)
+        for list_id, pairs in zip(list_ids.tolist(), torch.split(pairs_by_list, counts.tolist())):
+            list_nodes, inv_norms = self._lists[list_id]
+            if len(list_nodes) == 0:
+                continue
+            rows, slots = pairs // nprobe, pairs % nprobe
+            similarity = (queries[rows] @ self.features[list_nodes].float().T) * inv_norms
+            if allowed is not None:
+                similarity = similarity.masked_fill(~allowed[list_nodes], float('-inf'))
+            top = torch.topk(similarity, min(k, len(list_nodes)), dim=1)
+            scores[rows, slots, :top.values.size(1)] = top.values
+            nodes[rows, slots, :top.values.size(1)] = list_nodes[top.indices]
+
+        scores, best = torch.topk(scores.view(num_queries, nprobe * k), k, dim=1)
+        nodes = torch.gather(nodes.view(num_queries, nprobe * k), 1, best)
+        # Disallowed candidates and empty slots both score -inf
+        return scores, torch.where(torch.isinf(scores), -1, nodes)
+
+    def save(self, path: str, meta: Optional[Dict[str, str]] = None) -> None:
+        """Write everything except the features (temp file + rename); `meta` is stored alongside."""
+        tmp_path = path + '.tmp.npz'
+        np.savez(
+            tmp_path,
+            centroids=self.centroids.numpy(),
+            list_offsets=self.list_offsets.numpy(),
+            list_nodes=self.list_nodes.numpy(),
+            inv_norms=self.inv_norms.numpy(),
+            **{f'meta_{key}': np.array(value) for key, value in (meta or {}).items()}
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, features: torch.Tensor) -> Tuple['IVFExampleIndex', Dict[str, str]]:
+        """Load an index written by save, on top of the same node `features`; returns (index, meta)."""
+        with np.load(path) as arrays:
+            index = cls(
+                features,
+                torch.from_numpy(arrays['centroids']),
+                torch.from_numpy(arrays['list_offsets']),
+                torch.from_numpy(arrays['list_nodes']),
+                torch.from_numpy(arrays['inv_norms'])
+            )
+            meta = {key[5:]: str(arrays[key]) for key in arrays.files if key.startswith('meta_')}
+        return index, meta
+
+
+def example_label_ids(data) -> torch.Tensor:
+    """
+    (num_nodes, 3) CF / IC / skill node id of every node's label, 0 where
+    not annotated (as in the CSV), recovered from the class indices in `data.y`.
+    """
+    from taxonomy import TASKS
+
+    columns = []
+    for column, task in enumerate(TASKS):
+        task_ids = torch.tensor(data.taxonomy.ids(task))
+        class_idx = data.y[:, column].long()
+        columns.append(torch.where(class_idx >= 0, task_ids[class_idx.clamp(min=0)], 0))
+    return torch.stack(columns, dim=1)
+
+
+def query_examples(
+    index: IVFExampleIndex,
+    data,
+    queries: torch.Tensor,
+    k: int = 5,
+    nprobe: int = 8,
+    allowed: Optional[torch.Tensor] = None
+) -> List[List[Dict]]:
+    """Top-k labeled neighbors of every query: node, original id, similarity and CF/IC/skill ids."""
+    scores, nodes = index.search(queries, k, nprobe=nprobe, allowed=allowed)
+    label_ids = example_label_ids(data)
+    results = []
+    for query_scores, query_nodes in zip(scores.tolist(), nodes.tolist()):
+        results.append([
+            {
+                'node': node,
+                'id': int(data.node_ids[node]),
+                'score': score,
+                'CF_id': int(label_ids[node, 0]),
+                'IC_id': int(label_ids[node, 1]),
+                'skill_id': int(label_ids[node, 2])
+            }
+            for score, node in zip(query_scores, query_nodes) if node >= 0
+        ])
+    return results
+
+
+class KNNVoteClassifier(torch.nn.Module):
+    """
+    Retrieval baseline: every task's probabilities are the similarity-weighted
+    vote of the k nearest labeled examples (restricted to `allowed` nodes).
+    Same forward signature as the edge-free model, so predict_texts can use it.
+    """
+
+    def __init__(
+        self,
+        index: IVFExampleIndex,
+        data,
+        k: int = 10,
+        nprobe: int = 8,
+        allowed: Optional[torch.Tensor] = None
+    ):
+        super().__init__()
+        self.index = index
+        # Votes are summed over dense rows, so expand the class indices once
+        self.labels = data.taxonomy.multi_hot(data.y)
+        self.k = k
+        self.nprobe = nprobe
+        self.allowed = allowed
+        self.label_sizes = list(data.taxonomy.label_sizes)
+
+    def forward(
+        self,
+        x: torch.Tensor,
+        edge_index: torch.Tensor = None,
+        return_logits: bool = True
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Per-task vote shares; with return_logits their logs (so argmax/softmax behave as for the model)."""
+        if edge_index is not None:
+            raise ValueError("KNNVoteClassifier does not do message passing, call it with edge_index=None")
+        scores, nodes = self.index.search(x, self.k, nprobe=self.nprobe, allowed=self.allowed)
+        found = nodes >= 0
+        # Shift cosine similarities into [0, 2] so every found neighbor votes positively
+        weights = torch.where(found, scores + 1.0, torch.zeros_like(scores))
+        votes = (weights.unsqueeze(-1) * self.labels[nodes.clamp(min=0)]).sum(dim=1)
+
+        outputs = []
+        for segment in torch.split(votes, self.label_sizes, dim=1):
+            # Uniform when no neighbor carries a label for this task
+            probs = (segment + 1e-6) / (segment + 1e-6).sum(dim=1, keepdim=True)
+            outputs.append(probs.log() if return_logits else probs)
+        return tuple(outputs)
@@ -0,0 +1,207 @@
+# export.py
+import argparse
+import sys
+from typing import Dict, List, Tuple
+
+import torch
+
+from data_loading import DEFAULT_ENCODER, TherapeuticDataset
+from eval import load_classifier
+from model import EdgeFreeTherapeuticClassifier
+from taxonomy import Taxonomy
+
+OUTPUT_NAMES = ['factor_probs', 'ic_probs', 'skill_probs']
+
+
+class ProbabilityClassifier(torch.nn.Module):
+    """
+    EdgeFreeTherapeuticClassifier returning probabilities from a features-only
+    forward, so tracing sees no Python flags. Its heads are already fused, so
+    scoring is one matmul per layer plus one for all heads.
+    """
+    def __init__(self, classifier: EdgeFreeTherapeuticClassifier):
+        super().__init__()
+        self.classifier = classifier
+
+    def forward(self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        return self.classifier(x, return_logits=False)
+
+
+class PooledEncoderClassifier(torch.nn.Module):
+    """Token ids -> encoder -> masked mean pooling -> ProbabilityClassifier, as one graph."""
+    def __init__(self, encoder: torch.nn.Module, classifier: ProbabilityClassifier):
+        super().__init__()
+        self.encoder = encoder
+        self.classifier = classifier
+
+    def forward(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        # Same pooling as TherapeuticDataset._encode_tokenized
+        # return_dict=False gives plain tuples, which tracing needs
+        hidden = self.encoder(input_ids=input_ids, attention_mask=attention_mask, return_dict=False)[0]
+        mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        return self.classifier(pooled)
+
+
+def build_export_module(
+    weights_path: str,
+    dataset: TherapeuticDataset,
+    with_encoder: bool = False
+) -> torch.nn.Module:
+    """The module to export: the fused classifier, optionally behind the pooling encoder."""
+    classifier = ProbabilityClassifier(
+        load_classifier(weights_path, in_channels=dataset.hidden_size, taxonomy=dataset.taxonomy)
+    )
+    if not with_encoder:
+        return classifier.eval()
+    return PooledEncoderClassifier(dataset.bert_model, classifier).eval()
+
+
+def export_inputs(dataset: TherapeuticDataset, texts: List[str], with_encoder: bool) -> Dict[str, torch.Tensor]:
+    """Model inputs for `texts`: pooled features, or padded token ids and mask."""
+    if not with_encoder:
+        return {'features': dataset.encode_new_texts(texts)}
+    batch = dataset.tokenizer(
+        texts, truncation=True, max_length=dataset.max_length, padding=True, return_tensors='pt'
+    )
+    return {'input_ids': batch['input_ids'], 'attention_mask': batch['attention_mask']}
+
+
+def export_torchscript(module: torch.nn.Module, inputs: Dict[str, torch.Tensor], path: str) -> torch.jit.ScriptModule:
+    """Trace `module` (the Python loop and head split are unrolled) and save it for torch.jit.load."""
+    with torch.no_grad():
+        traced = torch.jit.trace(module, tuple(inputs.values()))
+    traced = torch.jit.freeze(traced.eval())
+    traced.save(path)
+    return traced
+
+
+def export_onnx(module: torch.nn.Module, inputs: Dict[str, torch.Tensor], path: str) -> None:
+    """Export to ONNX with dynamic batch (and sequence) dimensions. Needs the onnx package."""
+    dynamic_axes = {name: {0: 'batch'} for name in OUTPUT_NAMES}
+    for name in inputs:
+        dynamic_axes[name] = {0: 'batch', 1: 'sequence'} if name != 'features' else {0: 'batch'}
+    try:
+        with torch.no_grad():
+            torch.onnx.export(
+                module,
+                tuple(inputs.values()),
+                path,
+                input_names=list(inputs),
+                output_names=OUTPUT_NAMES,
+                dynamic_axes=dynamic_axes,
+                dynamo=False
+            )
+    except (ImportError, torch.onnx.OnnxExporterError) as e:
+        raise ImportError(f"ONNX export requires the onnx package (pip install onnx): {e}")
+
+
+def reference_outputs(
+    weights_path: str,
+    dataset: TherapeuticDataset,
+    texts: List[str]
+) -> Tuple[torch.Tensor, ...]:
+    """
+    Probabilities from the un-exported edge-free PyTorch path (what
+    predict_texts uses). Its heads are fused like the exported ones, so this
+    checks the export only; tests/test_export.py compares the exports with
+    separate heads.
+    """
+    classifier = load_classifier(weights_path, in_channels=dataset.hidden_size, taxonomy=dataset.taxonomy)
+    with torch.no_grad():
+        return classifier(dataset.encode_new_texts(texts), edge_index=None, return_logits=False)
+
+
+def max_abs_diff(expected: Tuple[torch.Tensor, ...], actual: Tuple[torch.Tensor, ...]) -> float:
+    return max((e - torch.as_tensor(a)).abs().max().item() for e, a in zip(expected, actual))
+
+
+def check_parity(
+    weights_path: str,
+    dataset: TherapeuticDataset,
+    texts: List[str],
+    with_encoder: bool,
+    torchscript_path: str = None,
+    onnx_path: str = None
+) -> Dict[str, float]:
+    """
+    Score `texts` (use a different batch than the export inputs, so dynamic
+    shapes are exercised) with the reference path and each exported model;
+    returns the largest absolute probability difference per format.
+    """
+    expected = reference_outputs(weights_path, dataset, texts)
+    inputs = export_inputs(dataset, texts, with_encoder)
+    diffs = {}
+    if torchscript_path is not None:
+        with torch.no_grad():
+            diffs['torchscript'] = max_abs_diff(expected, torch.jit.load(torchscript_path)(*inputs.values()))
+    if onnx_path is not None:
+        try:
+            import onnxruntime
+        except ImportError:
+            print("onnxruntime is not installed, skipping the ONNX parity check")
+        else:
+            session = onnxruntime.InferenceSession(onnx_path)
+            feeds = {name: tensor.numpy() for name, tensor in inputs.items()}
+            diffs['onnx'] = max_abs_diff(expected, session.run(OUTPUT_NAMES, feeds))
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the edge-free inference path to TorchScript / ONNX")
+    parser.add_argument('--weights', default='enhanced_therapeutic_gnn.pth')
+    parser.add_argument('--csv', default='data/htc_examples_ids.csv', help="Texts used for tracing and the parity check")
+    parser.add_argument('--encoder', default=DEFAULT_ENCODER, help="Text encoder the weights were trained with")
+    parser.add_argument('--taxonomy', default=None, help="Label taxonomy (.json or .cypher) the weights were trained with")
+    parser.add_argument(
+        '--with-encoder', action='store_true',
+        help="Include the encoder and pooling: inputs are token ids and attention mask instead of features"
+    )
+    parser.add_argument('--format', nargs='+', choices=['torchscript', 'onnx'], default=['torchscript', 'onnx'])
+    parser.add_argument('--output-prefix', default='therapeutic_classifier')
+    parser.add_argument('--atol', type=float, default=1e-5, help="Parity tolerance on probabilities")
+    args = parser.parse_args()
+
+    # The embedding cache is bypassed so the reference sees exactly what the encoder computes
+    dataset = TherapeuticDataset(
+        args.csv,
+        cache_dir=None,
+        model_name=args.encoder,
+        taxonomy=Taxonomy.load(args.taxonomy) if args.taxonomy else None
+    )
+    texts = list(dataset.examples.texts())
+    trace_texts, check_texts = texts[:8], texts[8:]
+
+    module = build_export_module(args.weights, dataset, args.with_encoder)
+    inputs = export_inputs(dataset, trace_texts, args.with_encoder)
+    suffix = '_with_encoder' if args.with_encoder else ''
+
+    paths = {}
+    if 'torchscript' in args.format:
+        paths['torchscript_path'] = f"{args.output_prefix}{suffix}.pt"
+        export_torchscript(module, inputs, paths['torchscript_path'])
+        print(f"Wrote {paths['torchscript_path']}")
+    if 'onnx' in args.format:
+        paths['onnx_path'] = f"{args.output_prefix}{suffix}.onnx"
+        try:
+            export_onnx(module, inputs, paths['onnx_path'])
+            print(f"Wrote {paths['onnx_path']}")
+        except ImportError as e:
+            print(f"Skipping ONNX: {e}")
+            del paths['onnx_path']
+
+    diffs = check_parity(args.weights, dataset, check_texts or trace_texts, args.with_encoder, **paths)
+    failed = False
+    for fmt, diff in diffs.items():
+        ok = diff <= args.atol
+        failed = failed or not ok
+        print(f"Parity {fmt}: max abs diff {diff:.2e} ({'OK' if ok else 'FAILED'})")
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+# graph_inference.py
+import hashlib
+import json
+import os
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from example_index import ExactExampleIndex
+from model import EnhancedTherapeuticGNN
+
+if TYPE_CHECKING:
+    from example_index import IVFExampleIndex
+
+# Cached per-layer states: one (projected, src_scores) pair per GATConv layer
+LayerStates = Tuple[List[torch.Tensor], List[torch.Tensor]]
+
+
+def compute_layer_states(model: EnhancedTherapeuticGNN, data) -> LayerStates:
+    """
+    Every layer's projected inputs lin(h_{l-1}) and source attention scores for
+    all nodes of `data`: one full-graph forward pass.
+    """
+    projected_states: List[torch.Tensor] = []
+    src_scores: List[torch.Tensor] = []
+    h = data.x
+    with torch.no_grad():
+        for conv in model.conv_layers:
+            projected = conv.lin(h)
+            projected_states.append(projected)
+            src_scores.append((projected * conv.att_src.view(1, -1)).sum(dim=-1))
+            h = F.relu(conv(h, data.edge_index))
+    return projected_states, src_scores
+
+
+def layers_fingerprint(model: EnhancedTherapeuticGNN) -> str:
+    """SHA-256 of the GATConv weights, the only part of the model the cached states depend on."""
+    digest = hashlib.sha256()
+    for name, tensor in model.conv_layers.state_dict().items():
+        digest.update(name.encode('utf-8'))
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()
+
+
+def save_layer_states(path: str, states: LayerStates, fingerprint: str) -> None:
+    """Write the cached states (temp file + rename) with the fingerprint they belong to."""
+    projected_states, src_scores = states
+    tmp_path = path + '.tmp.npz'
+    np.savez(
+        tmp_path,
+        fingerprint=np.array(fingerprint),
+        **{f'projected_{i}': projected.numpy() for i, projected in enumerate(projected_states)},
+        **{f'src_scores_{i}': scores.numpy() for i, scores in enumerate(src_scores)}
+    )
+    os.replace(tmp_path, path)
+
+
+def load_layer_states(path: str, fingerprint: str) -> Optional[LayerStates]:
+    """States written by save_layer_states, or None if missing or saved for other weights/another graph."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as arrays:
+        if str(arrays['fingerprint']) != fingerprint:
+            return None
+        num_layers = sum(1 for key in arrays.files if key.startswith('projected_'))
+        return (
+            [torch.from_numpy(arrays[f'projected_{i}']) for i in range(num_layers)],
+            [torch.from_numpy(arrays[f'src_scores_{i}']) for i in range(num_layers)]
+        )
+
+
+class GraphAwarePredictor(torch.nn.Module):
+    """
+    Graph-aware scoring of new texts without touching the graph.
+
+    Each new text becomes a virtual node that receives edges from its k nearest
+    indexed examples (plus its self-loop), and only that node's computation is
+    run through the GATConv layers:
+
+    - Per-layer inputs of all existing nodes are cached already projected by
+      each layer's `lin` together with their source attention scores
+      (compute_layer_states, or `states` loaded from disk).
+    - The new node only receives messages, so the cached states of existing
+      nodes stay exact; with the IVF index a request costs one probe of
+      `nprobe` lists plus O(k * hidden) per layer, independent of the graph size.
+    - Neighbors are restricted to the `allowed` nodes (e.g. data.train_mask).
+
+    Has the forward signature of EnhancedTherapeuticGNN with edge_index=None, so
+    it can stand in for the model in eval.predict_texts, serve.py and score.py.
+    """
+
+    def __init__(
+        self,
+        model: EnhancedTherapeuticGNN,
+        data,
+        index: 'IVFExampleIndex',
+        k: int = 10,
+        nprobe: int = 8,
+        allowed: Optional[torch.Tensor] = None,
+        states: Optional[LayerStates] = None
+    ):
+        super().__init__()
+        for conv in model.conv_layers:
+            if conv.heads != 1:
+                raise ValueError("GraphAwarePredictor supports single-head GATConv layers only")
+        self.model = model.eval()
+        self.index = index
+        self.k = k
+        self.nprobe = nprobe
+        self.allowed = allowed
+
+        # Layer l's projected inputs lin(h_{l-1}) and source attention scores, for every node
+        self.projected, self.src_scores = states if states is not None else compute_layer_states(model, data)
+
+    def _attach(self, conv, layer: int, h: torch.Tensor, neighbors: torch.Tensor) -> torch.Tensor:
+        """
+        One GATConv step for the new nodes `h` (b, in) with incoming edges from
+        `neighbors` (b, k); slots of -1 (fewer than k neighbors found) are skipped.
+        """
+        projected = conv.lin(h)                                              # (b, C)
+        dst_score = (projected * conv.att_dst.view(1, -1)).sum(dim=-1)       # (b,)
+        self_score = (projected * conv.att_src.view(1, -1)).sum(dim=-1)      # (b,)
+
+        # Sources: the k neighbors, then the self-loop
+        found = neighbors >= 0
+        neighbors = neighbors.clamp(min=0)
+        sources = torch.cat([self.projected[layer][neighbors], projected.unsqueeze(1)], dim=1)
+        scores = torch.cat([self.src_scores[layer][neighbors], self_score.unsqueeze(1)], dim=1)
+        scores = F.leaky_relu(scores + dst_score.unsqueeze(1), conv.negative_slope)
+        scores[:, :-1] = scores[:, :-1].masked_fill(~found, float('-inf'))
+        alpha = F.softmax(scores, dim=1)
+        return (alpha.unsqueeze(-1) * sources).sum(dim=1) + conv.bias
+
+    def forward(
+        self,
+        x: torch.Tensor,
+        edge_index: torch.Tensor = None,
+        return_logits: bool = True
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Score new-text features `x` (b, in_channels); only edge_index=None is supported."""
+        if edge_index is not None:
+            raise ValueError("GraphAwarePredictor builds its own edges, call it with edge_index=None")
+
+        _, neighbors = self.index.search(x, self.k, nprobe=self.nprobe, allowed=self.allowed)
+        h = x
+        for layer, conv in enumerate(self.model.conv_layers):
+            h = F.relu(self._attach(conv, layer, h, neighbors))
+
+        return self.model.heads(h, return_logits)
+
+
+def build_graph_aware_predictor(
+    model: EnhancedTherapeuticGNN,
+    data,
+    k: int = 10,
+    index: Optional['IVFExampleIndex'] = None,
+    nprobe: int = 8,
+    states: Optional[LayerStates] = None
+) -> GraphAwarePredictor:
+    """
+    Predictor whose new nodes attach to their k nearest training examples.
+    `index` is the prebuilt ANN index over the example nodes (see
+    compile_graph.load_example_index); without one, an exact index over the
+    training examples is built as a fallback, at O(num_examples) per request.
+    """
+    if index is None:
+        index = ExactExampleIndex(data.x, data.train_idx)
+    return GraphAwarePredictor(model, data, index, k=k, nprobe=nprobe, allowed=data.train_mask, states=states)
+
+
+def cached_layer_states(model: EnhancedTherapeuticGNN, data, artifact_path: str) -> LayerStates:
+    """
+    Layer states of the compiled graph at `artifact_path` (loaded as `data`),
+    kept next to it in `<artifact>.states.npz`. They are recomputed (one
+    full-graph forward pass) only when missing or saved for other GATConv
+    weights or another version of the graph.
+    """
+    from compile_graph import read_header
+
+    header, _ = read_header(artifact_path)
+    # The states depend on the graph (source CSV, encoder, taxonomy) and the GATConv weights
+    graph_key = json.dumps({'csv_sha256': header['csv_sha256'], 'meta': header['meta']}, sort_keys=True)
+    fingerprint = hashlib.sha256(graph_key.encode('utf-8')).hexdigest() + ':' + layers_fingerprint(model)
+    states_path = artifact_path + '.states.npz'
+    states = load_layer_states(states_path, fingerprint)
+    if states is None:
+        states = compute_layer_states(model, data)
+        save_layer_states(states_path, states, fingerprint)
+    return states
@@ -1,9 +1,47 @@
 # model.py
 import torch
 import torch.nn.functional as F
-from torch_geometric.nn import GATConv
 from torch.nn import Linear, ModuleList
-from typing import Tuple
+from typing import Dict, Sequence, Tuple
+
+# Names of the three task heads before they were fused, as they appear in older state_dicts
+HEAD_NAMES = ('factors_classifier', 'intervention_concepts_classifier', 'skills_classifier')
+# Name of the fused head Linear inside both model classes
+FUSED_HEAD_NAME = 'heads.linear'
+
+def fuse_legacy_heads(state_dict: Dict[str, torch.Tensor], prefix: str = '') -> Dict[str, torch.Tensor]:
+    """
+    Rewrite the separate `<head>.weight` / `<head>.bias` entries of an older
+    state_dict (in place) into the fused `heads.linear` ones, concatenated in
+    HEAD_NAMES order. State_dicts that are already fused are left as they are.
+    """
+    if f'{prefix}{HEAD_NAMES[0]}.weight' not in state_dict:
+        return state_dict
+    for param in ('weight', 'bias'):
+        state_dict[f'{prefix}{FUSED_HEAD_NAME}.{param}'] = torch.cat([
+            state_dict.pop(f'{prefix}{head}.{param}') for head in HEAD_NAMES
+        ])
+    return state_dict
+
+class FusedTaskHeads(torch.nn.Module):
+    """
+    The CF / IC / skill heads as one Linear into the concatenated outputs.
+
+    Scoring is a single matmul and the per-task outputs are views into it.
+    Probabilities are a segmented softmax: each task's slice is normalized on
+    its own. (One softmax over a -inf padded (n, tasks, max size) layout was
+    measured slower on CPU than the per-slice softmaxes, due to the gathers.)
+    """
+    def __init__(self, in_features: int, head_sizes: Sequence[int]):
+        super().__init__()
+        self.head_sizes = list(head_sizes)
+        self.linear = Linear(in_features, sum(self.head_sizes))
+    
+    def forward(self, x: torch.Tensor, return_logits: bool = True) -> Tuple[torch.Tensor, ...]:
+        outputs = torch.split(self.linear(x), self.head_sizes, dim=-1)
+        if return_logits:
+            return outputs
+        return tuple(F.softmax(output, dim=-1) for output in outputs)
 
 class EnhancedTherapeuticGNN(torch.nn.Module):
     def __init__(
@@ -17,6 +55,8 @@ class EnhancedTherapeuticGNN(torch.nn.Module):
         dropout: float = 0.5
     ):
         super().__init__()
+        # Imported here so the edge-free classifier below can be used without torch_geometric
+        from torch_geometric.nn import GATConv
         
         self.num_layers = num_layers
         self.dropout = dropout
@@ -27,10 +67,13 @@ class EnhancedTherapeuticGNN(torch.nn.Module):
         for _ in range(num_layers - 1):
             self.conv_layers.append(GATConv(hidden_channels, hidden_channels))
         
-        # Task-specific layers
-        self.factors_classifier = Linear(hidden_channels, num_common_factors)
-        self.intervention_concepts_classifier = Linear(hidden_channels, num_intervention_concepts)
-        self.skills_classifier = Linear(hidden_channels, num_skills)
+        # Task-specific layers, fused into one Linear
+        self.heads = FusedTaskHeads(hidden_channels, [num_common_factors, num_intervention_concepts, num_skills])
+    
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # state_dicts saved before the heads were fused still load
+        fuse_legacy_heads(state_dict, prefix)
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
     
     def forward(
         self,
@@ -61,15 +104,113 @@ class EnhancedTherapeuticGNN(torch.nn.Module):
             x = F.relu(x)
             x = F.dropout(x, p=self.dropout, training=self.training)
         
-        # Get predictions
-        factors_output = self.factors_classifier(x)
-        intervention_concepts_output = self.intervention_concepts_classifier(x)
-        skills_output = self.skills_classifier(x)
+        # Get predictions: logits or per-task probabilities based on flag
+        return self.heads(x, return_logits)
+
+
+class EdgeFreeTherapeuticClassifier(torch.nn.Module):
+    """
+    The `edge_index=None` path of EnhancedTherapeuticGNN as plain linear layers.
+
+    Uses the same weights (each GATConv's `lin` weight, then the three task
+    heads) and gives the same outputs, but needs neither torch_geometric nor
+    the GAT attention parameters. Meant for fast-start inference on new texts.
+    """
+    def __init__(
+        self,
+        in_channels: int,
+        hidden_channels: int,
+        num_common_factors: int = 3,
+        num_intervention_concepts: int = 2,
+        num_skills: int = 7,
+        num_layers: int = 2
+    ):
+        super().__init__()
         
-        # Return logits or probabilities based on flag
-        if not return_logits:
-            factors_output = F.softmax(factors_output, dim=-1)
-            intervention_concepts_output = F.softmax(intervention_concepts_output, dim=-1)
-            skills_output = F.softmax(skills_output, dim=-1)
-            
-        return factors_output, intervention_concepts_output, skills_output
\ No newline at end of file
+        self.num_layers = num_layers
+        
+        # GATConv.lin has no bias, so neither do these
+        self.layers = ModuleList()
+        self.layers.append(Linear(in_channels, hidden_channels, bias=False))
+        for _ in range(num_layers - 1):
+            self.layers.append(Linear(hidden_channels, hidden_channels, bias=False))
+        
+        self.heads = FusedTaskHeads(hidden_channels, [num_common_factors, num_intervention_concepts, num_skills])
+    
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        fuse_legacy_heads(state_dict, prefix)
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+    
+    @classmethod
+    def from_gnn_state_dict(
+        cls,
+        state_dict: Dict[str, torch.Tensor],
+        head_sizes: Sequence[int] = (3, 2, 7)
+    ) -> 'EdgeFreeTherapeuticClassifier':
+        """
+        Build from an EnhancedTherapeuticGNN state_dict, keeping only the weights this path uses.
+        A fused state_dict does not record where one head ends and the next
+        starts, so `head_sizes` is used for it; older ones carry their own sizes.
+        """
+        num_layers = 0
+        while f'conv_layers.{num_layers}.lin.weight' in state_dict:
+            num_layers += 1
+        hidden_channels, in_channels = state_dict['conv_layers.0.lin.weight'].shape
+        if f'{HEAD_NAMES[0]}.weight' in state_dict:
+            head_sizes = [state_dict[f'{head}.weight'].size(0) for head in HEAD_NAMES]
+        
+        model = cls(
+            in_channels=in_channels,
+            hidden_channels=hidden_channels,
+            num_common_factors=head_sizes[0],
+            num_intervention_concepts=head_sizes[1],
+            num_skills=head_sizes[2],
+            num_layers=num_layers
+        )
+        own_state = {
+            f'layers.{i}.weight': state_dict[f'conv_layers.{i}.lin.weight']
+            for i in range(num_layers)
+        }
+        for head in HEAD_NAMES + (FUSED_HEAD_NAME,):
+            for param in ('weight', 'bias'):
+                if f'{head}.{param}' in state_dict:
+                    own_state[f'{head}.{param}'] = state_dict[f'{head}.{param}']
+        model.load_state_dict(own_state)
+        model.eval()
+        return model
+    
+    def forward(
+        self,
+        x: torch.Tensor,
+        edge_index: torch.Tensor = None,
+        return_logits: bool = True
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Same signature as EnhancedTherapeuticGNN.forward; only edge_index=None is supported."""
+        if edge_index is not None:
+            raise ValueError("EdgeFreeTherapeuticClassifier does not do message passing, use EnhancedTherapeuticGNN")
+        
+        for layer in self.layers:
+            x = F.relu(layer(x))
+        
+        return self.heads(x, return_logits)
+
+
+def quantize_heads(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Copy of `model` with the fused task heads dynamically quantized to int8
+    (int8 weights, activations quantized per batch). Works for both model classes.
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {FUSED_HEAD_NAME}, dtype=torch.qint8)
+
+
+def unfuse_heads(state_dict: Dict[str, torch.Tensor], head_sizes: Sequence[int]) -> Dict[str, torch.Tensor]:
+    """
+    Copy of a fused state_dict in the layout saved before the heads were
+    fused: `heads.linear` split back into the three HEAD_NAMES Linears.
+    """
+    legacy = dict(state_dict)
+    for param in ('weight', 'bias'):
+        parts = torch.split(legacy.pop(f'{FUSED_HEAD_NAME}.{param}'), list(head_sizes))
+        for head, part in zip(HEAD_NAMES, parts):
+            legacy[f'{head}.{param}'] = part.clone()
+    return legacy
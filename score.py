@@ -0,0 +1,343 @@
+# score.py
+import argparse
+import csv
+import io
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import torch
+
+from compile_graph import hash_file
+from data_loading import DEFAULT_ENCODER, PRECISIONS, TherapeuticDataset
+from eval import load_trained_model
+from taxonomy import TASKS, Taxonomy
+
+
+def _column_name(prefix: str, name: str) -> str:
+    return f"{prefix}_{name.lower().replace(' ', '_').replace('-', '_')}"
+
+
+def output_columns(taxonomy: Taxonomy) -> List[str]:
+    """Output header: row, id, one probability column per class of the taxonomy, then the top class per task."""
+    return (
+        ['row', 'id']
+        + [_column_name('cf', name) for name in taxonomy.names('factor')]
+        + [_column_name('ic', name) for name in taxonomy.names('ic')]
+        + [_column_name('skill', name) for name in taxonomy.names('skill')]
+        + ['top_cf', 'top_ic', 'top_skill']
+    )
+
+
+# ----------------------------------------------------------------------
+# Input
+# ----------------------------------------------------------------------
+def iter_records(
+    input_path: str,
+    text_column: str = 'text',
+    id_column: str = 'id',
+    skip: int = 0
+) -> Iterator[Tuple[str, str]]:
+    """
+    Stream (id, text) pairs from a CSV or JSONL (.jsonl/.json) file,
+    skipping the first `skip` records (used when resuming).
+    """
+    with open(input_path, mode='r', encoding='utf-8', newline='') as infile:
+        if input_path.endswith(('.jsonl', '.json')):
+            records = (json.loads(line) for line in infile if line.strip())
+        else:
+            records = csv.DictReader(infile)
+        for record in islice(records, skip, None):
+            yield str(record.get(id_column, '')), record.get(text_column) or ''
+
+
+def iter_chunks(records: Iterator, chunk_size: int) -> Iterator[List]:
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# ----------------------------------------------------------------------
+# Tokenization workers
+# ----------------------------------------------------------------------
+_worker_tokenizer = None
+_worker_max_length = None
+
+
+def _init_tokenizer_worker(model_name: str, max_length: int) -> None:
+    global _worker_tokenizer, _worker_max_length
+    from transformers import AutoTokenizer
+    torch.set_num_threads(1)
+    _worker_tokenizer = AutoTokenizer.from_pretrained(model_name)
+    _worker_max_length = max_length
+
+
+def _tokenize_in_worker(texts: List[str]) -> Dict[str, List]:
+    encodings = _worker_tokenizer(texts, truncation=True, max_length=_worker_max_length)
+    return dict(encodings)
+
+
+def iter_tokenized(
+    dataset: TherapeuticDataset,
+    chunks: Iterator[List],
+    num_workers: int = 0
+) -> Iterator[Tuple[List, Dict]]:
+    """
+    Yield (chunk, encodings). With num_workers > 0 tokenization runs in a
+    process pool, at most num_workers + 1 chunks ahead of the encoder, so
+    memory stays bounded by chunk_size.
+    """
+    if num_workers <= 0:
+        for chunk in chunks:
+            yield chunk, dataset._tokenize([text for _, text in chunk])
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_tokenizer_worker,
+        initargs=(dataset.model_name, dataset.max_length)
+    ) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, pool.submit(_tokenize_in_worker, [text for _, text in chunk])))
+            if len(pending) > num_workers:
+                chunk, future = pending.popleft()
+                yield chunk, future.result()
+        while pending:
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
+
+
+# ----------------------------------------------------------------------
+# Output
+# ----------------------------------------------------------------------
+def _progress_path(output_path: str) -> str:
+    return output_path + '.progress.json'
+
+
+def load_progress(output_path: str) -> Optional[Dict]:
+    path = _progress_path(output_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, mode='r', encoding='utf-8') as infile:
+        return json.load(infile)
+
+
+def save_progress(output_path: str, progress: Dict) -> None:
+    path = _progress_path(output_path)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode='w', encoding='utf-8') as outfile:
+        json.dump(progress, outfile)
+    os.replace(tmp_path, path)
+
+
+class CsvScoreWriter:
+    """Appends scored rows to a CSV; `position` is the byte offset just past the last complete chunk."""
+
+    def __init__(self, path: str, progress: Optional[Dict], columns: List[str]):
+        if progress is not None:
+            # Drop anything written after the last recorded chunk
+            self.buffer = open(path, mode='r+b')
+            self.buffer.seek(progress['position'])
+            self.buffer.truncate()
+        else:
+            self.buffer = open(path, mode='wb')
+        # Text is written through a wrapper over the binary file, whose tell() is a real byte offset
+        self.file = io.TextIOWrapper(self.buffer, encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        if progress is None:
+            self.writer.writerow(columns)
+            self.file.flush()
+
+    @property
+    def position(self) -> int:
+        return self.buffer.tell()
+
+    def write(self, rows: List[List]) -> None:
+        self.writer.writerows(rows)
+        self.file.flush()
+        os.fsync(self.buffer.fileno())
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ParquetScoreWriter:
+    """
+    Writes every chunk as its own file `<path>/part-<n>.parquet`;
+    `position` is the number of complete parts. Needs pyarrow.
+    """
+
+    def __init__(self, path: str, progress: Optional[Dict], columns: List[str]):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet output requires pyarrow (pip install pyarrow), or use a .csv output")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.columns = columns
+        self.num_parts = progress['position'] if progress is not None else 0
+        os.makedirs(path, exist_ok=True)
+        # Parts beyond the recorded position were written by an interrupted run
+        for name in os.listdir(path):
+            if name.startswith('part-') and int(name[5:10]) >= self.num_parts:
+                os.remove(os.path.join(path, name))
+
+    @property
+    def position(self) -> int:
+        return self.num_parts
+
+    def write(self, rows: List[List]) -> None:
+        table = self.pa.table({name: [row[i] for row in rows] for i, name in enumerate(self.columns)})
+        self.pq.write_table(table, os.path.join(self.path, f"part-{self.num_parts:05d}.parquet"))
+        self.num_parts += 1
+
+    def close(self) -> None:
+        pass
+
+
+# ----------------------------------------------------------------------
+# Scoring
+# ----------------------------------------------------------------------
+def score_chunk(model, dataset: TherapeuticDataset, chunk: List, encodings, first_row: int) -> List[List]:
+    """Encode one tokenized chunk, score it with the edge-free forward pass and build output rows."""
+    features = dataset._encode_tokenized(encodings)
+    with torch.no_grad():
+        factor_probs, ic_probs, skill_probs = model(features, edge_index=None, return_logits=False)
+    top = [
+        probs.argmax(dim=1).tolist() for probs in (factor_probs, ic_probs, skill_probs)
+    ]
+    probs = torch.cat([factor_probs, ic_probs, skill_probs], dim=1).tolist()
+    factor_names, ic_names, skill_names = (dataset.taxonomy.names(task) for task in TASKS)
+    return [
+        [first_row + i, record_id] + probs[i] + [
+            factor_names[top[0][i]],
+            ic_names[top[1][i]],
+            skill_names[top[2][i]]
+        ]
+        for i, (record_id, _) in enumerate(chunk)
+    ]
+
+
+def scoring_settings(dataset: TherapeuticDataset, weights_path: Optional[str] = None) -> Dict:
+    """Everything besides the input that decides the output rows, as recorded in the progress file."""
+    return {
+        'weights_sha256': hash_file(weights_path) if weights_path is not None else None,
+        'encoder': dataset.model_name,
+        'precision': dataset.precision,
+        'taxonomy': dataset.taxonomy.to_dict()
+    }
+
+
+def score_file(
+    model,
+    dataset: TherapeuticDataset,
+    input_path: str,
+    output_path: str,
+    text_column: str = 'text',
+    chunk_size: int = 1024,
+    num_workers: int = 0,
+    resume: bool = True,
+    weights_path: Optional[str] = None
+) -> int:
+    """
+    Score every text in `input_path` and write CF/IC/skill probabilities to
+    `output_path` (CSV, or a directory of Parquet parts if it ends in .parquet).
+
+    Output is written chunk by chunk, and a `<output>.progress.json` file
+    records how far it got. With resume=True an interrupted run continues
+    from the last complete chunk, unless the input or the scoring settings
+    (the `weights_path` file contents, encoder, precision, taxonomy) differ
+    from the recorded ones; then it starts over. Returns the total number of
+    rows scored.
+    """
+    model.eval()
+    settings = scoring_settings(dataset, weights_path)
+    progress = load_progress(output_path) if resume else None
+    if progress is not None and progress.get('input') != os.path.abspath(input_path):
+        print(f"Warning: {output_path} was produced from {progress.get('input')}, starting over")
+        progress = None
+    if progress is not None and progress.get('settings') != settings:
+        changed = [name for name in settings if (progress.get('settings') or {}).get(name) != settings[name]]
+        print(f"Warning: {output_path} was produced with another {', '.join(changed)}, starting over")
+        progress = None
+    if progress is not None and progress.get('complete'):
+        print(f"{output_path} is already complete ({progress['rows']} rows)")
+        return progress['rows']
+
+    writer_cls = ParquetScoreWriter if output_path.endswith('.parquet') else CsvScoreWriter
+    writer = writer_cls(output_path, progress, output_columns(dataset.taxonomy))
+    rows_done = progress['rows'] if progress is not None else 0
+    if rows_done:
+        print(f"Resuming after {rows_done} rows")
+
+    def record_progress(complete: bool) -> None:
+        save_progress(output_path, {
+            'input': os.path.abspath(input_path),
+            'settings': settings,
+            'rows': rows_done,
+            'position': writer.position,
+            'complete': complete
+        })
+
+    records = iter_records(input_path, text_column=text_column, skip=rows_done)
+    try:
+        for chunk, encodings in iter_tokenized(dataset, iter_chunks(records, chunk_size), num_workers):
+            writer.write(score_chunk(model, dataset, chunk, encodings, rows_done))
+            rows_done += len(chunk)
+            record_progress(complete=False)
+            print(f"Scored {rows_done} rows")
+        record_progress(complete=True)
+    finally:
+        writer.close()
+
+    return rows_done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a CSV/JSONL file of texts with EnhancedTherapeuticGNN")
+    parser.add_argument('input', help="CSV or JSONL (.jsonl) file with one text per record")
+    parser.add_argument('output', help="Output CSV, or a .parquet directory (requires pyarrow)")
+    parser.add_argument('--text-column', default='text')
+    parser.add_argument('--weights', default='enhanced_therapeutic_gnn.pth')
+    parser.add_argument('--chunk-size', type=int, default=1024)
+    parser.add_argument('--batch-size', type=int, default=64, help="Texts per BERT forward pass")
+    parser.add_argument('--num-workers', type=int, default=0, help="Tokenizer worker processes")
+    parser.add_argument('--no-resume', action='store_true', help="Ignore earlier progress and start over")
+    parser.add_argument('--encoder', default=DEFAULT_ENCODER, help="Text encoder the weights were trained with")
+    parser.add_argument('--taxonomy', default=None, help="Label taxonomy (.json or .cypher) the weights were trained with")
+    parser.add_argument(
+        '--precision', choices=PRECISIONS, default='fp32',
+        help="bf16 autocast or dynamic int8 for BERT and the heads (check with eval.py --check-precision)"
+    )
+    args = parser.parse_args()
+
+    # Scoring only needs the encoder and the fixed node texts (from the taxonomy), not the examples CSV
+    dataset = TherapeuticDataset(
+        None,
+        batch_size=args.batch_size,
+        cache_dir=None,
+        precision=args.precision,
+        model_name=args.encoder,
+        taxonomy=Taxonomy.load(args.taxonomy) if args.taxonomy else None
+    )
+    model = load_trained_model(dataset.hidden_size, args.weights, args.precision, dataset.taxonomy)
+    num_rows = score_file(
+        model, dataset, args.input, args.output,
+        text_column=args.text_column,
+        chunk_size=args.chunk_size,
+        num_workers=args.num_workers,
+        resume=not args.no_resume,
+        weights_path=args.weights
+    )
+    print(f"Done: {num_rows} rows written to {args.output}")
+
+if __name__ == '__main__':
+    main()
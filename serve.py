@@ -0,0 +1,265 @@
+# serve.py
+import argparse
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from data_loading import DEFAULT_ENCODER, PRECISIONS, TherapeuticDataset
+from eval import load_trained_model, predict_texts
+from taxonomy import Taxonomy
+
+
+class LatencyStats:
+    """Rolling latency / throughput counters over the last `window` requests."""
+
+    def __init__(self, window: int = 10000):
+        self.latencies = deque(maxlen=window)
+        self.finish_times = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.total_requests = 0
+        self.total_batches = 0
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def record_batch(self, latencies: List[float]) -> None:
+        now = time.perf_counter()
+        with self.lock:
+            self.latencies.extend(latencies)
+            self.finish_times.extend([now] * len(latencies))
+            self.batch_sizes.append(len(latencies))
+            self.total_requests += len(latencies)
+            self.total_batches += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        with self.lock:
+            latencies = np.array(self.latencies, dtype=np.float64)
+            finish_times = list(self.finish_times)
+            batch_sizes = list(self.batch_sizes)
+            total_requests = self.total_requests
+            total_batches = self.total_batches
+
+        stats = {
+            'total_requests': total_requests,
+            'total_batches': total_batches,
+            'uptime_s': time.perf_counter() - self.started,
+            'p50_ms': 0.0,
+            'p99_ms': 0.0,
+            'throughput_rps': 0.0,
+            'mean_batch_size': float(np.mean(batch_sizes)) if batch_sizes else 0.0
+        }
+        if len(latencies) > 0:
+            stats['p50_ms'] = float(np.percentile(latencies, 50) * 1000)
+            stats['p99_ms'] = float(np.percentile(latencies, 99) * 1000)
+        if len(finish_times) > 1 and finish_times[-1] > finish_times[0]:
+            stats['throughput_rps'] = (len(finish_times) - 1) / (finish_times[-1] - finish_times[0])
+        return stats
+
+
+class MicroBatcher:
+    """
+    Collects concurrently submitted texts into micro-batches.
+
+    A worker thread blocks for the first pending request, then keeps pulling
+    until either `max_batch_size` texts are collected or `max_wait_ms` has
+    passed since that first request, and scores the whole batch with one
+    call to `predict_fn`.
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[List[str]], List],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0
+    ):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests = queue.Queue()
+        self.stats = LatencyStats()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self.requests.put((text, future, time.perf_counter()))
+        return future
+
+    def predict(self, texts: List[str]) -> List:
+        """Submit every text separately, so they can share batches with other clients."""
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def _collect(self) -> List:
+        batch = [self.requests.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            texts = [text for text, _, _ in batch]
+            try:
+                results = self.predict_fn(texts)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            now = time.perf_counter()
+            for (_, future, submitted), result in zip(batch, results):
+                future.set_result(result)
+            self.stats.record_batch([now - submitted for _, _, submitted in batch])
+
+
+def make_handler(batcher: MicroBatcher):
+    class InferenceHandler(BaseHTTPRequestHandler):
+        """
+        POST /predict  {"text": "..."} or {"texts": ["...", ...]}
+        GET  /stats    latency percentiles, throughput and batch size
+        """
+
+        def _send_json(self, status: int, payload) -> None:
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self._send_json(200, batcher.stats.snapshot())
+            else:
+                self._send_json(404, {'error': f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self._send_json(404, {'error': f"Unknown path {self.path}"})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+                texts = request['texts'] if 'texts' in request else [request['text']]
+                if not isinstance(texts, list):
+                    raise ValueError("texts must be a list of strings")
+                if not all(isinstance(text, str) for text in texts):
+                    raise ValueError("texts must be strings")
+            except (KeyError, TypeError, ValueError) as e:
+                self._send_json(400, {'error': f"Bad request: {e}"})
+                return
+
+            try:
+                results = batcher.predict(texts)
+            except Exception as e:
+                self._send_json(500, {'error': f"Prediction failed: {type(e).__name__}: {e}"})
+                return
+            predictions = [
+                {'common_factors': factors, 'intervention_concepts': ics, 'skills': skills}
+                for factors, ics, skills in results
+            ]
+            self._send_json(200, {'predictions': predictions})
+
+        def log_message(self, format, *args):
+            # Per-request access logs would dominate at hundreds of requests per second
+            pass
+
+    return InferenceHandler
+
+
+class InferenceHTTPServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 resets connections under concurrent load
+    request_queue_size = 1024
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return request, ('unix', 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching inference server for EnhancedTherapeuticGNN")
+    parser.add_argument(
+        '--csv', default='data/htc_examples_ids.csv',
+        help="Examples CSV whose compiled graph --graph-aware attaches texts to (unused otherwise)"
+    )
+    parser.add_argument('--weights', default='enhanced_therapeutic_gnn.pth')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix-socket', default=None, help="Serve on this Unix socket instead of TCP")
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument(
+        '--cache-dir', default=None,
+        help="Embedding cache directory (off by default, live utterances rarely repeat)"
+    )
+    parser.add_argument('--encoder', default=DEFAULT_ENCODER, help="Text encoder the weights were trained with")
+    parser.add_argument('--taxonomy', default=None, help="Label taxonomy (.json or .cypher) the weights were trained with")
+    parser.add_argument(
+        '--precision', choices=PRECISIONS, default='fp32',
+        help="bf16 autocast or dynamic int8 for BERT and the heads (check with eval.py --check-precision)"
+    )
+    parser.add_argument(
+        '--graph-aware', type=int, default=None, metavar='K',
+        help="Attach each text to its K nearest training examples and run the GAT layers (needs the compiled graph)"
+    )
+    args = parser.parse_args()
+    taxonomy = Taxonomy.load(args.taxonomy) if args.taxonomy else None
+
+    # Serving only needs the encoder, not the examples CSV
+    dataset = TherapeuticDataset(
+        None, batch_size=args.max_batch_size, cache_dir=args.cache_dir, precision=args.precision,
+        model_name=args.encoder, taxonomy=taxonomy
+    )
+    model = load_trained_model(dataset.hidden_size, args.weights, args.precision, dataset.taxonomy)
+    if args.graph_aware is not None:
+        from compile_graph import default_artifact_path, load_example_index
+        from graph_inference import build_graph_aware_predictor, cached_layer_states
+        index, data = load_example_index(args.csv, model_name=args.encoder, taxonomy=taxonomy)
+        states = cached_layer_states(model, data, default_artifact_path(args.csv, args.encoder))
+        model = build_graph_aware_predictor(model, data, k=args.graph_aware, index=index, states=states)
+    # The encoder loads lazily, warm it up so the first client does not pay for it
+    predict_texts(model, dataset, ["warm up"])
+    batcher = MicroBatcher(
+        lambda texts: predict_texts(model, dataset, texts),
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms
+    )
+    handler = make_handler(batcher)
+
+    if args.unix_socket:
+        if os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+        server = ThreadingUnixHTTPServer(args.unix_socket, handler)
+        print(f"Serving on unix socket {args.unix_socket}")
+    else:
+        server = InferenceHTTPServer((args.host, args.port), handler)
+        print(f"Serving on http://{args.host}:{args.port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+# sweep.py
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+from torch.optim import Adam
+
+from data_loading import DEFAULT_ENCODER, DEFAULT_SPLIT_SEED
+
+# Hyperparameters a trial can vary, with the values train.py uses
+DEFAULT_CONFIG = {
+    'hidden_channels': 64,
+    'num_layers': 2,
+    'dropout': 0.5,
+    'lr': 0.01,
+    'weight_decay': 5e-4
+}
+
+RESULT_COLUMNS = (
+    ['trial'] + list(DEFAULT_CONFIG)
+    + ['epochs', 'status', 'best_val_loss', 'best_epoch',
+       'factor_accuracy', 'ic_accuracy', 'skill_accuracy',
+       'factor_macro_f1', 'ic_macro_f1', 'skill_macro_f1', 'seconds']
+)
+
+
+def grid(space: Dict[str, Sequence]) -> List[Dict[str, Any]]:
+    """Every combination of the values in `space`, on top of DEFAULT_CONFIG."""
+    names = list(space)
+    return [
+        {**DEFAULT_CONFIG, **dict(zip(names, values))}
+        for values in itertools.product(*(space[name] for name in names))
+    ]
+
+
+def rung_epochs(max_epochs: int, min_epochs: Optional[int], eta: int) -> List[int]:
+    """
+    Epoch budgets of the successive-halving rungs: min_epochs, min_epochs * eta, ...
+    up to max_epochs. Without min_epochs there is a single rung (no pruning).
+    """
+    if min_epochs is None or min_epochs >= max_epochs:
+        return [max_epochs]
+    budgets = []
+    epochs = min_epochs
+    while epochs < max_epochs:
+        budgets.append(epochs)
+        epochs *= eta
+    return budgets + [max_epochs]
+
+
+# ----------------------------------------------------------------------
+# Workers
+# ----------------------------------------------------------------------
+_worker_data = None
+
+
+def _init_worker(artifact_path: str, num_threads: int) -> None:
+    """
+    Limit the worker's intra-op threads (so workers do not oversubscribe the
+    cores) and memory-map the compiled graph: every worker maps the same file,
+    so the features live once in the page cache however many workers run.
+    """
+    global _worker_data
+    from compile_graph import load_artifact
+
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+    _worker_data, _ = load_artifact(artifact_path)
+
+
+def _macro_f1(report: Dict) -> float:
+    return report.get('macro avg', {}).get('f1-score', float('nan'))
+
+
+def run_trial(
+    trial: int,
+    config: Dict[str, Any],
+    epochs: int,
+    state_path: str,
+    seed: int = 0,
+    val_every: int = 5,
+    patience: Optional[int] = None,
+    final_epoch: Optional[int] = None,
+    data=None
+) -> Dict[str, Any]:
+    """
+    Train one configuration up to `epochs` and evaluate it on the test split.
+
+    The training state is kept in `state_path`, so the next rung resumes the
+    run where this one stopped (model, optimizer and RNG states included)
+    instead of starting over. `final_epoch` is the epoch of the last rung, so
+    the extra end-of-training validation round runs only there. Training
+    output is silenced; the returned row has the config, the best validation
+    loss and the evaluate_model metrics.
+    """
+    from eval import evaluate_model
+    from model import EnhancedTherapeuticGNN
+    from train import load_training_state, train_model
+
+    data = _worker_data if data is None else data
+    start = time.perf_counter()
+    torch.manual_seed(seed)
+    random.seed(seed)
+    np.random.seed(seed)
+
+    num_common_factors, num_intervention_concepts, num_skills = data.taxonomy.label_sizes
+    model = EnhancedTherapeuticGNN(
+        in_channels=data.x.size(1),
+        hidden_channels=config['hidden_channels'],
+        num_common_factors=num_common_factors,
+        num_intervention_concepts=num_intervention_concepts,
+        num_skills=num_skills,
+        num_layers=config['num_layers'],
+        dropout=config['dropout']
+    )
+    optimizer = Adam(model.parameters(), lr=config['lr'], weight_decay=config['weight_decay'])
+    with contextlib.redirect_stdout(io.StringIO()):
+        train_model(
+            model, data, optimizer,
+            epochs=epochs,
+            val_every=val_every,
+            patience=patience,
+            state_path=state_path,
+            checkpoint_every=epochs,
+            resume=True,
+            final_epoch=final_epoch
+        )
+        metrics = evaluate_model(model, data)
+    state = load_training_state(state_path)
+
+    return {
+        'trial': trial,
+        **config,
+        'epochs': state['epoch'],
+        'status': 'stopped early' if state['stopped_early'] else 'complete',
+        'best_val_loss': state['best_val_loss'],
+        'best_epoch': state['best_epoch'],
+        'factor_accuracy': metrics['factor_accuracy'],
+        'ic_accuracy': metrics['ic_accuracy'],
+        'skill_accuracy': metrics['skill_accuracy'],
+        'factor_macro_f1': _macro_f1(metrics['factor_classification_report']),
+        'ic_macro_f1': _macro_f1(metrics['ic_classification_report']),
+        'skill_macro_f1': _macro_f1(metrics['skill_classification_report']),
+        'seconds': time.perf_counter() - start
+    }
+
+
+def _run_trial_in_worker(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    return run_trial(**kwargs)
+
+
+# ----------------------------------------------------------------------
+# Sweep
+# ----------------------------------------------------------------------
+def write_results(rows: List[Dict[str, Any]], path: str) -> None:
+    """Write the results table (temp file + rename, it is rewritten after every rung)."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode='w', encoding='utf-8', newline='') as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(sorted(rows, key=lambda row: row['trial']))
+    os.replace(tmp_path, path)
+
+
+def run_sweep(
+    artifact_path: str,
+    configs: List[Dict[str, Any]],
+    output_dir: str,
+    max_epochs: int = 300,
+    min_epochs: Optional[int] = None,
+    eta: int = 3,
+    num_workers: Optional[int] = None,
+    threads_per_worker: int = 1,
+    seed: int = 0,
+    val_every: int = 5,
+    patience: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Train every configuration on the compiled graph at `artifact_path`, in parallel.
+
+    - Trials are spread over `num_workers` processes (default: as many as
+      fit on the cores with `threads_per_worker` threads each).
+    - With `min_epochs`, weak configurations are pruned by successive halving:
+      all trials train for min_epochs, the best 1/eta by validation loss
+      continue to min_epochs * eta, and so on up to max_epochs. Pruned trials
+      keep the row of the last rung they reached.
+    - The results table is written to `<output_dir>/results.csv` after every
+      rung; trial states (with the best weights) are `<output_dir>/trial-<n>.ckpt`.
+    Returns the result rows, best validation loss first.
+    """
+    if min_epochs is not None and min_epochs < min(val_every, max_epochs):
+        # Rungs only compare validation rounds, none would have run by the first one
+        raise ValueError(f"min_epochs ({min_epochs}) must be at least val_every ({val_every})")
+    os.makedirs(output_dir, exist_ok=True)
+    results_path = os.path.join(output_dir, 'results.csv')
+    num_workers = num_workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+
+    results = {}
+    survivors = list(range(len(configs)))
+    budgets = rung_epochs(max_epochs, min_epochs, eta)
+    state_paths = [os.path.join(output_dir, f'trial-{trial:04d}.ckpt') for trial in survivors]
+    # Trials resume from their state between rungs, never from an earlier sweep's
+    for path in state_paths:
+        if os.path.exists(path):
+            os.remove(path)
+    # spawn: the parent may have run multi-threaded BERT, which is not fork-safe
+    with ProcessPoolExecutor(
+        max_workers=min(num_workers, len(configs)),
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(artifact_path, threads_per_worker)
+    ) as pool:
+        for rung, epochs in enumerate(budgets):
+            print(f"Rung {rung + 1}/{len(budgets)}: {len(survivors)} trials to epoch {epochs}")
+            jobs = [
+                {
+                    'trial': trial,
+                    'config': configs[trial],
+                    'epochs': epochs,
+                    'state_path': state_paths[trial],
+                    'seed': seed,
+                    'val_every': val_every,
+                    'patience': patience,
+                    'final_epoch': max_epochs
+                }
+                for trial in survivors
+            ]
+            for row in pool.map(_run_trial_in_worker, jobs):
+                # Training time summed over the rungs the trial took part in
+                row['seconds'] += results.get(row['trial'], {}).get('seconds', 0.0)
+                results[row['trial']] = row
+                print(
+                    f"  trial {row['trial']:4d} epoch {row['epochs']:4d} val loss {row['best_val_loss']:.4f} "
+                    f"({row['seconds']:.1f}s)"
+                )
+
+            if rung + 1 < len(budgets):
+                ranked = sorted(survivors, key=lambda trial: results[trial]['best_val_loss'])
+                survivors = ranked[:max(1, math.ceil(len(ranked) / eta))]
+                for trial in ranked[len(survivors):]:
+                    results[trial]['status'] = f'pruned at epoch {epochs}'
+            write_results(list(results.values()), results_path)
+
+    print(f"Results written to {results_path}")
+    return sorted(results.values(), key=lambda row: row['best_val_loss'])
+
+
+def print_results(rows: List[Dict[str, Any]], top: Optional[int] = None) -> None:
+    print(
+        f"\n{'trial':>5} {'hidden':>6} {'layers':>6} {'dropout':>7} {'lr':>8} {'wd':>8} {'epochs':>6} "
+        f"{'val loss':>8} {'CF acc':>7} {'IC acc':>7} {'skill acc':>9}  status"
+    )
+    for r in rows[:top]:
+        print(
+            f"{r['trial']:>5} {r['hidden_channels']:>6} {r['num_layers']:>6} {r['dropout']:>7.2f} "
+            f"{r['lr']:>8.0e} {r['weight_decay']:>8.0e} {r['epochs']:>6} {r['best_val_loss']:>8.4f} "
+            f"{r['factor_accuracy']:>7.4f} {r['ic_accuracy']:>7.4f} {r['skill_accuracy']:>9.4f}  {r['status']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter sweep over train_model")
+    parser.add_argument('--csv', default='data/htc_examples_ids.csv')
+    parser.add_argument('--encoder', default=DEFAULT_ENCODER, help="Text encoder: Hugging Face model name or local directory")
+    parser.add_argument('--split-seed', type=int, default=DEFAULT_SPLIT_SEED, help="Seed of the stratified train/val/test split")
+    parser.add_argument('--hidden-channels', type=int, nargs='+', default=[DEFAULT_CONFIG['hidden_channels']])
+    parser.add_argument('--num-layers', type=int, nargs='+', default=[DEFAULT_CONFIG['num_layers']])
+    parser.add_argument('--dropout', type=float, nargs='+', default=[DEFAULT_CONFIG['dropout']])
+    parser.add_argument('--lr', type=float, nargs='+', default=[DEFAULT_CONFIG['lr']])
+    parser.add_argument('--weight-decay', type=float, nargs='+', default=[DEFAULT_CONFIG['weight_decay']])
+    parser.add_argument('--epochs', type=int, default=300, help="Epochs of the trials that are never pruned")
+    parser.add_argument(
+        '--min-epochs', type=int, default=None,
+        help="Prune by successive halving: every trial trains this long, the best 1/eta continue (off by default)"
+    )
+    parser.add_argument('--eta', type=int, default=3, help="Keep the best 1/eta of the trials at every rung")
+    parser.add_argument('--val-every', type=int, default=5)
+    parser.add_argument('--patience', type=int, default=None, help="Early stopping within a trial, in validation rounds")
+    parser.add_argument('--seed', type=int, default=0, help="Model initialization seed, the same for every trial")
+    parser.add_argument('--num-workers', type=int, default=None, help="Worker processes (default: cores / threads per worker)")
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--output-dir', default='sweep')
+    parser.add_argument('--top', type=int, default=20, help="Rows of the results table to print")
+    args = parser.parse_args()
+    if args.eta < 2:
+        parser.error("--eta must be at least 2")
+
+    from compile_graph import default_artifact_path, update_compiled_graph
+
+    # Compile (or refresh) once here; the workers only memory-map the artifact
+    update_compiled_graph(args.csv, split_seed=args.split_seed, model_name=args.encoder)
+    configs = grid({
+        'hidden_channels': args.hidden_channels,
+        'num_layers': args.num_layers,
+        'dropout': args.dropout,
+        'lr': args.lr,
+        'weight_decay': args.weight_decay
+    })
+    print(f"Sweeping {len(configs)} configurations")
+    rows = run_sweep(
+        default_artifact_path(args.csv, args.encoder),
+        configs,
+        args.output_dir,
+        max_epochs=args.epochs,
+        min_epochs=args.min_epochs,
+        eta=args.eta,
+        num_workers=args.num_workers,
+        threads_per_worker=args.threads_per_worker,
+        seed=args.seed,
+        val_every=args.val_every,
+        patience=args.patience
+    )
+    print_results(rows, args.top)
+
+if __name__ == '__main__':
+    main()
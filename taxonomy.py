@@ -0,0 +1,234 @@
+# taxonomy.py
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+
+# The three prediction tasks (one model head each), in label-column order
+TASKS = ('factor', 'ic', 'skill')
+# Node type of each task's classes, as in get_fixed_nodes
+NODE_TYPES = {'factor': 'common_factor', 'ic': 'intervention_concept', 'skill': 'skill'}
+# Node labels of neo4j_graph_setup.cypher -> 'root' or the task their nodes are classes of
+CYPHER_LABELS = {
+    'ChangePrinciple': 'root',
+    'CommonFactor': 'factor',
+    'InterventionConcept': 'ic',
+    'TherapeuticSkill': 'skill'
+}
+
+_CYPHER_NODE = re.compile(r'^MERGE \(\w+:(\w+) \{(.*?)\}\)', re.MULTILINE | re.DOTALL)
+_CYPHER_PROPERTY = re.compile(r'(\w+):\s*(?:"([^"]*)"|(-?\d+))')
+
+
+class Taxonomy:
+    """
+    The label spaces: the root node(s) and the classes of every task.
+
+    - Every node is a dict with 'name' and 'description', classes optionally
+      with an 'abbreviation' (the code used in annotation files) and a
+      'display_name' (used in predictions and reports, defaults to 'name').
+    - Node ids are the ones given ('id'), so the CF_id / IC_id / skill_id
+      columns of annotated data keep their meaning when classes are added.
+      Nodes without an id get the next unused ones, in order: roots, then
+      the factor, IC and skill classes (the default taxonomy has ids 0..12).
+    - The fixed nodes use their ids as node indices (see build_edge_index), so
+      the ids must be exactly 0..num_fixed_nodes - 1, with a root as node 0.
+    - Class c of a task is column offsets[task] + c of the concatenated model
+      outputs; labels are stored per task as class indices, -1 where missing.
+    """
+
+    def __init__(self, root: List[Dict[str, str]], classes: Dict[str, List[Dict[str, str]]]):
+        if not root:
+            raise ValueError("A taxonomy needs at least one root node")
+        missing = [task for task in TASKS if not classes.get(task)]
+        if missing:
+            raise ValueError(f"A taxonomy needs classes for every task, missing: {missing}")
+        groups = [('root', root)] + [(NODE_TYPES[task], classes[task]) for task in TASKS]
+        given = [node['id'] for _, nodes in groups for node in nodes if node.get('id') is not None]
+        if len(set(given)) != len(given):
+            raise ValueError(f"Duplicate node ids in the taxonomy: {sorted(i for i in set(given) if given.count(i) > 1)}")
+        next_id = max(given, default=-1) + 1
+        typed = []
+        for node_type, nodes in groups:
+            typed.append([])
+            for node in nodes:
+                node_id = node.get('id')
+                if node_id is None:
+                    node_id, next_id = next_id, next_id + 1
+                typed[-1].append({**node, 'id': int(node_id), 'type': node_type})
+        self.root = typed[0]
+        self.classes = dict(zip(TASKS, typed[1:]))
+
+        ids = sorted(node['id'] for node in self.nodes())
+        if ids != list(range(len(ids))):
+            raise ValueError(
+                f"Taxonomy node ids must be 0..{len(ids) - 1} (they are node indices), got {ids}"
+            )
+        if 0 not in (node['id'] for node in self.root):
+            raise ValueError("Node id 0 must be a root node")
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Taxonomy) and self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        sizes = ', '.join(f'{task}={size}' for task, size in zip(TASKS, self.label_sizes))
+        return f"Taxonomy({sizes})"
+
+    # ------------------------------------------------------------------
+    # Label spaces
+    # ------------------------------------------------------------------
+    @property
+    def label_sizes(self) -> Tuple[int, ...]:
+        """Number of (common factor, intervention concept, skill) classes."""
+        return tuple(len(self.classes[task]) for task in TASKS)
+
+    @property
+    def offsets(self) -> Tuple[int, ...]:
+        """First column of every task in the concatenated (num_labels,) outputs."""
+        return tuple(int(offset) for offset in np.cumsum((0,) + self.label_sizes[:-1]))
+
+    @property
+    def num_labels(self) -> int:
+        return sum(self.label_sizes)
+
+    @property
+    def num_fixed_nodes(self) -> int:
+        """Root and class nodes, i.e. the node index of the first example."""
+        return len(self.root) + self.num_labels
+
+    @property
+    def label_dtype(self) -> torch.dtype:
+        """Smallest signed integer type holding every class index (and -1)."""
+        largest = max(self.label_sizes)
+        return torch.int8 if largest <= 127 else torch.int16 if largest <= 32767 else torch.int32
+
+    def names(self, task: str) -> List[str]:
+        """Display names of the classes of `task`, in class-index order."""
+        return [node.get('display_name', node['name']) for node in self.classes[task]]
+
+    def ids(self, task: str) -> List[int]:
+        return [node['id'] for node in self.classes[task]]
+
+    def abbreviation_ids(self, task: str) -> Dict[str, int]:
+        """Annotation code -> node id of the classes of `task` that have one."""
+        return {node['abbreviation']: node['id'] for node in self.classes[task] if 'abbreviation' in node}
+
+    def nodes(self) -> List[Dict[str, Any]]:
+        """All root and class nodes in id order, i.e. in node-index order."""
+        return sorted(
+            self.root + [node for task in TASKS for node in self.classes[task]],
+            key=lambda node: node['id']
+        )
+
+    def fixed_nodes(self) -> Tuple[List[Dict[str, Any]], ...]:
+        """(root_nodes, common_factors, intervention_concepts, therapeutic_skills), as get_fixed_nodes returns them."""
+        return (self.root,) + tuple(self.classes[task] for task in TASKS)
+
+    def class_indices(self, id_columns: Sequence[np.ndarray]) -> torch.Tensor:
+        """
+        Map one node-id column per task (e.g. the CF_id, IC_id and skill_id
+        columns) to class indices within each task, e.g. CF id 2 -> factor
+        class 1. Returns a (n, len(TASKS)) long tensor, -1 where a row is not
+        annotated (id 0 or empty).
+
+        Raises ValueError if an id is not a class of its task, e.g. because the
+        taxonomy was renumbered and no longer matches the annotated data.
+        """
+        columns = []
+        for task, ids in zip(TASKS, id_columns):
+            # Lookup table: node id -> class index (or -1)
+            task_ids = np.array(self.ids(task), dtype=np.int64)
+            lookup = np.full(max(int(task_ids.max()), int(ids.max(initial=0))) + 1, -1, dtype=np.int64)
+            lookup[task_ids] = np.arange(len(task_ids))
+
+            class_idx = np.full(len(ids), -1, dtype=np.int64)
+            annotated = ids > 0
+            class_idx[annotated] = lookup[ids[annotated]]
+            unknown = np.unique(ids[annotated][class_idx[annotated] < 0])
+            if len(unknown):
+                raise ValueError(
+                    f"The data uses {task} ids {unknown.tolist()}, which are not {task} classes of the "
+                    f"taxonomy ({task} ids: {task_ids.tolist()}); give the taxonomy nodes the ids used in the data"
+                )
+            columns.append(class_idx)
+        return torch.from_numpy(np.stack(columns, axis=1))
+
+    def multi_hot(self, class_idx: torch.Tensor) -> torch.Tensor:
+        """(n, len(TASKS)) class indices -> (n, num_labels) float multi-hot rows (all zero where missing)."""
+        labels = torch.zeros((len(class_idx), self.num_labels), dtype=torch.float)
+        class_idx = class_idx.long()
+        valid = class_idx >= 0
+        rows = torch.arange(len(class_idx)).unsqueeze(1).expand_as(class_idx)
+        cols = class_idx + torch.tensor(self.offsets).unsqueeze(0)
+        labels[rows[valid], cols[valid]] = 1.0
+        return labels
+
+    # ------------------------------------------------------------------
+    # Serialization
+    # ------------------------------------------------------------------
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serializable form, ids included (types are derived again on load)."""
+        def strip(node):
+            return {key: value for key, value in node.items() if key != 'type'}
+        return {
+            'root': [strip(node) for node in self.root],
+            **{task: [strip(node) for node in self.classes[task]] for task in TASKS}
+        }
+
+    @classmethod
+    def from_dict(cls, spec: Dict[str, Any]) -> 'Taxonomy':
+        return cls(spec.get('root', []), {task: spec.get(task, []) for task in TASKS})
+
+    @classmethod
+    def from_cypher(cls, text: str) -> 'Taxonomy':
+        """
+        Read the root and class nodes from Cypher in the style of
+        neo4j_graph_setup.cypher: `MERGE (var:Label { name: "...", full_label: "...",
+        description: "..." })`, where name is the abbreviation and full_label the name.
+        An integer `id: n` property pins the node id (see Taxonomy).
+        Other node labels (e.g. Example) and commented-out lines are ignored.
+        """
+        text = '\n'.join(line for line in text.splitlines() if not line.lstrip().startswith('//'))
+        root, classes = [], {task: [] for task in TASKS}
+        for label, body in _CYPHER_NODE.findall(text):
+            target = CYPHER_LABELS.get(label)
+            if target is None:
+                continue
+            properties = {key: text if number == '' else int(number) for key, text, number in _CYPHER_PROPERTY.findall(body)}
+            node = {
+                'name': properties.get('full_label', properties.get('name', '')),
+                'abbreviation': properties.get('name', ''),
+                'description': properties.get('description', '')
+            }
+            if 'id' in properties:
+                node['id'] = properties['id']
+            (root if target == 'root' else classes[target]).append(node)
+        return cls(root, classes)
+
+    @classmethod
+    def load(cls, path: str) -> 'Taxonomy':
+        """Load a taxonomy from a .json file (see to_dict) or a .cypher file (see from_cypher)."""
+        with open(path, mode='r', encoding='utf-8') as infile:
+            if os.path.splitext(path)[1] == '.cypher':
+                return cls.from_cypher(infile.read())
+            return cls.from_dict(json.load(infile))
+
+    def save(self, path: str) -> None:
+        with open(path, mode='w', encoding='utf-8') as outfile:
+            json.dump(self.to_dict(), outfile, indent=2)
+
+
+def default_taxonomy() -> Taxonomy:
+    """The built-in taxonomy: the fixed nodes of example_data.get_fixed_nodes."""
+    from example_data import get_fixed_nodes
+
+    root, factors, intervention_concepts, skills = get_fixed_nodes()
+    return Taxonomy(root, dict(zip(TASKS, (factors, intervention_concepts, skills))))
+
+
+def load_taxonomy(path: Optional[str] = None) -> Taxonomy:
+    """Taxonomy from `path` (.json or .cypher), or the built-in one when no path is given."""
+    return default_taxonomy() if path is None else Taxonomy.load(path)
@@ -0,0 +1,49 @@
+# tests/conftest.py
+import os
+import sys
+from typing import Callable, Dict, Tuple
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model import HEAD_NAMES, EnhancedTherapeuticGNN  # noqa: E402
+
+HEAD_SIZES = (3, 2, 7)
+
+
+@pytest.fixture
+def gnn() -> EnhancedTherapeuticGNN:
+    """A small randomly initialized model, so no trained weights or BERT are needed."""
+    torch.manual_seed(0)
+    return EnhancedTherapeuticGNN(32, 16, *HEAD_SIZES, num_layers=2).eval()
+
+
+@pytest.fixture
+def separate_heads_reference() -> Callable[..., Tuple[torch.Tensor, ...]]:
+    """
+    The edge-free forward as it was computed before the heads were fused:
+    each GATConv's `lin` weight, then every head as its own Linear, taken
+    from a legacy (unfused) state_dict.
+    """
+    def reference(
+        legacy_state: Dict[str, torch.Tensor],
+        x: torch.Tensor,
+        return_logits: bool = True
+    ) -> Tuple[torch.Tensor, ...]:
+        i = 0
+        while f'conv_layers.{i}.lin.weight' in legacy_state:
+            x = F.relu(F.linear(x, legacy_state[f'conv_layers.{i}.lin.weight']))
+            i += 1
+        outputs = tuple(
+            F.linear(x, legacy_state[f'{head}.weight'], legacy_state[f'{head}.bias']) for head in HEAD_NAMES
+        )
+        if return_logits:
+            return outputs
+        return tuple(F.softmax(output, dim=-1) for output in outputs)
+
+    return reference
+
@@ -0,0 +1,94 @@
+# tests/test_embedding_cache.py
+import os
+
+import numpy as np
+
+from embedding_cache import RECORD_BYTES, EmbeddingCache
+
+DIM = 4
+
+
+def make_cache(cache_dir, max_entries: int = 100) -> EmbeddingCache:
+    return EmbeddingCache(str(cache_dir), 'test', dim=DIM, max_entries=max_entries)
+
+
+def vectors_for(texts) -> np.ndarray:
+    """A distinct, reproducible vector per text."""
+    return np.stack([np.full(DIM, float(sum(map(ord, text))), dtype=np.float32) for text in texts])
+
+
+def test_round_trip_across_instances(tmp_path):
+    texts = ['a', 'b', 'c']
+    cache = make_cache(tmp_path)
+    cache.put_many(texts, vectors_for(texts))
+    vectors, missing = make_cache(tmp_path).get_many(['c', 'x', 'a'])
+    assert missing == [1]
+    np.testing.assert_array_equal(vectors[[0, 2]], vectors_for(['c', 'a']))
+
+
+def test_put_many_appends_without_rewriting_the_header(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put_many(['a'], vectors_for(['a']))
+    header_stat = os.stat(cache.header_path)
+    keys_path = cache._keys_path(cache.generation)
+    cache.put_many(['b', 'c'], vectors_for(['b', 'c']))
+    assert os.stat(cache.header_path).st_mtime_ns == header_stat.st_mtime_ns
+    assert os.path.getsize(keys_path) == 3 * RECORD_BYTES
+
+
+def test_torn_record_is_ignored_and_overwritten(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put_many(['a'], vectors_for(['a']))
+    # A crash in the middle of appending a key record
+    with open(cache._keys_path(cache.generation), mode='ab') as outfile:
+        outfile.write(b'\0' * (RECORD_BYTES + 3))
+    reopened = make_cache(tmp_path)
+    assert len(reopened) == 1
+    reopened.put_many(['b'], vectors_for(['b']))
+    vectors, missing = make_cache(tmp_path).get_many(['a', 'b'])
+    assert missing == []
+    np.testing.assert_array_equal(vectors, vectors_for(['a', 'b']))
+
+
+def test_other_instances_see_appended_entries(tmp_path):
+    reader = make_cache(tmp_path)
+    writer = make_cache(tmp_path)
+    writer.put_many(['a', 'b'], vectors_for(['a', 'b']))
+    vectors, missing = reader.get_many(['a', 'b'])
+    assert missing == []
+    np.testing.assert_array_equal(vectors, vectors_for(['a', 'b']))
+
+
+def test_compaction_keeps_recently_used_entries(tmp_path):
+    cache = make_cache(tmp_path, max_entries=10)
+    old = [f'old{i}' for i in range(8)]
+    cache.put_many(old, vectors_for(old))
+    cache.get_many(['old0', 'old1'])
+    new = [f'new{i}' for i in range(5)]
+    cache.put_many(new, vectors_for(new))
+    assert cache.generation == 1
+    assert not os.path.exists(cache._matrix_path(0))
+    cache.flush()
+
+    reopened = make_cache(tmp_path, max_entries=10)
+    vectors, missing = reopened.get_many(['old0', 'old1'] + new)
+    assert missing == []
+    np.testing.assert_array_equal(vectors, vectors_for(['old0', 'old1'] + new))
+    assert len(reopened) <= 10
+
+
+def test_oversized_batch_keeps_its_last_entries(tmp_path):
+    cache = make_cache(tmp_path, max_entries=5)
+    texts = [f't{i}' for i in range(8)]
+    cache.put_many(texts, vectors_for(texts))
+    _, missing = cache.get_many(texts)
+    assert missing == [0, 1, 2]
+
+
+def test_ticks_persist_on_flush(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put_many(['a', 'b'], vectors_for(['a', 'b']))
+    cache.get_many(['a'])
+    cache.flush()
+    reopened = make_cache(tmp_path)
+    assert reopened.entries[reopened.key('a')][1] > reopened.entries[reopened.key('b')][1]
@@ -0,0 +1,48 @@
+# tests/test_example_index.py
+import torch
+
+from example_index import ExactExampleIndex, IVFExampleIndex
+
+
+def clustered_features(num_nodes: int = 2000, dim: int = 32) -> torch.Tensor:
+    generator = torch.Generator().manual_seed(0)
+    centers = torch.randn(20, dim, generator=generator)
+    return centers[torch.randint(0, 20, (num_nodes,), generator=generator)] + 0.3 * torch.randn(
+        num_nodes, dim, generator=generator
+    )
+
+
+def test_exhaustive_ivf_search_matches_exact():
+    features = clustered_features()
+    node_indices = torch.arange(0, len(features), 2)
+    allowed = torch.rand(len(features), generator=torch.Generator().manual_seed(1)) < 0.6
+    queries = torch.randn(50, features.size(1), generator=torch.Generator().manual_seed(2))
+    ivf = IVFExampleIndex.build(features, node_indices)
+    exact = ExactExampleIndex(features, node_indices)
+    for mask in (None, allowed):
+        ivf_scores, ivf_nodes = ivf.search(queries, 10, nprobe=ivf.num_lists, allowed=mask)
+        exact_scores, exact_nodes = exact.search(queries, 10, allowed=mask)
+        torch.testing.assert_close(ivf_scores, exact_scores)
+        assert torch.equal(ivf_nodes, exact_nodes)
+
+
+def test_batched_search_matches_single_queries():
+    features = clustered_features()
+    ivf = IVFExampleIndex.build(features, torch.arange(len(features)))
+    queries = torch.randn(20, features.size(1), generator=torch.Generator().manual_seed(3))
+    scores, nodes = ivf.search(queries, 5, nprobe=3)
+    for q in range(len(queries)):
+        single_scores, single_nodes = ivf.search(queries[q:q + 1], 5, nprobe=3)
+        torch.testing.assert_close(scores[q:q + 1], single_scores)
+        assert torch.equal(nodes[q:q + 1], single_nodes)
+
+
+def test_missing_slots_are_padded():
+    features = clustered_features(num_nodes=6)
+    allowed = torch.tensor([True, False, True, False, False, False])
+    ivf = IVFExampleIndex.build(features, torch.arange(6), num_lists=2)
+    scores, nodes = ivf.search(features[:3], 4, nprobe=2, allowed=allowed)
+    assert scores.shape == nodes.shape == (3, 4)
+    assert set(nodes[:, :2].flatten().tolist()) == {0, 2}
+    assert (nodes[:, 2:] == -1).all() and torch.isinf(scores[:, 2:]).all()
+    assert ivf.search(features[:0], 4)[1].shape == (0, 4)
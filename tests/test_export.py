@@ -0,0 +1,46 @@
+# tests/test_export.py
+import pytest
+import torch
+
+from export import OUTPUT_NAMES, ProbabilityClassifier, export_onnx, export_torchscript, max_abs_diff
+from model import EdgeFreeTherapeuticClassifier, unfuse_heads
+
+ATOL = 1e-5
+
+
+@pytest.fixture
+def exported(gnn, separate_heads_reference):
+    """
+    The export module built from `gnn`'s weights, the tracing inputs, and a
+    check batch of another size (so dynamic shapes are exercised) with its
+    expected probabilities from the separate-heads reference.
+    """
+    state_dict = gnn.state_dict()
+    classifier = EdgeFreeTherapeuticClassifier.from_gnn_state_dict(state_dict, gnn.heads.head_sizes)
+    module = ProbabilityClassifier(classifier).eval()
+    generator = torch.Generator().manual_seed(1)
+    trace_inputs = {'features': torch.randn(8, 32, generator=generator)}
+    check_features = torch.randn(5, 32, generator=generator)
+    legacy_state = unfuse_heads(state_dict, gnn.heads.head_sizes)
+    expected = separate_heads_reference(legacy_state, check_features, return_logits=False)
+    return module, trace_inputs, check_features, expected
+
+
+def test_torchscript_matches_separate_heads(exported, tmp_path):
+    module, trace_inputs, check_features, expected = exported
+    path = str(tmp_path / 'classifier.pt')
+    export_torchscript(module, trace_inputs, path)
+    with torch.no_grad():
+        actual = torch.jit.load(path)(check_features)
+    assert max_abs_diff(expected, actual) <= ATOL
+
+
+def test_onnx_matches_separate_heads(exported, tmp_path):
+    pytest.importorskip('onnx')
+    onnxruntime = pytest.importorskip('onnxruntime')
+    module, trace_inputs, check_features, expected = exported
+    path = str(tmp_path / 'classifier.onnx')
+    export_onnx(module, trace_inputs, path)
+    session = onnxruntime.InferenceSession(path)
+    actual = session.run(OUTPUT_NAMES, {'features': check_features.numpy()})
+    assert max_abs_diff(expected, actual) <= ATOL
@@ -0,0 +1,83 @@
+# tests/test_model.py
+import torch
+
+from model import (
+    FUSED_HEAD_NAME, HEAD_NAMES, EdgeFreeTherapeuticClassifier, EnhancedTherapeuticGNN, fuse_legacy_heads, unfuse_heads
+)
+
+# The fused matmul may sum in another order than the separate heads did
+ATOL = 1e-6
+
+
+def features(num_inputs: int = 16) -> torch.Tensor:
+    return torch.randn(num_inputs, 32, generator=torch.Generator().manual_seed(1))
+
+
+def assert_close(expected, actual) -> None:
+    for e, a in zip(expected, actual):
+        torch.testing.assert_close(a, e, rtol=0, atol=ATOL)
+
+
+def test_unfuse_heads_splits_into_legacy_layout(gnn):
+    legacy_state = unfuse_heads(gnn.state_dict(), gnn.heads.head_sizes)
+    assert not any(key.startswith(FUSED_HEAD_NAME) for key in legacy_state)
+    assert [legacy_state[f'{head}.weight'].size(0) for head in HEAD_NAMES] == gnn.heads.head_sizes
+
+
+def test_gnn_loads_legacy_state_dict(gnn, separate_heads_reference):
+    legacy_state = unfuse_heads(gnn.state_dict(), gnn.heads.head_sizes)
+    loaded = EnhancedTherapeuticGNN(32, 16, *gnn.heads.head_sizes, num_layers=2).eval()
+    # load_state_dict rewrites the legacy keys in place, keep the original for the reference
+    loaded.load_state_dict(dict(legacy_state))
+    x = features()
+    with torch.no_grad():
+        assert_close(separate_heads_reference(legacy_state, x), loaded(x))
+        # Message passing uses the same loaded weights as the original model
+        edge_index = torch.tensor([[0, 1, 2, 3], [1, 2, 3, 0]])
+        assert_close(gnn(x, edge_index), loaded(x, edge_index))
+
+
+def test_edge_free_classifier_from_legacy_state_dict(gnn, separate_heads_reference):
+    legacy_state = unfuse_heads(gnn.state_dict(), gnn.heads.head_sizes)
+    # A legacy state_dict carries its own head sizes, the default is ignored
+    classifier = EdgeFreeTherapeuticClassifier.from_gnn_state_dict(dict(legacy_state), head_sizes=(1, 1, 1))
+    assert classifier.heads.head_sizes == list(gnn.heads.head_sizes)
+    x = features()
+    with torch.no_grad():
+        assert_close(separate_heads_reference(legacy_state, x), classifier(x))
+        assert_close(
+            separate_heads_reference(legacy_state, x, return_logits=False),
+            classifier(x, return_logits=False)
+        )
+
+
+def test_nested_legacy_state_dict_loads(gnn, separate_heads_reference):
+    class Wrapper(torch.nn.Module):
+        def __init__(self, model: torch.nn.Module):
+            super().__init__()
+            self.gnn = model
+
+    legacy_state = unfuse_heads(gnn.state_dict(), gnn.heads.head_sizes)
+    nested_state = {f'gnn.{key}': value for key, value in legacy_state.items()}
+    wrapper = Wrapper(EnhancedTherapeuticGNN(32, 16, *gnn.heads.head_sizes, num_layers=2).eval())
+    wrapper.load_state_dict(nested_state)
+    x = features()
+    with torch.no_grad():
+        assert_close(separate_heads_reference(legacy_state, x), wrapper.gnn(x))
+
+
+def test_fuse_legacy_heads_with_prefix():
+    legacy_state = {
+        f'outer.{head}.{param}': torch.full((size, 4) if param == 'weight' else (size,), float(i))
+        for i, (head, size) in enumerate(zip(HEAD_NAMES, (3, 2, 7)))
+        for param in ('weight', 'bias')
+    }
+    legacy_state['other.weight'] = torch.zeros(1)
+    fused = fuse_legacy_heads(legacy_state, prefix='outer.')
+    assert set(fused) == {f'outer.{FUSED_HEAD_NAME}.weight', f'outer.{FUSED_HEAD_NAME}.bias', 'other.weight'}
+    assert fused[f'outer.{FUSED_HEAD_NAME}.bias'].tolist() == [0.0] * 3 + [1.0] * 2 + [2.0] * 7
+
+
+def test_fuse_legacy_heads_leaves_fused_state_dict(gnn):
+    state_dict = gnn.state_dict()
+    assert fuse_legacy_heads(dict(state_dict)).keys() == state_dict.keys()
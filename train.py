@@ -2,144 +2,437 @@
 import torch
 import torch.nn.functional as F
 from torch.optim import Adam
-from data_loading import load_data
+from compile_graph import get_split, same_split, update_compiled_graph
+from data_loading import DEFAULT_ENCODER, DEFAULT_SPLIT_SEED
 from model import EnhancedTherapeuticGNN
+from taxonomy import Taxonomy
+import argparse
+import copy
+import os
+import random
 import numpy as np
-from typing import Tuple
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+DEFAULT_STATE_PATH = 'enhanced_therapeutic_gnn.ckpt'
+DEFAULT_MINIBATCH_STATE_PATH = 'enhanced_therapeutic_gnn.minibatch.ckpt'
+
+def _task_loss(logits: torch.Tensor, targets: torch.Tensor) -> torch.Tensor:
+    """Cross-entropy over the rows annotated for this task (target -1 is ignored); 0 if there are none."""
+    targets = targets.long()
+    if not (targets >= 0).any():
+        return logits.sum() * 0.0
+    return F.cross_entropy(logits, targets, ignore_index=-1)
 
 def compute_losses(
     factors_logits: torch.Tensor,
     intervention_concept_logits: torch.Tensor,
     skills_logits: torch.Tensor,
-    labels: torch.Tensor,  # Combined labels
+    labels: torch.Tensor,  # (num_nodes, 3) class indices
     example_indices: torch.Tensor
-) -> Tuple[torch.Tensor, torch.Tensor]:
-    """Compute losses for both tasks"""
-    # print(f"Labels shape: {labels.shape}")
-    # print(f"Factors logits shape: {factors_logits.shape}")
-    # print(f"Skills logits shape: {skills_logits.shape}")
-    # print(f"Example indices shape: {example_indices.shape}")
-    # print(f"labels:\n{labels}")
-    # Assuming labels are combined: first 3 columns for factors (one-hot), next two are the intervention concepts, and next 7 for skills (multi-label)
-    factors_labels = labels[:, :3]  # First 3 columns for factors
-    ic_labels = labels[:, 3:5]     # Next 8 columns for ICs
-    skills_labels = labels[:, 5:]   # Remaining columns for skills
-    
-    # print("Factors labels:", factors_labels)
-    # print("Skills labels:", skills_labels)
-    
-    # print("Factors logits:", factors_logits)
-    # print("factor preds:", factors_logits[example_indices])
-    # print("factor labels in loss", factors_labels[example_indices].argmax(dim=1))
-    
-    factors_loss = F.cross_entropy(
-        factors_logits[example_indices],
-        factors_labels[example_indices].argmax(dim=1)  # Convert one-hot to class index
-    )
-    
-    intervention_concept_loss = F.cross_entropy(
-        intervention_concept_logits[example_indices],
-        ic_labels[example_indices].argmax(dim=1)  # Convert one-hot to class index
-    )
-    
-    # print("Skills logits:", skills_logits)
-    # print("skills_labels:", skills_labels[example_indices])
-    # print("skills labels before loss", skills_labels[example_indices].argmax(dim=1))
-    # print("skills labels in loss", skills_labels[example_indices - 11].argmax(dim=1))
-    # print(f"Skill preds\n{skills_labels[example_indices]}")
-    # print(f"Skill labels\n{skills_labels[example_indices].argmax(dim=1)}")
-    # print(f"Skills logits shape: {skills_logits[example_indices].shape}")
-    # print(f"Skills labels shape: {skills_labels[example_indices].argmax(dim=1).shape}")
-    skills_loss = F.cross_entropy(
-        skills_logits[example_indices],
-        skills_labels[example_indices].argmax(dim=1)  # Convert one-hot to class index
-    )
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Compute the losses of all three tasks.
+    `labels` holds the factor, IC and skill class index of every node in its
+    columns (see TherapeuticDataset._create_labels); rows without an
+    annotation for a task (-1) do not count towards that task's loss.
+    """
+    example_labels = labels[example_indices]
+    factors_loss = _task_loss(factors_logits[example_indices], example_labels[:, 0])
+    intervention_concept_loss = _task_loss(intervention_concept_logits[example_indices], example_labels[:, 1])
+    skills_loss = _task_loss(skills_logits[example_indices], example_labels[:, 2])
     
     return factors_loss, intervention_concept_loss, skills_loss
 
-def train_model(
+def save_checkpoint(state: Dict, path: str) -> None:
+    """torch.save to a temp file and rename, so a crash never leaves a truncated checkpoint."""
+    tmp_path = path + '.tmp'
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, path)
+
+def rng_state() -> Dict:
+    """Every RNG training touches (dropout uses torch's), for bit-identical resumes."""
+    return {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state()
+    }
+
+def set_rng_state(state: Dict) -> None:
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+
+def load_training_state(path: str) -> Dict:
+    # Training states hold Python/numpy RNG objects, so they are not weights_only
+    # loadable; they are only ever read back from our own checkpoints
+    return torch.load(path, map_location='cpu', weights_only=False)
+
+def _fit(
     model: EnhancedTherapeuticGNN,
     data,
     optimizer: torch.optim.Optimizer,
-    epochs: int = 200,
-    task_weights: Tuple[float, float] = (1.0, 1.0)  # Weights for factors and skills losses
+    train_epoch: Callable[[], float],
+    validate: Optional[Callable[[], float]],
+    epochs: int,
+    val_every: int = 1,
+    patience: Optional[int] = None,
+    checkpoint_path: Optional[str] = None,
+    state_path: Optional[str] = None,
+    checkpoint_every: int = 10,
+    resume: bool = False,
+    final_epoch: Optional[int] = None,
+    minibatch: bool = False
 ) -> Tuple[list, list]:
-    """Train the enhanced GNN model"""
+    """
+    The epoch loop shared by train_model and train_model_minibatch: validation
+    schedule, early stopping, best state and the resumable training state.
+    `train_epoch` runs one epoch and returns its training loss, `validate`
+    returns the validation loss (None when there are no validation examples).
+    See train_model for the other arguments.
+    """
+    if val_every < 1:
+        raise ValueError(f"val_every must be >= 1, got {val_every}")
+    if final_epoch is None:
+        final_epoch = epochs
+    
     train_losses = []
     val_losses = []
+    best_val_loss = float('inf')
+    best_epoch = -1
+    best_state = None
+    rounds_without_improvement = 0
+    start_epoch = 0
+    
+    if resume and state_path is not None and os.path.exists(state_path):
+        state = load_training_state(state_path)
+        if state.get('minibatch', False) != minibatch:
+            modes = {False: 'full-batch', True: 'mini-batch'}
+            raise ValueError(
+                f"{state_path} holds a {modes[state.get('minibatch', False)]} training state, "
+                f"it cannot be resumed in {modes[minibatch]} mode"
+            )
+        if not same_split(state['split'], get_split(data)):
+            raise ValueError(
+                f"{state_path} was saved on a different split of the graph (the CSV, split seed or "
+                f"taxonomy changed since), train without --resume to start over"
+            )
+        model.load_state_dict(state['model'])
+        optimizer.load_state_dict(state['optimizer'])
+        set_rng_state(state['rng'])
+        start_epoch = state['epoch']
+        train_losses = state['train_losses']
+        val_losses = state['val_losses']
+        best_val_loss = state['best_val_loss']
+        best_epoch = state['best_epoch']
+        best_state = state['best_state']
+        rounds_without_improvement = state['rounds_without_improvement']
+        if state['stopped_early']:
+            # Early stopping already decided this run is done
+            start_epoch = epochs
+        print(f"Resumed from {state_path} after epoch {state['epoch']:03d}")
     
-    # Get example node indices
-    train_example_indices = data.train_mask.nonzero().squeeze()
-    val_example_indices = data.val_mask.nonzero().squeeze()
+    def save_state(epochs_done: int, stopped_early: bool = False) -> None:
+        save_checkpoint({
+            'epoch': epochs_done,
+            'stopped_early': stopped_early,
+            'minibatch': minibatch,
+            'model': model.state_dict(),
+            'optimizer': optimizer.state_dict(),
+            'train_losses': train_losses,
+            'val_losses': val_losses,
+            'best_val_loss': best_val_loss,
+            'best_epoch': best_epoch,
+            'best_state': best_state,
+            'rounds_without_improvement': rounds_without_improvement,
+            'rng': rng_state(),
+            'split': get_split(data)
+        }, state_path)
     
-    # Check if we have any training and validation examples
-    if train_example_indices.dim() == 0:
-        train_example_indices = train_example_indices.unsqueeze(0)
-    if val_example_indices.dim() == 0:
-        val_example_indices = val_example_indices.unsqueeze(0)
+    for epoch in range(start_epoch, epochs):
+        train_losses.append(train_epoch())
+        
+        if (epoch + 1) % 10 == 0:
+            print(f'Epoch {epoch+1:03d}, Train Loss: {train_losses[-1]:.4f}')
+        
+        # Validation, only every `val_every` epochs: it costs a full forward pass.
+        # The extra round at the end is at `final_epoch`, not at the end of every
+        # (resumed) call, so training in stages validates like one long run
+        if (epoch + 1) % val_every == 0 or epoch + 1 == final_epoch:
+            if validate is None:
+                val_losses.append(0.0)
+            else:
+                val_total_loss = validate()
+                val_losses.append(val_total_loss)
+                
+                if val_total_loss < best_val_loss:
+                    best_val_loss = val_total_loss
+                    best_epoch = epoch + 1
+                    # Cloned, since the live parameters keep changing in place
+                    best_state = copy.deepcopy(model.state_dict())
+                    rounds_without_improvement = 0
+                else:
+                    rounds_without_improvement += 1
+                
+                if patience is not None and rounds_without_improvement >= patience:
+                    print(f'Early stopping at epoch {epoch+1:03d}, best Val Loss: {best_val_loss:.4f} (epoch {best_epoch:03d})')
+                    if state_path is not None:
+                        save_state(epoch + 1, stopped_early=True)
+                    break
         
-    for epoch in range(epochs):
-        # Training
+        if state_path is not None and ((epoch + 1) % checkpoint_every == 0 or epoch + 1 == epochs):
+            save_state(epoch + 1)
+    
+    if best_state is not None:
+        model.load_state_dict(best_state)
+        print(f'Restored best model from epoch {best_epoch:03d} (Val Loss: {best_val_loss:.4f})')
+    if checkpoint_path is not None:
+        save_checkpoint(model.state_dict(), checkpoint_path)
+    
+    return train_losses, val_losses
+
+def train_model(
+    model: EnhancedTherapeuticGNN,
+    data,
+    optimizer: torch.optim.Optimizer,
+    epochs: int = 200,
+    task_weights: Tuple[float, float] = (1.0, 1.0),  # Weights for factors and skills losses
+    val_every: int = 1,
+    patience: Optional[int] = None,
+    checkpoint_path: Optional[str] = None,
+    state_path: Optional[str] = None,
+    checkpoint_every: int = 10,
+    resume: bool = False,
+    final_epoch: Optional[int] = None
+) -> Tuple[list, list]:
+    """
+    Train the enhanced GNN model
+    
+    - Validation runs every `val_every` epochs and after epoch `final_epoch`
+      (default: `epochs`), so val_losses has one entry per validation round,
+      not per epoch. A run trained in stages (resumed with growing `epochs`)
+      passes the epoch it finally ends at, so it validates like one long run.
+    - With `patience`, training stops once the validation loss has not improved
+      for that many consecutive validation rounds.
+    - The best state_dict (lowest validation loss) is kept in memory and loaded
+      back into `model` at the end; with `checkpoint_path` it is also written there.
+    - With `state_path`, the full training state (model, optimizer, epoch,
+      early-stopping bookkeeping, RNG states and the split indices) is written
+      there every `checkpoint_every` epochs and when training ends. With
+      resume=True an existing state is loaded first and training continues
+      from the next epoch (a run that stopped early stays stopped); a state
+      saved on a different split of the graph, or by train_model_minibatch,
+      raises ValueError.
+    """
+    # Example node indices, stored with the split
+    train_example_indices = data.train_idx
+    val_example_indices = data.val_idx
+    
+    if len(train_example_indices) == 0:
+        print("No training examples found!")
+        return [], []
+    
+    def weighted_loss(indices: torch.Tensor) -> torch.Tensor:
+        factors_logits, intervention_concept_logits, skills_logits = model(data.x, data.edge_index)
+        factors_loss, intervention_concept_loss, skills_loss = compute_losses(
+            factors_logits, intervention_concept_logits, skills_logits,
+            data.y,  # Factor, IC and skill class index per node
+            indices
+        )
+        return (
+            task_weights[0] * factors_loss +
+            task_weights[1] * intervention_concept_loss +
+            task_weights[1] * skills_loss
+        )
+    
+    def train_epoch() -> float:
         model.train()
         optimizer.zero_grad()
-        factors_logits, intervention_concept_logits, skills_logits = model(data.x, data.edge_index)
-        
-        # Only compute loss if we have training examples
-        if len(train_example_indices) > 0:
-            factors_loss, intervention_concept_loss, skills_loss = compute_losses(
-                factors_logits, intervention_concept_logits, skills_logits,
-                data.y,  # Using combined labels
-                train_example_indices
-            )
-            
-            # Weighted sum of losses
-            total_loss = (
-                task_weights[0] * factors_loss +
-                task_weights[1] * intervention_concept_loss +
-                task_weights[1] * skills_loss
-            )
-            
-            total_loss.backward()
+        total_loss = weighted_loss(train_example_indices)
+        total_loss.backward()
+        optimizer.step()
+        return total_loss.item()
+    
+    def validate() -> float:
+        model.eval()
+        with torch.no_grad():
+            return weighted_loss(val_example_indices).item()
+    
+    return _fit(
+        model, data, optimizer, train_epoch,
+        validate if len(val_example_indices) > 0 else None,
+        epochs=epochs,
+        val_every=val_every,
+        patience=patience,
+        checkpoint_path=checkpoint_path,
+        state_path=state_path,
+        checkpoint_every=checkpoint_every,
+        resume=resume,
+        final_epoch=final_epoch
+    )
+
+def finetune_on_delta(
+    model: EnhancedTherapeuticGNN,
+    data,
+    optimizer: torch.optim.Optimizer,
+    delta_indices: torch.Tensor,
+    epochs: int = 5,
+    task_weights: Tuple[float, float] = (1.0, 1.0)
+) -> Tuple[list, list]:
+    """
+    Fine-tune an already trained model for a few epochs on newly appended examples.
+    Message passing still runs over the whole graph, but only `delta_indices`
+    (the new training examples) contribute to the loss; validation uses the
+    full validation split, and the best epoch is kept as in train_model.
+    """
+    delta_view = copy.copy(data)
+    delta_view.train_idx = delta_indices
+    return train_model(model, delta_view, optimizer, epochs=epochs, task_weights=task_weights)
+
+def train_model_minibatch(
+    model: EnhancedTherapeuticGNN,
+    data,
+    optimizer: torch.optim.Optimizer,
+    epochs: int = 200,
+    task_weights: Tuple[float, float] = (1.0, 1.0),
+    fanouts: Sequence[int] = (10, 10),
+    batch_size: int = 64,
+    num_workers: int = 0,
+    val_every: int = 1,
+    patience: Optional[int] = None,
+    checkpoint_path: Optional[str] = None,
+    state_path: Optional[str] = None,
+    checkpoint_every: int = 10,
+    resume: bool = False,
+    final_epoch: Optional[int] = None
+) -> Tuple[list, list]:
+    """
+    Train the enhanced GNN on neighbor-sampled mini-batches.
+    
+    Each batch is the sampled computation graph around `batch_size` example
+    seed nodes, with fanouts[i] neighbors sampled per node for GATConv layer i,
+    so memory is bounded by the batch size instead of the graph size.
+    Losses are per-example averages over the epoch. Validation rounds, early
+    stopping, the best state and the resumable training state work as in
+    train_model; a state saved by train_model cannot be resumed here.
+    """
+    # Only the mini-batch path needs the sampler, keep it off the full-batch start-up
+    from torch_geometric.loader import NeighborLoader
+    
+    if len(fanouts) != model.num_layers:
+        raise ValueError(f"Need one fanout per GATConv layer ({model.num_layers}), got {list(fanouts)}")
+    
+    if data.train_mask.sum() == 0:
+        print("No training examples found!")
+        return [], []
+    
+    train_loader = NeighborLoader(
+        data,
+        num_neighbors=list(fanouts),
+        batch_size=batch_size,
+        input_nodes=data.train_mask,
+        shuffle=True,
+        num_workers=num_workers
+    )
+    val_loader = NeighborLoader(
+        data,
+        num_neighbors=list(fanouts),
+        batch_size=batch_size,
+        input_nodes=data.val_mask,
+        num_workers=num_workers
+    )
+    
+    def run_batch(batch) -> torch.Tensor:
+        # Seed nodes come first in every sampled batch
+        seed_indices = torch.arange(batch.batch_size)
+        factors_logits, intervention_concept_logits, skills_logits = model(batch.x, batch.edge_index)
+        factors_loss, intervention_concept_loss, skills_loss = compute_losses(
+            factors_logits, intervention_concept_logits, skills_logits,
+            batch.y,
+            seed_indices
+        )
+        return (
+            task_weights[0] * factors_loss +
+            task_weights[1] * intervention_concept_loss +
+            task_weights[1] * skills_loss
+        )
+    
+    def train_epoch() -> float:
+        model.train()
+        total_loss, num_seen = 0.0, 0
+        for batch in train_loader:
+            optimizer.zero_grad()
+            loss = run_batch(batch)
+            loss.backward()
             optimizer.step()
-            train_losses.append(total_loss.item())
-        else:
-            print("No training examples found!")
-            return [], []
-        
-        # Validation
+            total_loss += loss.item() * batch.batch_size
+            num_seen += batch.batch_size
+        return total_loss / num_seen
+    
+    def validate() -> float:
         model.eval()
+        val_total_loss, val_seen = 0.0, 0
         with torch.no_grad():
-            if len(val_example_indices) > 0:
-                val_factors_logits, val_intervention_concepts_logits, val_skills_logits = model(data.x, data.edge_index)
-                val_factors_loss, val_intervention_concepts_loss, val_skills_loss = compute_losses(
-                    val_factors_logits, val_intervention_concepts_logits, val_skills_logits,
-                    data.y,  # Using combined labels (first three cols are the CFs and the rest are the skills)
-                    val_example_indices
-                )
-                val_total_loss = (
-                    task_weights[0] * val_factors_loss +
-                    task_weights[1] * val_intervention_concepts_loss +
-                    task_weights[1] * val_skills_loss
-                )
-                val_losses.append(val_total_loss.item())
-            else:
-                val_total_loss = torch.tensor(0.0)
-                val_losses.append(0.0)
-        
-        if (epoch + 1) % 10 == 0:
-            print(f'Epoch {epoch+1:03d}, Train Loss: {total_loss:.4f}, Val Loss: {val_total_loss:.4f}')
+            for batch in val_loader:
+                val_total_loss += run_batch(batch).item() * batch.batch_size
+                val_seen += batch.batch_size
+        return val_total_loss / val_seen
     
-    return train_losses, val_losses
+    return _fit(
+        model, data, optimizer, train_epoch,
+        validate if data.val_mask.sum() > 0 else None,
+        epochs=epochs,
+        val_every=val_every,
+        patience=patience,
+        checkpoint_path=checkpoint_path,
+        state_path=state_path,
+        checkpoint_every=checkpoint_every,
+        resume=resume,
+        final_epoch=final_epoch,
+        minibatch=True
+    )
 
 def main():
+    parser = argparse.ArgumentParser(description="Train EnhancedTherapeuticGNN")
+    parser.add_argument('--minibatch', action='store_true', help="Use neighbor-sampled mini-batches")
+    parser.add_argument('--fanouts', type=int, nargs='+', default=[10, 10], help="Neighbors sampled per GATConv layer")
+    parser.add_argument('--batch-size', type=int, default=64, help="Example seed nodes per mini-batch")
+    parser.add_argument('--epochs', type=int, default=300)
+    parser.add_argument('--encoder', default=DEFAULT_ENCODER, help="Text encoder: Hugging Face model name or local directory")
+    parser.add_argument('--split-seed', type=int, default=DEFAULT_SPLIT_SEED, help="Seed of the stratified train/val/test split")
+    parser.add_argument('--taxonomy', default=None, help="Label taxonomy (.json or .cypher), default: the built-in one")
+    parser.add_argument('--val-every', type=int, default=1, help="Validate every N epochs")
+    parser.add_argument('--patience', type=int, default=None, help="Stop after this many validation rounds without improvement")
+    parser.add_argument('--output', default='enhanced_therapeutic_gnn.pth', help="Where to write the trained weights")
+    parser.add_argument(
+        '--state', default=None,
+        help=f"Resumable training state (model, optimizer, epoch, RNG, split), default: {DEFAULT_STATE_PATH} "
+             f"({DEFAULT_MINIBATCH_STATE_PATH} with --minibatch)"
+    )
+    parser.add_argument('--checkpoint-every', type=int, default=10, help="Write the training state every N epochs")
+    parser.add_argument('--resume', action='store_true', help="Continue from --state if it exists")
+    parser.add_argument(
+        '--finetune', action='store_true',
+        help="Merge rows appended to the CSV into the graph and fine-tune --output on them instead of retraining"
+    )
+    parser.add_argument('--finetune-epochs', type=int, default=5)
+    parser.add_argument('--finetune-lr', type=float, default=0.001)
+    args = parser.parse_args()
+    # Mini-batch runs keep their own state, so they never replace a full-batch one
+    state_path = args.state or (DEFAULT_MINIBATCH_STATE_PATH if args.minibatch else DEFAULT_STATE_PATH)
+    
     # Set random seed for reproducibility
     # torch.manual_seed(42)
     
     # Settings for now
     FILEPATH = 'data/htc_examples_ids.csv'
     
-    # Load data
-    data, _ = load_data(FILEPATH)
+    # Load the compiled graph (rebuilt only if the CSV changed, extended if rows were appended)
+    data, new_nodes = update_compiled_graph(
+        FILEPATH,
+        split_seed=args.split_seed,
+        model_name=args.encoder,
+        taxonomy=Taxonomy.load(args.taxonomy) if args.taxonomy else None
+    )
     
     # Print dataset statistics
     n_train = data.train_mask.sum().item()
@@ -152,32 +445,74 @@ def main():
     
     # Check label dimensions
     print(f"Label shape: {data.y.shape}")
+    print(f"Label classes: {data.taxonomy}")
     print(f"Number of features: {data.x.size(1)}")
     
-    # Initialize enhanced model
+    # Initialize enhanced model, one head output per class of the taxonomy
+    num_common_factors, num_intervention_concepts, num_skills = data.taxonomy.label_sizes
     model = EnhancedTherapeuticGNN(
         in_channels=data.x.size(1),
         hidden_channels=64,
-        num_common_factors=3,
-        num_intervention_concepts=2,
-        num_skills=7,
+        num_common_factors=num_common_factors,
+        num_intervention_concepts=num_intervention_concepts,
+        num_skills=num_skills,
         num_layers=2,
         dropout=0.5
     )
     
+    if args.finetune:
+        if new_nodes is None:
+            print("The graph was rebuilt from scratch (not just appended to), train without --finetune")
+            return
+        delta_train = data.train_idx[torch.isin(data.train_idx, new_nodes)]
+        if len(delta_train) == 0:
+            print("No new training examples to fine-tune on")
+            return
+        print(f"Fine-tuning {args.output} on {len(delta_train)} new training examples")
+        model.load_state_dict(torch.load(args.output))
+        optimizer = Adam(model.parameters(), lr=args.finetune_lr, weight_decay=5e-4)
+        finetune_on_delta(model, data, optimizer, delta_train, epochs=args.finetune_epochs)
+        save_checkpoint(model.state_dict(), args.output)
+        if os.path.exists(state_path):
+            # Keep the state on the grown split, so it can still be resumed
+            state = load_training_state(state_path)
+            state['split'] = get_split(data)
+            save_checkpoint(state, state_path)
+        print("Fine-tuning completed!")
+        return
+    
     # Setup optimizer
     optimizer = Adam(model.parameters(), lr=0.01, weight_decay=5e-4)
     
     # Train model only if we have training examples
     if n_train > 0:
-        train_losses, val_losses = train_model(
-            model, data, optimizer,
-            task_weights=(1.0, 1.0),  # Equal weights for both tasks,
-            epochs=300
-        )
+        if args.minibatch:
+            train_losses, val_losses = train_model_minibatch(
+                model, data, optimizer,
+                task_weights=(1.0, 1.0),
+                epochs=args.epochs,
+                fanouts=args.fanouts,
+                batch_size=args.batch_size,
+                val_every=args.val_every,
+                patience=args.patience,
+                state_path=state_path,
+                checkpoint_every=args.checkpoint_every,
+                resume=args.resume
+            )
+        else:
+            train_losses, val_losses = train_model(
+                model, data, optimizer,
+                task_weights=(1.0, 1.0),  # Equal weights for both tasks,
+                epochs=args.epochs,
+                val_every=args.val_every,
+                patience=args.patience,
+                state_path=state_path,
+                checkpoint_every=args.checkpoint_every,
+                resume=args.resume
+            )
         
-        # Save model
-        torch.save(model.state_dict(), 'enhanced_therapeutic_gnn.pth')
+        # Save model (the best one by validation loss)
+        save_checkpoint(model.state_dict(), args.output)
         print("Training completed!")
     else:
         print("Error: No training examples available!")